@@ -1,16 +1,55 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, g
 import os
-import requests
-import json
+import logging
+import uuid
 from dotenv import load_dotenv
 import re
-from flask import Response
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, stream_with_context
+from http_clients import PooledClient
+from work_queue import DurableQueue
+from cache import TTLCache
+from template_registry import TEMPLATE_ACTIONS, TEMPLATE_PARSERS, TemplateVariableError, build_registry, find_triggered, parse_single
+from dedup import create_dedup_store, value_hash
+from rate_limit import SenderRateLimiter, retry_after_seconds
+from sender_pool import SenderPool
+from metrics import MetricsRegistry, default_metrics_dir
+from structured_logging import bind, reset_context, setup_logging
+from broadcast import BroadcastRunner, BroadcastStore, iter_recipients
+from delivery_store import DeliveryStore
+from write_coalescer import PipedriveWriteCoalescer
+from vcard_links import VCardLinks
+from resilience import CircuitBreaker, FailFast, clear_deadline, start_deadline, track_send
+from scheduler import SendScheduler
+from tracing import Tracer
+from reconciler import Reconciler
+from capture import TrafficCapture
+from content_templates import ContentCatalog
+import tracing
+from datetime import datetime, timezone
+import json_codec
 
 DEBUG_MODE = os.getenv("DEBUG_LOGGING", "false").lower() == "true"
 
+# Start of this process's import, for the startup-to-ready time
+STARTUP_STARTED = time.perf_counter()
+
 load_dotenv()
 
+# JSON-lines logs, written by a background thread; "/" and "/health" are sampled
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", "100"))
+log = setup_logging(
+    level=logging.DEBUG if DEBUG_MODE else logging.INFO,
+    secrets=[os.getenv(var) for var in ("TWILIO_AUTH_TOKEN", "PIPEDRIVE_API_KEY", "SEND_QUOTE_API_KEY", "VCARD_TOKEN",
+                                        "BROADCAST_TOKEN", "DELIVERY_TOKEN", "VCARD_SIGNING_KEY")],
+    sample_rates={"/": LOG_SAMPLE_RATE, "/health": LOG_SAMPLE_RATE},
+)
+
 app = Flask(__name__)
+app.json = json_codec.JSONCodecProvider(app)
 
 # Twilio config
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
@@ -18,19 +57,201 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
 SEND_QUOTE_API_KEY = os.getenv("SEND_QUOTE_API_KEY")
 
-print("TWILIO_ACCOUNT_SID:", TWILIO_ACCOUNT_SID)
-print("TWILIO_AUTH_TOKEN:", TWILIO_AUTH_TOKEN)
-print("TWILIO_WHATSAPP_FROM:", TWILIO_WHATSAPP_FROM)
+log.info(
+    "Twilio config",
+    extra={"account_sid": TWILIO_ACCOUNT_SID, "auth_token_set": bool(TWILIO_AUTH_TOKEN), "whatsapp_from": TWILIO_WHATSAPP_FROM},
+)
 
 # Check for required environment variables
 required_vars = ["PIPEDRIVE_API_KEY", "SEND_QUOTE_API_KEY"]
 missing_vars = [var for var in required_vars if not os.getenv(var)]
 if missing_vars:
-    print(f"⚠️ Missing required environment variables: {missing_vars}")
+    log.warning("⚠️ Missing required environment variables: %s", missing_vars)
 else:
-    print("✅ All required environment variables are set")
+    log.info("✅ All required environment variables are set")
+
+# Prometheus metrics, merged across gunicorn workers at scrape time
+metrics = MetricsRegistry(default_metrics_dir())
+metrics.histogram("upstream_request_seconds", "Outbound call latency by call type")
+metrics.counter("upstream_requests_total", "Outbound calls by call type and HTTP status")
+metrics.histogram("http_request_seconds", "Handler duration by route")
+metrics.counter("http_requests_total", "Handled requests by route and status")
+metrics.gauge("http_requests_in_flight", "Requests currently being handled, by route")
+metrics.counter("template_sends_total", "Triggered template sends by template")
+metrics.counter("template_results_total", "Template send outcomes by template and status")
+metrics.counter("deferred_jobs_total", "Work handed to the deferred retry queue, by kind")
+metrics.counter("sender_failovers_total", "Sends moved to another pool sender after a sender-caused rejection")
+metrics.histogram("worker_startup_seconds", "Import to ready (upstream connections warm), per worker")
+metrics.histogram("worker_drain_seconds", "Time to finish in-flight background jobs on shutdown, per worker")
+
+def observe_upstream(call, seconds, status):
+    metrics.observe("upstream_request_seconds", seconds, call=call)
+    metrics.inc("upstream_requests_total", call=call, status=str(status))
+    tracing.record_call(call, seconds, status)
+
+# Per-request spans: Server-Timing on every response, slow traces at /debug/traces, optional OTLP/JSON file
+tracer = None
+if os.getenv("TRACING_ENABLED", "true").lower() == "true":
+    tracer = Tracer(
+        "front-twilio-webhook",
+        slow_ms=float(os.getenv("TRACE_SLOW_MS", "250")),
+        ring_size=int(os.getenv("TRACE_RING_SIZE", "100")),
+        export_path=os.getenv("TRACE_EXPORT_PATH"),
+    )
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+# Opt-in capture of sanitized webhook traffic for bench/replay.py; set CAPTURE_DIR to enable
+traffic_capture = None
+if os.getenv("CAPTURE_DIR"):
+    traffic_capture = TrafficCapture(
+        os.getenv("CAPTURE_DIR"),
+        os.getenv("CAPTURE_ROUTES", "/pipedrive-webhook,/front-webhook,/webhook").split(","),
+        sample_rate=float(os.getenv("CAPTURE_SAMPLE_RATE", "1")),
+        key=os.getenv("CAPTURE_KEY"),
+        max_records=int(os.getenv("CAPTURE_MAX_RECORDS", "100000")),
+    )
+
+# Total time budget for one inbound request, shared by its upstream calls (under gunicorn's 30s timeout)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
 
-print("🚀 Application initialization complete")
+def make_breaker(name):
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+    )
+
+# Shared upstream clients: one keep-alive pool per host, with default timeouts
+TWILIO_MESSAGES_PATH = f"/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+
+twilio_client = PooledClient(
+    "twilio",
+    os.getenv("TWILIO_API_BASE", "https://api.twilio.com"),
+    pool_maxsize=int(os.getenv("TWILIO_POOL_SIZE", "20")),
+    timeout=(3.05, 20),
+    auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+    observer=observe_upstream,
+    breaker=make_breaker("twilio"),
+)
+pipedrive_client = PooledClient(
+    "pipedrive",
+    os.getenv("PIPEDRIVE_API_BASE", "https://api.pipedrive.com"),
+    pool_maxsize=int(os.getenv("PIPEDRIVE_POOL_SIZE", "20")),
+    timeout=(3.05, 20),
+    params={"api_token": os.getenv("PIPEDRIVE_API_KEY")},
+    observer=observe_upstream,
+    breaker=make_breaker("pipedrive"),
+)
+quote_client = PooledClient(
+    "quote",
+    os.getenv("QUOTE_API_BASE", "https://quote-production-f1f1.up.railway.app"),
+    pool_maxsize=int(os.getenv("QUOTE_POOL_SIZE", "5")),
+    timeout=(3.05, 30),
+    headers={"X-API-KEY": SEND_QUOTE_API_KEY or ""},
+    observer=observe_upstream,
+    breaker=make_breaker("quote"),
+)
+twilio_content_client = PooledClient(
+    "twilio_content",
+    os.getenv("TWILIO_CONTENT_API_BASE", "https://content.twilio.com"),
+    pool_maxsize=2,
+    timeout=(3.05, 20),
+    auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+    observer=observe_upstream,
+    breaker=make_breaker("twilio_content"),
+)
+UPSTREAM_CLIENTS = [twilio_client, pipedrive_client, quote_client, twilio_content_client]
+
+# Per-sender (From number) pacing of Twilio sends; set TWILIO_RATE_LIMIT_PATH to share it across workers
+send_rate_limiter = SenderRateLimiter(
+    rate=float(os.getenv("TWILIO_SEND_RATE", "10")),
+    burst=int(os.getenv("TWILIO_SEND_BURST", "10")),
+    path=os.getenv("TWILIO_RATE_LIMIT_PATH"),
+)
+TWILIO_429_RETRIES = int(os.getenv("TWILIO_429_RETRIES", "3"))
+
+# WhatsApp senders: TWILIO_WHATSAPP_FROM_POOL (comma-separated) spreads recipients over several numbers
+sender_pool = SenderPool(
+    (os.getenv("TWILIO_WHATSAPP_FROM_POOL") or TWILIO_WHATSAPP_FROM or "").split(","),
+    failure_threshold=int(os.getenv("SENDER_FAILURE_THRESHOLD", "3")),
+    cooldown=float(os.getenv("SENDER_COOLDOWN_SECONDS", "60")),
+)
+SENDER_FAILOVER_ATTEMPTS = int(os.getenv("SENDER_FAILOVER_ATTEMPTS", "2"))
+NO_SENDER_ERROR = "No WhatsApp sender configured (set TWILIO_WHATSAPP_FROM or TWILIO_WHATSAPP_FROM_POOL)"
+
+# Queue mode: /pipedrive-webhook acks immediately and a durable local queue does the work
+PIPEDRIVE_QUEUE_MODE = os.getenv("PIPEDRIVE_QUEUE_MODE", "false").lower() == "true"
+pipedrive_queue = None
+
+# Work that failed fast (open breaker, spent deadline) is retried from here with backoff
+DEFERRED_MAX_ATTEMPTS = int(os.getenv("DEFERRED_MAX_ATTEMPTS", "10"))
+deferred_queue = DurableQueue(
+    os.getenv("DEFERRED_QUEUE_PATH", "deferred.db"),
+    workers=int(os.getenv("DEFERRED_QUEUE_WORKERS", "1")),
+    max_attempts=DEFERRED_MAX_ATTEMPTS,
+)
+
+# Pipedrive person records, shared by the webhook and /vcard paths. They're read for the
+# phone and the vCard only, so just changes to these fields make a cached copy stale
+# (template field clears and unrelated edits don't).
+PERSON_CACHE_FIELDS = ("name", "first_name", "last_name", "phone", "phones", "email", "emails")
+person_cache = TTLCache(
+    maxsize=int(os.getenv("PERSON_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("PERSON_CACHE_TTL", "300")),
+)
+
+# Dedup of webhook retries and echoes: "memory" (per worker) or "sqlite" (shared on the node)
+dedup_store = create_dedup_store(
+    os.getenv("DEDUP_BACKEND", "memory"),
+    os.getenv("DEDUP_PATH", "dedup.db"),
+    ttl=int(os.getenv("DEDUP_TTL", "300")),
+)
+
+# Write-behind for field clears and activities: one PUT per person per flush
+pipedrive_writes = None
+if os.getenv("PIPEDRIVE_WRITE_COALESCE", "true").lower() == "true":
+    pipedrive_writes = PipedriveWriteCoalescer(
+        pipedrive_client,
+        flush_interval=float(os.getenv("PIPEDRIVE_FLUSH_INTERVAL", "0.5")),
+        max_batch=int(os.getenv("PIPEDRIVE_FLUSH_SIZE", "50")),
+        # Opt-in: one activity per person per flush instead of one per template
+        merge_person_activities=os.getenv("PIPEDRIVE_MERGE_ACTIVITIES", "false").lower() == "true",
+    )
+
+# Per-link signed /vcard URLs; the key falls back to VCARD_TOKEN so existing deployments keep working
+vcard_links = VCardLinks(
+    os.getenv("VCARD_SIGNING_KEY") or os.getenv("VCARD_TOKEN") or "",
+    ttl=int(os.getenv("VCARD_URL_TTL", "86400")),
+    cache_size=int(os.getenv("VCARD_CACHE_SIZE", "500")),
+)
+VCARD_ALLOW_STATIC_TOKEN = os.getenv("VCARD_ALLOW_STATIC_TOKEN", "false").lower() == "true"
+
+# Max templates sent in parallel when one webhook triggers several
+TEMPLATE_FANOUT_LIMIT = int(os.getenv("TEMPLATE_FANOUT_LIMIT", "4"))
+
+# Bulk sends: /broadcast is disabled unless BROADCAST_TOKEN is set
+BROADCAST_TOKEN = os.getenv("BROADCAST_TOKEN")
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_ACTIVITY_BATCH = int(os.getenv("BROADCAST_ACTIVITY_BATCH", "50"))
+broadcast_store = BroadcastStore(os.getenv("BROADCAST_PATH", "broadcasts.db")) if BROADCAST_TOKEN else None
+
+# Sent message SIDs and their status callbacks; /deliveries is disabled unless DELIVERY_TOKEN is set
+delivery_store = DeliveryStore(os.getenv("DELIVERY_STORE_PATH", "deliveries.db"))
+DELIVERY_TOKEN = os.getenv("DELIVERY_TOKEN")
+TWILIO_STATUS_CALLBACK_URL = os.getenv("TWILIO_STATUS_CALLBACK_URL")
+
+# Scheduled/delayed sends; /schedule is disabled unless SCHEDULE_TOKEN is set
+SCHEDULE_TOKEN = os.getenv("SCHEDULE_TOKEN")
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+send_scheduler = SendScheduler(
+    os.getenv("SCHEDULE_PATH", "schedule.db"),
+    lambda send: fire_scheduled_send(send),
+    rate=float(os.getenv("SCHEDULED_SEND_RATE", "2")),
+    poll_interval=float(os.getenv("SCHEDULER_POLL_INTERVAL", "1")),
+    max_attempts=int(os.getenv("SCHEDULED_SEND_MAX_ATTEMPTS", "5")),
+)
+
+log.info("🚀 Application initialization complete")
 
 # Template-to-ContentSid mapping
 TEMPLATE_CONTENT_MAP = {
@@ -130,22 +351,108 @@ TEMPLATE_FIELD_MAP = {
     "new_sar_details": "a016c308b19c9939fbdbba32c75d1ff9ed2f385a"
 }
 
-def send_sms(to_number, message_body):
-    sanitized_number = sanitize_number(to_number)
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+# Pipedrive field_id -> TemplateSpec (name, ContentSid, variable parser, action)
+TEMPLATE_INDEX = build_registry(TEMPLATE_CONTENT_MAP, TEMPLATE_FIELD_MAP)
+TEMPLATE_NAMES_BY_SID = {sid: name for name, sid in TEMPLATE_CONTENT_MAP.items()}
+
+def fetch_content_templates():
+    """Every Content API template, following next_page_url."""
+    items, url = [], "/v1/Content?PageSize=500"
+    while url:
+        response = twilio_content_client.get(url, call="twilio_content_list")
+        response.raise_for_status()
+        page = json_codec.loads(response.content)
+        items.extend(page.get("contents") or [])
+        url = (page.get("meta") or {}).get("next_page_url")
+    return items
+
+# Placeholders per ContentSid, for checking variables before a send; CONTENT_VALIDATION=false turns it off
+content_catalog = None
+if os.getenv("CONTENT_VALIDATION", "true").lower() == "true":
+    content_catalog = ContentCatalog(
+        fetch_content_templates if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN else None,
+        snapshot_path=os.getenv("CONTENT_SNAPSHOT_PATH", "content_templates.json"),
+        refresh_interval=float(os.getenv("CONTENT_REFRESH_SECONDS", "3600")),
+    )
 
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    payload = {
-        "To": sanitized_number,           # No "whatsapp:" prefix
+def check_template_variables(content_sid, variables):
+    """Raises TemplateVariableError when Twilio would reject these variables for content_sid."""
+    if content_catalog:
+        content_catalog.check(content_sid, variables)
+
+def post_twilio_message(payload, headers=None):
+    """POSTs to the Messages API, paced per From number, retrying 429s after Retry-After."""
+    sender = payload.get("From")
+    for attempt in range(TWILIO_429_RETRIES + 1):
+        send_rate_limiter.acquire(sender)
+        response = twilio_client.post(TWILIO_MESSAGES_PATH, call="twilio_send", creates=True, headers=headers, data=payload)
+        if response.status_code != 429:
+            return response
+
+        delay = twilio_retry_delay(sender, response, attempt)
+        if delay is not None:
+            time.sleep(delay)
+    return response
+
+def twilio_retry_delay(sender, response, attempt):
+    """Records a Twilio 429; returns the seconds to wait before retrying, or None when out of retries."""
+    retry = attempt < TWILIO_429_RETRIES
+    send_rate_limiter.record_throttled(sender, retry)
+    if not retry:
+        return None
+    delay = retry_after_seconds(response, attempt)
+    log.warning("⏳ Twilio 429, retrying", extra={"sender": sender, "delay": delay})
+    return delay
+
+def twilio_error_code(response):
+    try:
+        return json_codec.loads(response.content).get("code")
+    except (ValueError, AttributeError):
+        return None
+
+def post_whatsapp_message(payload, headers=None):
+    """
+    post_twilio_message from the recipient's pool sender. A send the sender itself
+    caused to be rejected (429, tier limits, disabled number) goes to the next sender
+    on the ring; anything else, including 5xx where the message may exist, does not.
+    """
+    for sender in whatsapp_senders(payload):
+        payload = {**payload, "From": f"whatsapp:{sender}"}
+        response = post_twilio_message(payload, headers=headers)
+        if not sender_failed(sender, response):
+            break
+    return response
+
+def whatsapp_senders(payload):
+    """The pool senders to try, in order, for payload's recipient."""
+    recipient = payload["To"].removeprefix("whatsapp:")
+    senders = sender_pool.route(recipient)[:max(SENDER_FAILOVER_ATTEMPTS, 1)]
+    if not senders:
+        # Callers check sender_pool.numbers first; this keeps a missed check from failing obscurely
+        raise ValueError(NO_SENDER_ERROR)
+    return senders
+
+def sender_failed(sender, response):
+    """Records the send's outcome for sender; True when the sender caused the rejection and the next one should try."""
+    if not sender_pool.record(sender, response.status_code, twilio_error_code(response)):
+        return False
+    metrics.inc("sender_failovers_total", sender=sender)
+    log.warning("🔀 Sender rejected the send, failing over", extra={"sender": sender, "status": response.status_code})
+    return True
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+def sms_payload(to_number, message_body):
+    return {
+        "To": sanitize_number(to_number),      # No "whatsapp:" prefix
         "From": os.getenv("TWILIO_SMS_FROM"),  # Your Twilio SMS number (e.g. +441234567890)
         "Body": message_body
     }
 
-    response = requests.post(
-        url, headers=headers, data=payload, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    )
+def send_sms(to_number, message_body):
+    response = post_twilio_message(sms_payload(to_number, message_body), headers=FORM_HEADERS)
 
-    print(f"Twilio SMS: {response.status_code}")
+    log.info("Twilio SMS", extra={"status": response.status_code})
     return {"status": "success"} if response.status_code == 201 else {"status": "error", "details": response.text}
 
 @app.route("/test-sms", methods=["POST"])
@@ -177,355 +484,671 @@ def build_vcard(person_data: dict) -> str:
     return "\r\n".join(lines) + "\r\n"
 
 
-@app.route("/vcard/<int:person_id>", methods=["GET"])
-def vcard_download(person_id: int):
-    token = request.args.get("token")
-    if not token or token != os.getenv("VCARD_TOKEN"):
-        return jsonify({"status": "forbidden"}), 403
+def fetch_person(person_id, call="pipedrive_person_get"):
+    """Returns the Pipedrive person record, from person_cache when a fresh copy is held."""
+    person = person_cache.get(str(person_id))
+    if person is None:
+        resp = pipedrive_client.get(f"/v1/persons/{person_id}", call=call)
+        person = json_codec.loads(resp.content).get("data")
+        if person:
+            person_cache.set(str(person_id), person)
+    return person
 
-    person_url = f"https://api.pipedrive.com/v1/persons/{person_id}?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-    resp = requests.get(person_url, timeout=20)
-    data = resp.json().get("data")
-    if not data:
-        return jsonify({"status": "not_found"}), 404
 
-    vcf = build_vcard(data)
-    return Response(
-        vcf,
+def person_from_webhook(data):
+    """
+    Builds a person record (same shape as GET /v1/persons) from the webhook body when it
+    already carries a phone number: v1 webhooks send 'current', v2 webhooks send 'data'.
+    """
+    current = data.get("current") or {}
+    body = data.get("data") or {}
+    if current.get("phone"):
+        person = {"id": current.get("id"), "name": current.get("name"), "phone": current.get("phone"), "email": current.get("email")}
+    elif body.get("phones"):
+        person = {"id": body.get("id"), "name": body.get("name"), "phone": body.get("phones"), "email": body.get("emails")}
+    else:
+        return None
+
+    if not person["phone"][0].get("value"):
+        return None
+    person["email"] = person["email"] or []
+    return person
+
+
+def clear_person_field(person_id, field_id):
+    if pipedrive_writes:
+        pipedrive_writes.clear_field(person_id, field_id)
+        return None
+
+    try:
+        clear_resp = pipedrive_client.put(f"/v1/persons/{person_id}", call="pipedrive_field_clear", json={field_id: ""})
+    except FailFast as e:
+        defer("field_clear", person_id, error=e, person_id=person_id, field_id=field_id)
+        return None
+    log.info("🧹 Cleared field", extra={"field_id": field_id, "status": clear_resp.status_code})
+    return clear_resp
+
+
+def vcard_link_authorized(person_id, args):
+    """A signed, unexpired link; the old static ?token= only with VCARD_ALLOW_STATIC_TOKEN."""
+    if vcard_links.key and vcard_links.verify(person_id, args):
+        return True
+    token = args.get("token")
+    return VCARD_ALLOW_STATIC_TOKEN and bool(token) and token == os.getenv("VCARD_TOKEN")
+
+def vcard_response(rendered, person_id, response_class=Response):
+    response = response_class(
+        rendered.body,
         mimetype="text/vcard",
         headers={"Content-Disposition": f'attachment; filename="pipedrive_{person_id}.vcf"'}
     )
+    response.set_etag(rendered.version)
+    response.last_modified = rendered.last_modified
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response
 
+@app.route("/vcard/<int:person_id>", methods=["GET"])
+def vcard_download(person_id: int):
+    if not vcard_link_authorized(person_id, request.args):
+        return jsonify({"status": "forbidden"}), 403
 
-def send_whatsapp_contact(to_number: str, person_id: int, person_data: dict):
-    """
-    Sends a .vcf contact card via Twilio WhatsApp by attaching a MediaUrl that points to our /vcard endpoint.
-    """
-    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM]):
-        return {"status": "error", "details": "Missing Twilio credentials"}
+    # Twilio fetches the same link repeatedly; the card rendered at send time is served from memory
+    rendered = vcard_links.cached(person_id, request.args.get("v"))
+    if rendered is None:
+        data = fetch_person(person_id, call="vcard_person_get")
+        if not data:
+            return jsonify({"status": "not_found"}), 404
+        rendered = vcard_links.render(person_id, data, build_vcard)
+
+    return vcard_response(rendered, person_id).make_conditional(request)
+
+
+def whatsapp_contact_payload(to_number: str, person_id: int, person_data: dict):
+    """Returns (payload, None), or (None, error result) when the vCard can't be sent."""
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, sender_pool.numbers]):
+        return None, {"status": "error", "details": "Missing Twilio credentials"}
 
     base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
-    token = os.getenv("VCARD_TOKEN")
-    if not base_url or not token:
-        return {"status": "error", "details": "Missing PUBLIC_BASE_URL or VCARD_TOKEN env vars"}
+    if not base_url or not vcard_links.key:
+        return None, {"status": "error", "details": "Missing PUBLIC_BASE_URL or VCARD_SIGNING_KEY/VCARD_TOKEN env vars"}
 
     sanitized_to = sanitize_number(to_number)
 
-    # Twilio will fetch this URL to attach the vCard as media
-    media_url = f"{base_url}/vcard/{person_id}?token={token}"
+    # Twilio will fetch this URL to attach the vCard as media; the card is rendered now
+    # so that fetch (and its retries) is answered from the cache
+    rendered = vcard_links.render(person_id, person_data, build_vcard)
+    media_url = f"{base_url}/vcard/{person_id}?{vcard_links.query(person_id, rendered.version)}"
 
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
     payload = {
         "To": f"whatsapp:{sanitized_to}",
-        "From": f"whatsapp:{TWILIO_WHATSAPP_FROM}",
+        "From": f"whatsapp:{sender_pool.sender_for(sanitized_to)}",
         "Body": f"Contact card: {person_data.get('name','')}".strip(),
         "MediaUrl": media_url
     }
+    return payload, None
 
-    response = requests.post(url, data=payload, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=20)
-    print(f"Twilio vCard: {response.status_code}")
+def send_whatsapp_contact(to_number: str, person_id: int, person_data: dict):
+    """
+    Sends a .vcf contact card via Twilio WhatsApp by attaching a MediaUrl that points to our /vcard endpoint.
+    """
+    payload, error = whatsapp_contact_payload(to_number, person_id, person_data)
+    if error:
+        return error
+
+    return contact_send_result(post_whatsapp_message(payload))
 
+def contact_send_result(response):
+    log.info("Twilio vCard", extra={"status": response.status_code})
     if response.status_code in (200, 201):
         return {"status": "success"}
     return {"status": "error", "details": response.text}
 
 
 
+@app.before_request
+def start_request_metrics():
+    reset_context(request_id=request.headers.get("X-Request-Id") or uuid.uuid4().hex, route=request.url_rule.rule if request.url_rule else None)
+    g.request_started = time.perf_counter()
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.inc("http_requests_in_flight", route=g.metrics_route)
+    start_deadline(REQUEST_DEADLINE_SECONDS)
+    if tracer:
+        trace = tracer.start(f"{request.method} {g.metrics_route}", **{"http.method": request.method})
+        bind(trace_id=trace.trace_id)
+
+@app.after_request
+def record_request_metrics(response):
+    if "metrics_route" in g:
+        labels = {"route": g.metrics_route, "method": request.method}
+        metrics.observe("http_request_seconds", time.perf_counter() - g.request_started, **labels)
+        metrics.inc("http_requests_total", status=str(response.status_code), **labels)
+    if tracer:
+        trace = tracer.finish(status_code=response.status_code)
+        if trace:
+            response.headers["Server-Timing"] = trace.server_timing()
+    if traffic_capture and "metrics_route" in g and traffic_capture.wants(g.metrics_route):
+        if request.is_json:
+            body = request.get_json(silent=True)
+        else:
+            body = request.form.to_dict() if request.form else request.get_data(as_text=True)[:10000]
+        capture_request(request.method, request.mimetype, body, response.status_code)
+    return response
+
+def capture_request(method, mimetype, body, status):
+    duration = time.perf_counter() - g.request_started
+    traffic_capture.record(g.metrics_route, method, mimetype, body, status, duration * 1000, time.time() - duration)
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if "metrics_route" in g:
+        metrics.dec("http_requests_in_flight", route=g.metrics_route)
+
+@app.errorhandler(FailFast)
+def upstream_unavailable(e):
+    return jsonify({"status": "error", "error": str(e)}), 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def debug_authorized(headers, args):
+    token = headers.get("X-Debug-Token") or args.get("token")
+    return bool(DEBUG_TOKEN) and token == DEBUG_TOKEN
+
+@app.route("/debug/traces", methods=["GET"])
+def debug_traces():
+    """Slowest recent requests (over TRACE_SLOW_MS) with their span breakdown, slowest first."""
+    if not debug_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    if not tracer:
+        return jsonify({"status": "disabled"}), 404
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    return jsonify({"slow_ms": tracer.slow_ms, "traces": tracer.slowest(limit)}), 200
+
+@app.route("/debug/traces/<trace_id>", methods=["GET"])
+def debug_trace(trace_id):
+    if not debug_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    trace = tracer.find(trace_id) if tracer else None
+    if not trace:
+        return jsonify({"status": "not_found"}), 404
+    return jsonify(trace), 200
+
 @app.route("/", methods=["GET"])
 def home():
-    print("Health check received")  # Add this line
+    log.info("Health check received")
     return "Webhook server is running", 200
 
 @app.route("/health", methods=["GET"])  # Add this route
 def health():
-    print("Health endpoint hit")
-    return jsonify({"status": "healthy"}), 200
+    log.info("Health endpoint hit")
+    body = health_status()
+    # 503 until warm-up is done and once draining starts, so the router only sends work to ready workers
+    return jsonify(body), 200 if body["status"] == "healthy" else 503
+
+def readiness():
+    if draining.is_set():
+        return "draining"
+    return "healthy" if warmed_up.is_set() else "starting"
+
+def health_status():
+    pools = {client.name: client.pool_stats() for client in UPSTREAM_CLIENTS}
+    body = {"status": readiness(), "http_pools": pools}
+    body["startup"] = startup_stats
+    body["person_cache"] = person_cache.stats()
+    body["vcard_cache"] = vcard_links.cache.stats()
+    body["dedup"] = dedup_store.stats()
+    body["send_rate_limits"] = send_rate_limiter.stats()
+    body["senders"] = sender_pool.stats()
+    body["circuit_breakers"] = {client.name: client.breaker.snapshot() for client in UPSTREAM_CLIENTS}
+    body["deferred"] = deferred_queue.stats()
+    body["deliveries"] = delivery_store.stats()
+    body["scheduled_sends"] = send_scheduler.stats()
+    if reconciler:
+        body["reconcile"] = reconciler.stats()
+    if content_catalog:
+        body["content_templates"] = content_catalog.stats()
+    if traffic_capture:
+        body["capture"] = traffic_capture.stats()
+    if pipedrive_writes:
+        body["pipedrive_writes"] = pipedrive_writes.stats()
+    if pipedrive_queue:
+        body["queue"] = pipedrive_queue.stats()
+    return body
 
 def debug_print(*args, **kwargs):
-    if DEBUG_MODE:
-        print(*args, **kwargs)
+    log.debug(" ".join(str(a) for a in args))
 
 @app.route("/front-webhook", methods=["GET"])
 def verify_webhook():
     return jsonify({"status": "ok"}), 200
 
-def split_pair_to_vars(pair_text: str):
-    """Accepts 'SARGBP', 'sar/gbp', 'SAR GBP' etc. Returns {'1': base, '2': quote, '3': base}."""
-    pair = re.sub(r'[^A-Z]', '', (pair_text or '').upper())
-    if len(pair) != 6:
-        raise ValueError(f"Currency pair must be 6 letters (e.g. SARGBP). Got: {pair_text!r}")
-    base, quote = pair[:3], pair[3:]
-    return {"1": base, "2": quote, "3": base}
+def get_webhook_person_id(data):
+    return (
+        data.get("meta", {}).get("entity_id") or
+        data.get("current", {}).get("id")
+    )
 
 @app.route("/pipedrive-webhook", methods=["POST"])
 def handle_pipedrive_webhook():
     try:
         data = request.get_json()
-        #print("📥 Received PD webhook:", json.dumps(data, indent=2))
+        log.debug("📥 Received PD webhook", extra={"payload": data})
 
-        person_data_raw = data.get("data", {})
-        person_id = (
-            data.get("meta", {}).get("entity_id") or
-            data.get("current", {}).get("id")
-        )
+        if not isinstance(data, dict):
+            return jsonify({"status": "noop", "error": "Invalid payload"}), 200
 
-        if not person_id:
-            print("⚠️ No person_id in webhook meta")
-            return jsonify({"status": "noop", "error": "Missing person_id"}), 200
-
-        # Fetch person from Pipedrive to get phone number
-        person_url = f"https://api.pipedrive.com/v1/persons/{person_id}?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-        resp = requests.get(person_url)
-        person_info = resp.json()
-
-        #print("📦 Full Pipedrive API response:", json.dumps(person_info, indent=2))
-
-        person_data = person_info.get("data")
-        if not person_data:
-            print("⚠️ Person data missing in API response")
-            return jsonify({"status": "noop", "error": "Person not found"}), 200
-
-        # Extract phone
-        phones = person_data.get("phone", [])
-        phone = phones[0]["value"] if phones else None
-        if not phone:
-            print("⚠️ No phone number found in person record")
-            return jsonify({"status": "noop", "error": "No phone number"}), 200
-
-        results = []
-        custom_fields = person_data_raw.get("custom_fields", {})
-
-        for template_name, field_id in TEMPLATE_FIELD_MAP.items():
-            field = custom_fields.get(field_id)
-            field_value = field.get("value") if field else None
-
-            # ✅ Only trigger if current value is not empty and previous value was empty
-            previous_fields = data.get("previous", {}).get("custom_fields", {})
-            previous_value = None
-
-            if previous_fields and field_id in previous_fields:
-                prev_field = previous_fields.get(field_id)
-                if prev_field and isinstance(prev_field, dict):
-                    previous_value = prev_field.get("value")
-            
-            if field_value and not previous_value:
-                print(f"📤 {template_name} → {phone}")
-                content_sid = TEMPLATE_CONTENT_MAP.get(template_name)
-
-                # ✅ Special case: vCard send (no ContentSid)
-                if template_name == "vcard":
-                    # field_value should be the destination number (e.g. your number)
-                    vcard_to = field_value.strip()
-
-                    send_status = send_whatsapp_contact(vcard_to, int(person_id), person_data)
-                    results.append({"template": "vcard", "status": send_status.get("status"), "details": send_status.get("details")})
-
-                    # Clear the field if successful
-                    if send_status.get("status") == "success":
-                        clear_url = f"https://api.pipedrive.com/v1/persons/{person_id}?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-                        clear_payload = {field_id: ""}
-                        clear_resp = requests.put(clear_url, json=clear_payload)
-                        print(f"🧹 Cleared field {field_id}: {clear_resp.status_code}")
+        if PIPEDRIVE_QUEUE_MODE:
+            person_id = get_webhook_person_id(data)
+            if not person_id:
+                log.warning("⚠️ No person_id in webhook meta")
+                return jsonify({"status": "noop", "error": "Missing person_id"}), 200
 
-                    continue
+            # Jobs are keyed on person_id so updates for one person run in order
+            job_id = pipedrive_queue.enqueue(person_id, data)
+            return jsonify({"status": "queued", "job_id": job_id}), 200
 
-                if not content_sid:
-                    results.append({"template": template_name, "status": "error", "error": f"No ContentSid found for template '{template_name}'"})
-                    continue
-
-    
-                # ✅ Variable handling logic per template
-                if template_name == "24hrs":
-                    variables = {
-                        "1": field_value.strip()
-                    }
-                elif template_name in ["payment_account", "payment_which", "quote_amount", "feefo_request", "request_settlement_confirmation", "quote_tips", "scio_terms", "scio_and_equals_terms", "1k_reminder", "jumio_ebury", "intro_thanks"]:
-                    # Split into two variables by the first space
-                    parts = field_value.strip().split(" ", 1)
-                    variables = {
-                        "1": parts[0],
-                        "2": parts[1] if len(parts) > 1 else ""
-                    }
-
-                elif template_name == "tips":
-                    # PD field should contain SARGBP (or 'SAR/GBP', 'sar gbp', etc.)
-                    try:
-                        variables = split_pair_to_vars(field_value)
-                    except ValueError as e:
-                        print(f"❌ {e}")
-                        results.append({"template": template_name, "status": "error", "error": str(e)})
-                        continue
-                
-                elif template_name == "new_sar_details":
-                    raw = field_value.strip()
-
-                    if "|" in raw:
-                        tokens = [t.strip() for t in raw.split("|")]
-                    else:
-                        # Fallback: first token = first name, last token = IBAN, middle = full name
-                        tokens_ws = raw.split()
-                        if len(tokens_ws) >= 3:
-                            tokens = [tokens_ws[0], " ".join(tokens_ws[1:-1]), tokens_ws[-1]]
-                        else:
-                            tokens = tokens_ws
-
-                    if len(tokens) < 3:
-                        print(f"❌ Need 3 variables for new_sar_details, got: {tokens}")
-                        results.append({"template": template_name, "status": "error", "error": "Need 3 variables: first_name full_name iban"})
-                        continue
-
-                    first_name, full_name, iban = tokens[0], tokens[1], tokens[2]
-
-                    variables = {
-                        "1": first_name,   # e.g. Nick
-                        "2": full_name,    # e.g. Nick Cornford
-                        "3": iban,         # e.g. GB95SPPV23188420383356
-                    }
-                
-                elif template_name == "payment_released_referral":
-                    raw = field_value.strip()
-
-                    # Prefer a strict delimiter if provided; otherwise split on whitespace ONLY
-                    if "|" in raw:
-                        tokens = [t.strip() for t in raw.split("|")]
-                    else:
-                        tokens = raw.split()  # whitespace split (won't split the comma inside 30,001.29)
-
-                    if len(tokens) < 3:
-                        print(f"❌ Need 3 variables for payment_released_referral, got: {tokens}")
-                        results.append({"template": template_name, "status": "error", "error": "Need 3 variables: amount currency pd_id"})
-                        continue
-
-                    amount_raw, currency_raw, pd_id_raw = tokens[0], tokens[1], tokens[2]
-
-                    # Normalise amount: strip currency symbols/spaces, remove thousands commas
-                    amount_norm = re.sub(r'^[£$\u20ac]\s*', '', amount_raw).replace(",", "")
-                    # Optional: validate it's numeric
-                    try:
-                        float(amount_norm)
-                    except ValueError:
-                        print(f"❌ Invalid amount for payment_released_referral: {amount_raw}")
-                        results.append({"template": template_name, "status": "error", "error": "Invalid amount"})
-                        continue
-
-                    # Normalise currency (expect a 3-letter code)
-                    currency = currency_raw.upper()
-
-                    # PD person id should be digits
-                    if not re.fullmatch(r"\d+", pd_id_raw):
-                        print(f"❌ Invalid PD ID for payment_released_referral: {pd_id_raw}")
-                        results.append({"template": template_name, "status": "error", "error": "Invalid PD ID"})
-                        continue
-
-                    variables = {
-                        "1": amount_norm,  # e.g., 30001.29
-                        "2": currency,     # e.g., GBP
-                        "3": pd_id_raw,    # e.g., 9
-                    }
-
-
-                elif template_name.lower() == "quote":
-                    # Special case: send to quote endpoint instead of Twilio
-                    parts = field_value.strip().split(" ", 2)
-                    if len(parts) != 3:
-                        print(f"❌ Invalid Quote field format: {field_value}")
-                        results.append({"template": template_name, "status": "error", "error": "Invalid format"})
-                        continue  # Skip this iteration
-
-                    pair = parts[0]
-                    direction = parts[1]
-                    amount = parts[2].replace(",", "").replace("£", "")  # Strip commas or currency symbols if needed
-                    try:
-                        amount_value = float(amount.replace(",", ""))
-                    except ValueError:
-                        print(f"❌ Invalid amount in Quote field: {amount}")
-                        results.append({"template": template_name, "status": "error", "error": "Invalid amount"})
-                        continue
-
-                    quote_payload = {
-                        "phone": phone,
-                        "pair": pair,
-                        "direction": direction,
-                        "amount": amount_value
-                    }
-
-                    quote_response = requests.post(
-                        "https://quote-production-f1f1.up.railway.app/send_quote",
-                        headers={
-                            "Content-Type": "application/json",
-                            "X-API-KEY": os.getenv("SEND_QUOTE_API_KEY")
-                        },
-                        json=quote_payload
-                    )
-
-                    print(f"Quote API: {quote_response.status_code}")
-
-                    # ✅ Clear the Pipedrive field after quote send, even if no Twilio message
-                    clear_url = f"https://api.pipedrive.com/v1/persons/{person_id}?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-                    clear_payload = {field_id: ""}
-                    clear_resp = requests.put(clear_url, json=clear_payload)
-                    print(f"🧹 Cleared field {field_id}: {clear_resp.status_code}")
-
-                    results.append({"template": template_name, "status": "sent_to_quote_api", "response": quote_response.text})
-                    continue  # Skip Twilio send for Quote
-
-                elif template_name == "auto_exchange":
-                    # Split into three variables by spaces
-                    parts = field_value.strip().split(" ", 2)
-                    variables = {
-                        "1": parts[0],
-                        "2": parts[1] if len(parts) > 1 else "",
-                        "3": parts[2] if len(parts) > 2 else ""
-                    }    
-                
-                else:
-                    variables = {"1": field_value}
-
-                send_status = send_whatsapp_template(phone, content_sid, variables)
-                results.append({"template": template_name, "status": send_status.get("status")})
-
-                # Clear the field if successful
-                if send_status.get("status") == "success":
-                    # Compose the note with variables and full message
-                    note_text = (
-                        f"Variables: {json.dumps(variables, indent=2)}\n\n"
-                        f"Full Message:\n{field_value.strip()}"
-                    )
-                    # ✅ Log Activity in Pipedrive
-                    activity_payload = {
-                        "subject": f"WhatsApp Message Sent: {template_name}",
-                        "done": 1,
-                        "person_id": person_id,
-                        "note": note_text,
-                        "type": "whatsapp"
-                    }
-                    activity_url = f"https://api.pipedrive.com/v1/activities?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-                    activity_resp = requests.post(activity_url, json=activity_payload)
-                    print(f"Activity: {activity_resp.status_code}")
-                    
-                    # Clear the field if successful
-                    clear_url = f"https://api.pipedrive.com/v1/persons/{person_id}?api_token={os.getenv('PIPEDRIVE_API_KEY')}"
-                    clear_payload = {field_id: ""}
-                    clear_resp = requests.put(clear_url, json=clear_payload)
-                    print(f"🧹 Cleared field {field_id}: {clear_resp.status_code}")
-
-        if not results:
-            print("ℹ️ No fields with values found to process")
-            return jsonify({"status": "noop", "message": "No relevant fields found"}), 200
-
-        return jsonify({"status": "done", "results": results}), 200
+        return jsonify(process_pipedrive_event(data)), 200
 
     except Exception as e:
-        print("❌ Exception in PD webhook:", str(e))
+        log.exception("❌ Exception in PD webhook")
         return jsonify({"status": "error", "error": str(e)}), 200
 
+def process_queued_pipedrive_event(data):
+    # Worker threads are reused across jobs, so start each with a fresh log context
+    reset_context(request_id=uuid.uuid4().hex, route="queue")
+    result = process_pipedrive_event(data)
+    log.info("✅ Queued PD event processed", extra={"result": result.get("status")})
+
+def build_activity_payload(template_name, person_id, variables, field_value):
+    # Compose the note with variables and full message
+    note_text = (
+        f"Variables: {json_codec.dumps(variables, indent=True)}\n\n"
+        f"Full Message:\n{field_value.strip()}"
+    )
+    return {
+        "subject": f"WhatsApp Message Sent: {template_name}",
+        "done": 1,
+        "person_id": person_id,
+        "note": note_text,
+        "type": "whatsapp"
+    }
+
+def log_activity(activity_payload):
+    if pipedrive_writes:
+        pipedrive_writes.add_activity(activity_payload)
+        return
+
+    try:
+        activity_resp = pipedrive_client.post("/v1/activities", call="pipedrive_activity_post", creates=True, json=activity_payload)
+    except FailFast as e:
+        defer("activity", activity_payload["person_id"], error=e, payload=activity_payload)
+        return
+    log.info("Activity", extra={"status": activity_resp.status_code})
+
+SENT_STATUSES = ("success", "sent_to_quote_api")
+
+def send_triggered_template(spec, field_value, person_id, person_data, phone):
+    """
+    Sends one triggered template (or its special-case action) and returns its results entry.
+    Never raises, so release_unsent always gets one result per claimed template.
+    """
+    with track_send() as attempt:
+        try:
+            with tracing.span("template", template=spec.name):
+                result = run_template_action(spec, field_value, person_id, person_data, phone)
+        except Exception as e:
+            return template_failure(spec.name, e, attempt)
+    return template_done(spec, person_id, result)
+
+def template_done(spec, person_id, result):
+    if result.get("status") in SENT_STATUSES:
+        # Starts the clock on follow-ups scheduled "N hours after" this template
+        send_scheduler.template_sent(person_id, spec.name)
+    return result
+
+def template_failure(template_name, e, attempt):
+    if isinstance(e, FailFast) and not attempt.may_have_sent:
+        # Nothing went out; the template is retried from the deferred queue
+        log.warning("⏸️ Template deferred: %s", e, extra={"template": template_name})
+        return {"template": template_name, "status": "deferred", "error": str(e)}
+    # e.g. a read timeout on the Twilio POST: the message may exist, so a retry must not resend it
+    log.exception("❌ Template failed", extra={"template": template_name, "replayable": not attempt.may_have_sent})
+    return {"template": template_name, "status": "error", "error": str(e), "replayable": not attempt.may_have_sent}
+
+def run_template_action(spec, field_value, person_id, person_data, phone):
+    template_name, field_id = spec.name, spec.field_id
+    bind(template=template_name)
+    log.info("📤 Sending template", extra={"to": phone})
+
+    # ✅ Special case: vCard send (no ContentSid)
+    if spec.action == "vcard":
+        send_status = send_whatsapp_contact(spec.parser(field_value)["to"], int(person_id), person_data)
+        result = {"template": "vcard", "status": send_status.get("status"), "details": send_status.get("details")}
+
+        # Clear the field if successful
+        if send_status.get("status") == "success":
+            clear_person_field(person_id, field_id)
+
+        return result
+
+    variables, error = template_variables(spec, field_value)
+    if error:
+        return error
+
+    if spec.action == "quote":
+        # Special case: send to quote endpoint instead of Twilio
+        quote_payload = {"phone": phone, **variables}
+        quote_response = quote_client.post("/send_quote", call="quote_api", creates=True, json=quote_payload)
+        log.info("Quote API", extra={"status": quote_response.status_code})
+
+        # ✅ Clear the Pipedrive field after quote send, even if no Twilio message
+        clear_person_field(person_id, field_id)
+        return {"template": template_name, "status": "sent_to_quote_api", "response": quote_response.text}
+
+    send_status = send_whatsapp_template(phone, spec.content_sid, variables)
+    result = {"template": template_name, "status": send_status.get("status")}
+
+    # Clear the field if successful
+    if send_status.get("status") == "success":
+        # ✅ Log Activity in Pipedrive
+        log_activity(build_activity_payload(template_name, person_id, variables, field_value))
+
+        clear_person_field(person_id, field_id)
+
+    return result
+
+def template_variables(spec, field_value):
+    """Returns (ContentVariables, None), or (None, error result) when there's nothing sendable."""
+    if not spec.content_sid:
+        return None, {"template": spec.name, "status": "error", "error": f"No ContentSid found for template '{spec.name}'"}
+
+    # ✅ Variable handling per template comes from its registered parser
+    try:
+        return spec.parser(field_value), None
+    except TemplateVariableError as e:
+        log.warning("❌ Invalid template variables: %s", e)
+        return None, {"template": spec.name, "status": "error", "error": str(e)}
+
+
+def webhook_event_key(data):
+    """v2 webhooks carry a per-event id in meta.id (v1 used meta.id for the object id)."""
+    meta = data.get("meta") or {}
+    if meta.get("id") and "entity_id" in meta:
+        return f"event:{meta['id']}"
+    return None
+
+def template_dedup_key(person_id, field_id, value):
+    return f"send:{person_id}:{field_id}:{value_hash(value)}"
+
+def process_pipedrive_event(data):
+    """Runs the template pipeline for one Pipedrive webhook body and returns the response payload."""
+    person_id = get_webhook_person_id(data)
+
+    if not person_id:
+        log.warning("⚠️ No person_id in webhook meta")
+        return {"status": "noop", "error": "Missing person_id"}
+
+    bind(person_id=person_id)
+    event_key, duplicate = claim_event(data, person_id)
+    if duplicate:
+        return duplicate
+
+    try:
+        return process_person_templates(data, person_id)
+    except Exception:
+        release_event(event_key)
+        raise
+
+def claim_event(data, person_id):
+    """Returns (event key, None), or (None, noop response) for a delivery already taken."""
+    if person_cache_stale(data):
+        person_cache.invalidate(str(person_id))
+
+    # Pipedrive retries deliveries; drop ones we've already taken
+    event_key = webhook_event_key(data)
+    if event_key and not dedup_store.claim(event_key):
+        log.info("🔁 Duplicate delivery", extra={"event": event_key})
+        return None, {"status": "noop", "message": "Duplicate delivery"}
+    return event_key, None
+
+def person_cache_stale(data):
+    """
+    Whether the webhook changed a field the cached person is used for. v1 'previous' is
+    the whole earlier record and v2's holds just the changed fields, so each is compared
+    with the current value. Without a 'previous' (added/deleted events) assume it did.
+    """
+    previous = data.get("previous")
+    if not isinstance(previous, dict):
+        return True
+    current = data.get("current") or data.get("data") or {}
+    return any(field in previous and previous[field] != current.get(field) for field in PERSON_CACHE_FIELDS)
+
+def release_event(event_key):
+    if event_key:
+        dedup_store.release(event_key)
+
+def triggered_templates(data):
+    """
+    ✅ Only trigger if current value is not empty and previous value was empty.
+    'previous' holds just the changed fields, so only those are visited. Echoes of our
+    own field clears (value -> empty) trigger nothing, before any upstream call.
+    """
+    previous = data.get("previous")
+    previous_fields = (previous.get("custom_fields") or {}) if isinstance(previous, dict) else None
+    return find_triggered((data.get("data") or {}).get("custom_fields"), previous_fields, TEMPLATE_INDEX)
+
+def claim_templates(person_id, triggered):
+    """Returns [(spec, value, dedup_key)] for templates not already sent; a retry racing our clear still carries the value we've just sent."""
+    claimed = []
+    for spec, value in triggered:
+        key = template_dedup_key(person_id, spec.field_id, value)
+        if dedup_store.claim(key):
+            claimed.append((spec, value, key))
+        else:
+            log.info("🔁 Skipping duplicate template", extra={"template": spec.name})
+    return claimed
+
+def release_unsent(claimed, response=None):
+    """
+    Lets a later delivery retry the templates that didn't go out. Without per-template
+    results (the person lookup failed or had no phone) none was attempted; with them,
+    a failure that may have reached Twilio keeps its key.
+    """
+    results = (response or {}).get("results")
+    if results is None:
+        results = [{}] * len(claimed)
+    for (_, _, key), result in zip(claimed, results):
+        if result.get("status") not in SENT_STATUSES and result.get("replayable", True):
+            dedup_store.release(key)
+
+def process_person_templates(data, person_id):
+    triggered = triggered_templates(data)
+    if not triggered:
+        log.info("ℹ️ No fields with values found to process")
+        return {"status": "noop", "message": "No relevant fields found"}
+
+    return send_claimed_templates(data, person_id, triggered)
+
+def send_claimed_templates(data, person_id, triggered, attempt=0):
+    claimed = claim_templates(person_id, triggered)
+    if not claimed:
+        return {"status": "noop", "message": "Duplicate delivery"}
+
+    try:
+        response = send_person_templates(data, person_id, [(spec, value) for spec, value, _ in claimed])
+    except FailFast as e:
+        return defer_claimed(data, person_id, claimed, attempt, e)
+    except Exception:
+        # send_triggered_template doesn't raise, so this came before any template was tried
+        release_unsent(claimed)
+        raise
+
+    return settle_claimed(data, person_id, claimed, response, attempt)
+
+def defer_claimed(data, person_id, claimed, attempt, error):
+    # e.g. the person GET hit an open breaker: nothing was sent, retry all of it later
+    release_unsent(claimed)
+    defer_templates(data, person_id, [(spec, value) for spec, value, _ in claimed], attempt, error)
+    return {"status": "deferred", "error": str(error)}
+
+def settle_claimed(data, person_id, claimed, response, attempt=0):
+    """Frees the dedup keys of templates that didn't go out and defers the ones that failed fast."""
+    release_unsent(claimed, response)
+    defer_failed_fast(data, person_id, claimed, response, attempt)
+    return response
+
+def defer_failed_fast(data, person_id, claimed, response, attempt=0):
+    deferred = [
+        ((spec, value), result.get("error")) for (spec, value, _), result in zip(claimed, response.get("results") or [])
+        if result.get("status") == "deferred"
+    ]
+    if deferred:
+        defer_templates(data, person_id, [t for t, _ in deferred], attempt, deferred[0][1])
+
+def defer(kind, key, error=None, delay=0, **payload):
+    job_id = deferred_queue.enqueue(key, {"kind": kind, **payload}, delay=delay)
+    metrics.inc("deferred_jobs_total", kind=kind)
+    log.warning("⏸️ Deferred work", extra={"kind": kind, "job_id": job_id, "error": str(error)})
+    return job_id
+
+def defer_templates(data, person_id, triggered, attempt, error):
+    """Re-queues only the templates that didn't go out, so a retry can't resend the rest."""
+    if attempt >= DEFERRED_MAX_ATTEMPTS:
+        log.error("❌ Giving up on deferred templates", extra={"templates": [spec.name for spec, _ in triggered]})
+        return None
+    return defer(
+        "templates", person_id, error=error, delay=min(5 * 2 ** attempt, 300),
+        person_id=person_id, data=data, fields=[[spec.field_id, value] for spec, value in triggered], attempt=attempt + 1,
+    )
+
+def process_deferred_job(payload):
+    """Deferred-queue handler. Raising FailFast again leaves the job for the queue's own backoff."""
+    reset_context(request_id=uuid.uuid4().hex, route="deferred", kind=payload["kind"])
+    kind = payload["kind"]
+
+    if kind == "templates":
+        bind(person_id=payload["person_id"])
+        triggered = [(TEMPLATE_INDEX[field_id], value) for field_id, value in payload["fields"] if field_id in TEMPLATE_INDEX]
+        result = send_claimed_templates(payload["data"], payload["person_id"], triggered, payload["attempt"])
+    elif kind == "whatsapp_template":
+        with track_send() as attempt:
+            try:
+                result = send_whatsapp_template(payload["to"], payload["content_sid"], payload["variables"])
+            except Exception:
+                if not attempt.may_have_sent:
+                    raise
+                # Completing the job rather than retrying it: Twilio may already have the message
+                log.exception("❌ Deferred send failed after reaching Twilio; not retrying")
+                result = {"status": "error", "replayable": False}
+    elif kind == "activity":
+        with track_send() as attempt:
+            try:
+                resp = pipedrive_client.post("/v1/activities", call="pipedrive_activity_post", creates=True,
+                                             json=payload["payload"])
+            except Exception:
+                if not attempt.may_have_sent:
+                    raise
+                # A second POST would log the activity twice
+                log.exception("❌ Deferred activity failed after reaching Pipedrive; not retrying")
+                return
+        result = {"status": resp.status_code}
+    elif kind == "field_clear":
+        resp = pipedrive_client.put(f"/v1/persons/{payload['person_id']}", call="pipedrive_field_clear",
+                                    json={payload["field_id"]: ""})
+        result = {"status": resp.status_code}
+    else:
+        log.error("❌ Unknown deferred job", extra={"payload": payload})
+        return
+    log.info("✅ Deferred job processed", extra={"result": result.get("status")})
+
+def send_person_templates(data, person_id, triggered):
+    # Reuse the payload's phone when it carries one, otherwise fetch the person from Pipedrive
+    person_data = webhook_person(data, person_id) or fetch_person(person_id)
+    phone, noop = person_recipient(person_data)
+    if noop:
+        return noop
+
+    # Triggered templates run concurrently; map() keeps results in TEMPLATE_FIELD_MAP order
+    if len(triggered) > 1:
+        with ThreadPoolExecutor(max_workers=min(TEMPLATE_FANOUT_LIMIT, len(triggered))) as executor:
+            # Each task runs in its own copy of the log context (request_id, person_id)
+            contexts = [contextvars.copy_context() for _ in triggered]
+            results = list(executor.map(
+                lambda ctx, t: ctx.run(send_triggered_template, *t, person_id, person_data, phone), contexts, triggered
+            ))
+    else:
+        results = [send_triggered_template(*t, person_id, person_data, phone) for t in triggered]
+
+    record_template_results(results)
+    return {"status": "done", "results": results}
+
+def webhook_person(data, person_id):
+    """The person snapshot carried by the webhook (now also cached), or None."""
+    person_data = person_from_webhook(data)
+    if person_data:
+        person_cache.set(str(person_id), person_data)
+    return person_data
+
+def person_recipient(person_data):
+    """Returns (phone, None), or (None, noop response) when there's no one to send to."""
+    if not person_data:
+        log.warning("⚠️ Person data missing in API response")
+        return None, {"status": "noop", "error": "Person not found"}
+
+    phone = person_phone(person_data)
+    if not phone:
+        log.warning("⚠️ No phone number found in person record")
+        return None, {"status": "noop", "error": "No phone number"}
+    return phone, None
+
+def person_phone(person_data):
+    phones = person_data.get("phone", [])
+    return phones[0]["value"] if phones else None
+
+def record_template_results(results):
+    for result in results:
+        metrics.inc("template_sends_total", template=result.get("template"))
+        metrics.inc("template_results_total", template=result.get("template"), status=result.get("status"))
+
 @app.route("/webhook", methods=["POST"])
 def handle_twilio_webhook():
-    print("Received Twilio webhook!")
-    data = request.json or request.form
-    print("Twilio data:", data)
+    # Status callbacks are form-encoded; request.json would reject them with a 415
+    data = request.get_json(silent=True) or request.form
+    log.info("Received Twilio webhook", extra={"message_sid": data.get("MessageSid"), "message_status": data.get("MessageStatus")})
+    log.debug("Twilio data", extra={"payload": dict(data)})
+    delivery_store.record_callback(data)
+    record_sender_callback(data)
     return jsonify({"status": "received"}), 200
 
+def record_sender_callback(data):
+    """Counts sender-caused delivery failures (63xxx) from a status callback toward the sender's cooldown."""
+    status = data.get("MessageStatus") or data.get("SmsStatus")
+    if status not in ("failed", "undelivered") or not data.get("ErrorCode"):
+        return
+    sender = (data.get("From") or "").removeprefix("whatsapp:")
+    if sender_pool.record_delivery_failure(sender, data.get("ErrorCode")):
+        log.warning("🚫 Sender on cooldown after delivery failures", extra={"sender": sender, "error_code": data.get("ErrorCode")})
+
+@app.route("/deliveries", methods=["GET"])
+def deliveries():
+    """Latest sends to ?to=<number> with their delivery status, newest first."""
+    token = request.headers.get("X-Delivery-Token") or request.args.get("token")
+    if not DELIVERY_TOKEN or token != DELIVERY_TOKEN:
+        return jsonify({"status": "forbidden"}), 403
+
+    number = request.args.get("to")
+    if not number:
+        return jsonify({"status": "error", "msg": "Missing 'to'"}), 400
+
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    sends = delivery_store.recent_for_number(sanitize_number(number), limit)
+    if request.args.get("events") == "true":
+        for send in sends:
+            send["events"] = delivery_store.events(send["sid"])
+    return jsonify({"to": sanitize_number(number), "sends": sends}), 200
+
 def sanitize_number(number):
     number = number.strip()
     if number.startswith('+'):
@@ -539,65 +1162,102 @@ def handle_front_webhook():
     try:
         # Accept non-JSON or ping requests
         if not request.is_json:
-            print("Non-JSON request received.")
+            log.info("Non-JSON request received")
             return jsonify({"status": "noop"}), 200
 
         data = request.get_json(force=True, silent=True) or {}
 
         # If this is likely a test ping with no useful fields
         if "body" not in data or "recipient" not in data:
-            print("Front ping received")
-            return jsonify({"status": "noop"}), 200
-
-        print("Front event received")
-
-        comment_body = data.get("body", "")
-        recipient = data.get("recipient", {}).get("handle")
-
-        if not comment_body or not recipient:
-            return jsonify({"status": "noop"}), 200
-
-        parts = comment_body.strip().split(" ", 1)
-        if len(parts) != 2:
+            log.info("Front ping received")
             return jsonify({"status": "noop"}), 200
 
-        template_name, variable_text = parts
-        content_sid = TEMPLATE_CONTENT_MAP.get(template_name)
+        log.info("Front event received")
 
-        if not content_sid:
+        send_args = front_template_send(data)
+        if not send_args:
             return jsonify({"status": "noop"}), 200
 
-        if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM]):
-            print("Missing Twilio credentials. Skipping send.")
-            return jsonify({"status": "noop"}), 200    
-
-        send_status = send_whatsapp_template(recipient, content_sid, {"1": variable_text})
+        try:
+            send_status = send_whatsapp_template(*send_args)
+        except FailFast as e:
+            recipient, content_sid, variables = send_args
+            defer("whatsapp_template", recipient, error=e, to=recipient, content_sid=content_sid, variables=variables)
+            send_status = {"status": "deferred"}
         return jsonify(send_status), 200
 
     except Exception as e:
-        print("Exception in webhook:", str(e))
+        log.exception("Exception in Front webhook")
         return jsonify({"status": "noop", "error": str(e)}), 200
 
-def send_whatsapp_template(to_number, content_sid, variables):
-    sanitized_number = sanitize_number(to_number)
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+def whatsapp_template_payload(to_number, content_sid, variables):
+    sanitized_to = sanitize_number(to_number)
     payload = {
-        "To": f"whatsapp:{sanitized_number}",
-        "From": f"whatsapp:{TWILIO_WHATSAPP_FROM}",
+        "To": f"whatsapp:{sanitized_to}",
+        "From": f"whatsapp:{sender_pool.sender_for(sanitized_to)}",
         "ContentSid": content_sid,
-        "ContentVariables": json.dumps(variables)
+        "ContentVariables": json_codec.dumps(variables)
     }
-    
-    response = requests.post(
-        url, headers=headers, data=payload, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    )
+    if TWILIO_STATUS_CALLBACK_URL:
+        payload["StatusCallback"] = TWILIO_STATUS_CALLBACK_URL
+    return payload
+
+def front_template_send(data):
+    """Parses a Front comment like '<template> <variable>' into send_whatsapp_template args, or None."""
+    comment_body = data.get("body", "")
+    recipient = data.get("recipient", {}).get("handle")
+
+    if not comment_body or not recipient:
+        return None
+
+    parts = comment_body.strip().split(" ", 1)
+    if len(parts) != 2:
+        return None
+
+    template_name, variable_text = parts
+    content_sid = TEMPLATE_CONTENT_MAP.get(template_name)
+
+    if not content_sid:
+        return None
+
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, sender_pool.numbers]):
+        log.warning("Missing Twilio credentials. Skipping send.")
+        return None
+
+    return recipient, content_sid, {"1": variable_text}
+
+def record_template_send(response, to_number, content_sid):
+    """Keeps the MessageSid of an accepted send so status callbacks can be joined to it."""
+    body = json_codec.loads(response.content)
+    delivery_store.record_send(body.get("sid"), sanitize_number(to_number), TEMPLATE_NAMES_BY_SID.get(content_sid), content_sid,
+                               body.get("status") or "queued")
+    return body.get("sid")
+
+def send_whatsapp_template(to_number, content_sid, variables):
+    error = template_send_rejected(content_sid, variables)
+    if error:
+        return error
+
+    response = post_whatsapp_message(whatsapp_template_payload(to_number, content_sid, variables), headers=FORM_HEADERS)
+    return template_send_result(response, to_number, content_sid)
+
+def template_send_rejected(content_sid, variables):
+    """An error result when the send can't go out (no sender, variables Twilio would reject), else None."""
+    if not sender_pool.numbers:
+        log.error("❌ %s", NO_SENDER_ERROR)
+        return {"status": "error", "details": NO_SENDER_ERROR}
+    try:
+        check_template_variables(content_sid, variables)
+    except TemplateVariableError as e:
+        log.warning("⚠️ Template variables rejected", extra={"content_sid": content_sid, "error": str(e)})
+        return {"status": "error", "details": str(e)}
+    return None
 
-    # Single line result instead of multiple prints
-    print(f"Twilio: {response.status_code}")
+def template_send_result(response, to_number, content_sid):
+    log.info("Twilio", extra={"status": response.status_code})
 
     if response.status_code == 201:
+        record_template_send(response, to_number, content_sid)
         return {"status": "success"}
     else:
         return {"status": "error", "details": response.text}
@@ -615,6 +1275,324 @@ def test_send():
     result = send_whatsapp_template(phone, content_sid, {"1": variable_text})
     return jsonify(result), 200
 
+def broadcast_sender(template_name, content_sid):
+    def send(phone, variables):
+        if not sender_pool.numbers:
+            record_template_results([{"template": template_name, "status": "error"}])
+            return False, NO_SENDER_ERROR
+        try:
+            check_template_variables(content_sid, variables)
+        except TemplateVariableError as e:
+            record_template_results([{"template": template_name, "status": "error"}])
+            return False, str(e)
+        response = post_whatsapp_message(whatsapp_template_payload(phone, content_sid, variables), headers=FORM_HEADERS)
+        ok = response.status_code == 201
+        record_template_results([{"template": template_name, "status": "success" if ok else "error"}])
+        return ok, record_template_send(response, phone, content_sid) if ok else response.text[:500]
+    return send
+
+def broadcast_activity_writer(template_name):
+    # Pipedrive has no bulk-create for activities, so a batch goes to the write coalescer
+    # (or back-to-back on the keep-alive session), off the send path
+    def post_activities(batch):
+        for record, variables in batch:
+            field_value = str(record.get("value") or " ".join(variables.values()))
+            try:
+                payload = build_activity_payload(template_name, int(record["person_id"]), variables, field_value)
+                if pipedrive_writes:
+                    pipedrive_writes.add_activity(payload)
+                    continue
+                resp = pipedrive_client.post("/v1/activities", call="pipedrive_activity_post", creates=True, json=payload)
+                if resp.status_code >= 300:
+                    log.warning("⚠️ Broadcast activity failed", extra={"person_id": record["person_id"], "status": resp.status_code})
+            except Exception:
+                log.exception("❌ Broadcast activity failed", extra={"person_id": record["person_id"]})
+    return post_activities
+
+def broadcast_authorized():
+    token = request.headers.get("X-Broadcast-Token") or request.args.get("token")
+    return bool(BROADCAST_TOKEN) and token == BROADCAST_TOKEN
+
+@app.route("/broadcast/<template_name>", methods=["POST"])
+def broadcast(template_name):
+    """
+    Sends template_name to every recipient in a streamed CSV or NDJSON body and
+    streams NDJSON progress back. Pass ?broadcast_id=... to resume an earlier run.
+    """
+    if not broadcast_authorized():
+        return jsonify({"status": "forbidden"}), 403
+
+    # A broadcast streams for minutes; each send still gets its client timeout
+    clear_deadline()
+
+    content_sid = TEMPLATE_CONTENT_MAP.get(template_name)
+    if not content_sid or template_name in TEMPLATE_ACTIONS:
+        return jsonify({"status": "error", "msg": "Unknown template"}), 400
+
+    broadcast_id = request.args.get("broadcast_id") or uuid.uuid4().hex
+    existing = broadcast_store.status(broadcast_id)
+    if existing and existing["template"] != template_name:
+        return jsonify({"status": "error", "msg": f"Broadcast was started with template '{existing['template']}'"}), 409
+
+    fmt = request.args.get("format") or ("csv" if "csv" in (request.content_type or "") else "ndjson")
+    runner = BroadcastRunner(
+        broadcast_store,
+        broadcast_sender(template_name, content_sid),
+        broadcast_activity_writer(template_name),
+        concurrency=BROADCAST_CONCURRENCY,
+        activity_batch=BROADCAST_ACTIVITY_BATCH,
+    )
+    bind(broadcast_id=broadcast_id, template=template_name)
+    log.info("📣 Broadcast started", extra={"format": fmt, "resumed": bool(existing)})
+
+    recipients = iter_recipients(request.stream, fmt)
+    parser = TEMPLATE_PARSERS.get(template_name, parse_single)
+
+    def generate():
+        yield json_codec.dumps({"broadcast_id": broadcast_id, "status": "started", "template": template_name}) + "\n"
+        for progress in runner.run(broadcast_id, template_name, parser, recipients):
+            yield json_codec.dumps(progress) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"X-Broadcast-Id": broadcast_id},
+    )
+
+@app.route("/broadcast/<broadcast_id>", methods=["GET"])
+def broadcast_status(broadcast_id):
+    if not broadcast_authorized():
+        return jsonify({"status": "forbidden"}), 403
+
+    status = broadcast_store.status(broadcast_id)
+    if not status:
+        return jsonify({"status": "not_found"}), 404
+    return jsonify(status), 200
+
+def reconcile_person(person, custom_fields):
+    """Reconciler callback: runs still-populated template fields through the webhook pipeline."""
+    person_id = person.get("id")
+    reset_context(request_id=uuid.uuid4().hex, route="reconcile", person_id=person_id)
+    # Shaped like a v1 webhook so the person (and phone) come from the page, not a GET each
+    data = {"meta": {"entity_id": person_id}, "current": person, "data": {"id": person_id, "custom_fields": custom_fields}}
+    triggered = triggered_templates(data)
+    if not triggered:
+        return False
+
+    log.info("🔎 Reconciling missed templates", extra={"templates": [spec.name for spec, _ in triggered]})
+    response = send_claimed_templates(data, person_id, triggered)
+    return any(r.get("status") in SENT_STATUSES for r in response.get("results") or [])
+
+def fire_scheduled_send(send):
+    """SendScheduler callback: 'retry' only when nothing went out, so a send can't be repeated."""
+    reset_context(request_id=uuid.uuid4().hex, route="scheduled", send_id=send["id"], template=send["template"])
+    content_sid = TEMPLATE_CONTENT_MAP.get(send["template"])
+    if not content_sid:
+        return "failed", "Unknown template"
+
+    person_id = send["person_id"]
+    phone = send["phone"]
+    with track_send() as attempt:
+        try:
+            variables = send["variables"] or TEMPLATE_PARSERS.get(send["template"], parse_single)(send["value"] or "")
+            if not phone:
+                bind(person_id=person_id)
+                person_data = fetch_person(person_id, call="scheduled_person_get")
+                phone = person_phone(person_data) if person_data else None
+                if not phone:
+                    return "failed", "No phone number"
+            send_status = send_whatsapp_template(phone, content_sid, variables)
+        except TemplateVariableError as e:
+            return "failed", str(e)
+        except FailFast as e:
+            return ("failed" if attempt.may_have_sent else "retry"), str(e)
+
+    record_template_results([{"template": send["template"], "status": send_status.get("status")}])
+    if send_status.get("status") != "success":
+        return "failed", (send_status.get("details") or "")[:500]
+
+    if person_id:
+        field_value = send["value"] or " ".join(str(v) for v in variables.values())
+        log_activity(build_activity_payload(send["template"], int(person_id), variables, field_value))
+        send_scheduler.template_sent(person_id, send["template"])
+    return "sent", None
+
+def schedule_authorized(headers, args):
+    token = headers.get("X-Schedule-Token") or args.get("token")
+    return bool(SCHEDULE_TOKEN) and token == SCHEDULE_TOKEN
+
+def parse_send_at(value):
+    """Epoch seconds or ISO-8601; naive times are taken as UTC."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    when = datetime.fromisoformat(str(value).strip())
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def schedule_send(body):
+    """
+    Validates a /schedule body and stores the send; returns (response, status code).
+    {"template", "person_id" | "phone", "variables" | "value",
+     "send_at" | "delay_hours" | "after_template" + "delay_hours", "key"}
+    """
+    template_name = body.get("template")
+    if not TEMPLATE_CONTENT_MAP.get(template_name) or template_name in TEMPLATE_ACTIONS:
+        return {"status": "error", "msg": "Unknown template"}, 400
+    if not body.get("person_id") and not body.get("phone"):
+        return {"status": "error", "msg": "Missing 'person_id' or 'phone'"}, 400
+
+    variables = body.get("variables")
+    try:
+        if isinstance(variables, dict):
+            variables = {str(k): str(v) for k, v in variables.items()}
+            check_template_variables(TEMPLATE_CONTENT_MAP[template_name], variables)
+        elif body.get("value") is not None:
+            variables = None
+            parsed = TEMPLATE_PARSERS.get(template_name, parse_single)(str(body["value"]))
+            check_template_variables(TEMPLATE_CONTENT_MAP[template_name], parsed)
+        else:
+            return {"status": "error", "msg": "Missing 'variables' or 'value'"}, 400
+        due_at = parse_send_at(body["send_at"]) if body.get("send_at") is not None else None
+        delay_seconds = float(body.get("delay_hours") or 0) * 3600
+        send_id, created = send_scheduler.schedule(
+            template_name,
+            due_at=due_at,
+            after_template=body.get("after_template"),
+            delay_seconds=delay_seconds,
+            person_id=body.get("person_id"),
+            phone=sanitize_number(body["phone"]) if body.get("phone") else None,
+            variables=variables,
+            value=str(body["value"]) if body.get("value") is not None else None,
+            key=body.get("key"),
+        )
+    except (TemplateVariableError, ValueError) as e:
+        return {"status": "error", "msg": str(e)}, 400
+
+    log.info("⏰ Send scheduled", extra={"send_id": send_id, "template": template_name, "new": created})
+    return send_scheduler.get(send_id), 201 if created else 200
+
+@app.route("/schedule", methods=["POST"])
+def schedule():
+    if not schedule_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    body, status = schedule_send(request.get_json(silent=True) or {})
+    return jsonify(body), status
+
+@app.route("/schedule/<int:send_id>", methods=["GET", "DELETE"])
+def scheduled_send(send_id):
+    if not schedule_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    if not send_scheduler.get(send_id):
+        return jsonify({"status": "not_found"}), 404
+    if request.method == "DELETE" and not send_scheduler.cancel(send_id):
+        return jsonify({"status": "error", "msg": "Only waiting or pending sends can be canceled"}), 409
+    return jsonify(send_scheduler.get(send_id)), 200
+
+if PIPEDRIVE_QUEUE_MODE:
+    pipedrive_queue = DurableQueue(
+        os.getenv("PIPEDRIVE_QUEUE_PATH", "pipedrive_queue.db"),
+        workers=int(os.getenv("PIPEDRIVE_QUEUE_WORKERS", "4")),
+    )
+    pipedrive_queue.start(process_queued_pipedrive_event)
+
+deferred_queue.start(process_deferred_job)
+if SCHEDULER_ENABLED:
+    send_scheduler.start()
+
+# Missed-webhook reconciliation: off unless RECONCILE_ENABLED, one polling process per node
+reconciler = None
+if os.getenv("RECONCILE_ENABLED", "false").lower() == "true":
+    reconciler = Reconciler(
+        pipedrive_client,
+        os.getenv("RECONCILE_PATH", "reconcile.db"),
+        TEMPLATE_FIELD_MAP.values(),
+        reconcile_person,
+        interval=float(os.getenv("RECONCILE_INTERVAL", "300")),
+        page_size=int(os.getenv("RECONCILE_PAGE_SIZE", "500")),
+        min_age=float(os.getenv("RECONCILE_MIN_AGE", "120")),
+        # Every person with a template field still set, however old; can resend unknown outcomes
+        full_first_pass=os.getenv("RECONCILE_FULL_FIRST_PASS", "false").lower() == "true",
+    )
+    reconciler.start()
+
+# Readiness and shutdown. warm_up runs in the background at import; /health reports "starting"
+# until it's done. gunicorn.conf.py waits for it before a worker accepts requests and calls
+# begin_drain (on SIGTERM) and drain (at worker exit).
+WARM_CONNECTIONS = int(os.getenv("WARM_CONNECTIONS", "2"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+warmed_up = threading.Event()
+draining = threading.Event()
+startup_stats = {"ready_seconds": None, "warm_connections": {}, "drain_seconds": None}
+
+def load_content_catalog():
+    """Loads the content catalog in what's left of WARMUP_TIMEOUT, else from the snapshot, then starts its refresh."""
+    # Loaded before the worker reports ready, so a ContentSid that doesn't exist shows up in the boot log
+    start_deadline(max(STARTUP_STARTED + WARMUP_TIMEOUT - time.perf_counter(), 1))
+    try:
+        source = content_catalog.load()
+    finally:
+        clear_deadline()
+    if source:
+        for name, sid in content_catalog.unknown(TEMPLATE_CONTENT_MAP).items():
+            log.error("❌ Unknown ContentSid in TEMPLATE_CONTENT_MAP", extra={"template": name, "content_sid": sid})
+    else:
+        log.warning("⚠️ No content templates loaded; template variables are not checked before sending")
+    content_catalog.start()
+
+def warm_up():
+    """
+    Opens keep-alive connections to each upstream so the first webhooks skip TCP and TLS setup,
+    and loads the content catalog. The worker reports ready even if either fails.
+    """
+    try:
+        for client in (twilio_client, pipedrive_client, quote_client):
+            startup_stats["warm_connections"][client.name] = client.warm(WARM_CONNECTIONS)
+        if content_catalog:
+            load_content_catalog()
+    except Exception:
+        log.exception("❌ Warm-up failed")
+    finally:
+        seconds = time.perf_counter() - STARTUP_STARTED
+        startup_stats["ready_seconds"] = round(seconds, 3)
+        metrics.observe("worker_startup_seconds", seconds)
+        warmed_up.set()
+        log.info("🔥 Worker ready", extra={"ready_seconds": startup_stats["ready_seconds"],
+                                          "warm_connections": startup_stats["warm_connections"]})
+
+def background_consumers():
+    consumers = {"pipedrive_queue": pipedrive_queue, "deferred_queue": deferred_queue,
+                 "scheduler": send_scheduler, "reconciler": reconciler}
+    return {name: consumer for name, consumer in consumers.items() if consumer}
+
+def begin_drain():
+    """Stops background consumers from claiming new jobs; doesn't block, so it's safe in a signal handler."""
+    draining.set()
+    for consumer in background_consumers().values():
+        consumer.stop(timeout=0)
+
+def drain(timeout):
+    """
+    Waits up to timeout seconds for in-flight queue jobs and scheduled sends to finish.
+    Anything still running stays claimed in its SQLite store and is recovered by the next
+    process; buffered Pipedrive writes, deliveries and logs are flushed by their atexit hooks.
+    """
+    started = time.perf_counter()
+    reset_context(route="shutdown")
+    begin_drain()
+    unfinished = [
+        name for name, consumer in background_consumers().items()
+        if not consumer.stop(timeout=max(started + timeout - time.perf_counter(), 0))
+    ]
+    seconds = time.perf_counter() - started
+    startup_stats["drain_seconds"] = round(seconds, 3)
+    metrics.observe("worker_drain_seconds", seconds)
+    metrics.flush()
+    log.info("🛑 Worker drained", extra={"drain_seconds": startup_stats["drain_seconds"], "unfinished": unfinished})
+    return seconds
+
+threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)  # Set debug=False for production
\ No newline at end of file
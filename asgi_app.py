@@ -0,0 +1,536 @@
+"""
+ASGI serving mode.
+
+Same routes and response shapes as app.py, except /broadcast, but outbound
+calls to Twilio, Pipedrive and the quote API are made on httpx.AsyncClient
+pools, so one worker can hold hundreds of upstream waits at once instead of
+one per sync worker:
+
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:5000
+
+Config, the template registry, person cache, dedup store, rate limiter,
+metrics and logging all come from app.py, which keeps working as the WSGI
+entry point (gunicorn app:app). So does the pipeline's logic: only the calls
+that wait on an upstream are reimplemented here, and app.py's SQLite-backed
+steps are run with asyncio.to_thread.
+
+/broadcast is only served by app.py: BroadcastRunner reads the request body as
+a blocking stream and sends on its own thread pool, so it gains nothing here.
+Run broadcasts against a WSGI deployment.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from quart import Quart, Response, g, jsonify, request
+
+import app as core
+import json_codec
+from http_clients import AsyncPooledClient
+from resilience import FailFast, start_deadline, track_send
+from structured_logging import bind, reset_context
+import tracing
+
+log = core.log
+
+app = Quart(__name__)
+app.json = json_codec.JSONCodecProvider(app)
+
+twilio_client = AsyncPooledClient(
+    "twilio",
+    core.twilio_client.base_url,
+    pool_maxsize=int(os.getenv("TWILIO_ASYNC_POOL_SIZE", "200")),
+    timeout=(3.05, 20),
+    auth=(core.TWILIO_ACCOUNT_SID, core.TWILIO_AUTH_TOKEN),
+    observer=core.observe_upstream,
+    breaker=core.twilio_client.breaker,
+)
+pipedrive_client = AsyncPooledClient(
+    "pipedrive",
+    core.pipedrive_client.base_url,
+    pool_maxsize=int(os.getenv("PIPEDRIVE_ASYNC_POOL_SIZE", "100")),
+    timeout=(3.05, 20),
+    params={"api_token": os.getenv("PIPEDRIVE_API_KEY")},
+    observer=core.observe_upstream,
+    breaker=core.pipedrive_client.breaker,
+)
+quote_client = AsyncPooledClient(
+    "quote",
+    core.quote_client.base_url,
+    pool_maxsize=int(os.getenv("QUOTE_ASYNC_POOL_SIZE", "20")),
+    timeout=(3.05, 30),
+    headers={"X-API-KEY": core.SEND_QUOTE_API_KEY or ""},
+    observer=core.observe_upstream,
+    breaker=core.quote_client.breaker,
+)
+ASYNC_UPSTREAM_CLIENTS = [twilio_client, pipedrive_client, quote_client]
+
+# Importing app warms its requests pools; these are the ones the routes here use
+async_warmed_up = threading.Event()
+
+
+@app.before_serving
+async def warm_upstream_clients():
+    """Opens keep-alive connections on the httpx pools; /health stays 'starting' until done."""
+    try:
+        opened = await asyncio.wait_for(
+            asyncio.gather(*(client.warm(core.WARM_CONNECTIONS) for client in ASYNC_UPSTREAM_CLIENTS)),
+            core.WARMUP_TIMEOUT,
+        )
+        core.startup_stats["async_warm_connections"] = {
+            client.name: count for client, count in zip(ASYNC_UPSTREAM_CLIENTS, opened)
+        }
+    except asyncio.TimeoutError:
+        log.warning("⚠️ Async connection warm-up timed out", extra={"timeout": core.WARMUP_TIMEOUT})
+    finally:
+        async_warmed_up.set()
+        log.info("🔥 Async upstream pools ready", extra={"warm_connections": core.startup_stats.get("async_warm_connections")})
+
+
+def readiness(status):
+    """app.readiness, held at 'starting' until the httpx pools are warm too."""
+    return "starting" if status == "healthy" and not async_warmed_up.is_set() else status
+
+
+@app.after_serving
+async def close_upstream_clients():
+    for client in ASYNC_UPSTREAM_CLIENTS:
+        await client.aclose()
+
+
+# ---------------------------------------------------------------------------
+# Outbound calls
+# ---------------------------------------------------------------------------
+
+async def post_twilio_message(payload, headers=None):
+    """POSTs to the Messages API, paced per From number, retrying 429s after Retry-After."""
+    sender = payload.get("From")
+    for attempt in range(core.TWILIO_429_RETRIES + 1):
+        await core.send_rate_limiter.acquire_async(sender)
+        response = await twilio_client.post(core.TWILIO_MESSAGES_PATH, call="twilio_send", creates=True, headers=headers,
+                                            data=payload)
+        if response.status_code != 429:
+            return response
+
+        delay = core.twilio_retry_delay(sender, response, attempt)
+        if delay is not None:
+            await asyncio.sleep(delay)
+    return response
+
+
+async def post_whatsapp_message(payload, headers=None):
+    """Mirrors app.post_whatsapp_message: fails over along the sender ring on sender-caused rejections."""
+    for sender in core.whatsapp_senders(payload):
+        payload = {**payload, "From": f"whatsapp:{sender}"}
+        response = await post_twilio_message(payload, headers=headers)
+        if not core.sender_failed(sender, response):
+            break
+    return response
+
+
+async def send_sms(to_number, message_body):
+    response = await post_twilio_message(core.sms_payload(to_number, message_body), headers=core.FORM_HEADERS)
+    log.info("Twilio SMS", extra={"status": response.status_code})
+    return {"status": "success"} if response.status_code == 201 else {"status": "error", "details": response.text}
+
+
+async def send_whatsapp_template(to_number, content_sid, variables):
+    error = core.template_send_rejected(content_sid, variables)
+    if error:
+        return error
+    payload = core.whatsapp_template_payload(to_number, content_sid, variables)
+    response = await post_whatsapp_message(payload, headers=core.FORM_HEADERS)
+    return core.template_send_result(response, to_number, content_sid)
+
+
+async def send_whatsapp_contact(to_number, person_id, person_data):
+    payload, error = core.whatsapp_contact_payload(to_number, person_id, person_data)
+    if error:
+        return error
+    return core.contact_send_result(await post_whatsapp_message(payload))
+
+
+async def fetch_person(person_id, call="pipedrive_person_get"):
+    person = core.person_cache.get(str(person_id))
+    if person is None:
+        resp = await pipedrive_client.get(f"/v1/persons/{person_id}", call=call)
+        person = json_codec.loads(resp.content).get("data")
+        if person:
+            core.person_cache.set(str(person_id), person)
+    return person
+
+
+async def clear_person_field(person_id, field_id):
+    if core.pipedrive_writes:
+        core.pipedrive_writes.clear_field(person_id, field_id)
+        return None
+
+    try:
+        clear_resp = await pipedrive_client.put(f"/v1/persons/{person_id}", call="pipedrive_field_clear", json={field_id: ""})
+    except FailFast as e:
+        await asyncio.to_thread(core.defer, "field_clear", person_id, error=e, person_id=person_id, field_id=field_id)
+        return None
+    log.info("🧹 Cleared field", extra={"field_id": field_id, "status": clear_resp.status_code})
+    return clear_resp
+
+
+async def log_activity(activity_payload):
+    if core.pipedrive_writes:
+        core.pipedrive_writes.add_activity(activity_payload)
+        return
+
+    try:
+        activity_resp = await pipedrive_client.post("/v1/activities", call="pipedrive_activity_post", creates=True,
+                                                     json=activity_payload)
+    except FailFast as e:
+        await asyncio.to_thread(core.defer, "activity", activity_payload["person_id"], error=e, payload=activity_payload)
+        return
+    log.info("Activity", extra={"status": activity_resp.status_code})
+
+
+# ---------------------------------------------------------------------------
+# Pipedrive template pipeline: app.py's control flow with async upstream calls.
+# The decisions and the SQLite-backed steps (dedup claims, deferrals, follow-up
+# arming) are app.py's own functions; the SQLite ones run on worker threads so
+# a busy database never stalls the event loop.
+# ---------------------------------------------------------------------------
+
+async def send_triggered_template(spec, field_value, person_id, person_data, phone):
+    with track_send() as attempt:
+        try:
+            with tracing.span("template", template=spec.name):
+                result = await run_template_action(spec, field_value, person_id, person_data, phone)
+        except Exception as e:
+            return core.template_failure(spec.name, e, attempt)
+    return await asyncio.to_thread(core.template_done, spec, person_id, result)
+
+
+async def run_template_action(spec, field_value, person_id, person_data, phone):
+    template_name, field_id = spec.name, spec.field_id
+    bind(template=template_name)
+    log.info("📤 Sending template", extra={"to": phone})
+
+    if spec.action == "vcard":
+        send_status = await send_whatsapp_contact(spec.parser(field_value)["to"], int(person_id), person_data)
+        result = {"template": "vcard", "status": send_status.get("status"), "details": send_status.get("details")}
+        if send_status.get("status") == "success":
+            await clear_person_field(person_id, field_id)
+        return result
+
+    variables, error = core.template_variables(spec, field_value)
+    if error:
+        return error
+
+    if spec.action == "quote":
+        quote_response = await quote_client.post("/send_quote", call="quote_api", creates=True,
+                                                 json={"phone": phone, **variables})
+        log.info("Quote API", extra={"status": quote_response.status_code})
+        await clear_person_field(person_id, field_id)
+        return {"template": template_name, "status": "sent_to_quote_api", "response": quote_response.text}
+
+    send_status = await send_whatsapp_template(phone, spec.content_sid, variables)
+    result = {"template": template_name, "status": send_status.get("status")}
+
+    if send_status.get("status") == "success":
+        await log_activity(core.build_activity_payload(template_name, person_id, variables, field_value))
+        await clear_person_field(person_id, field_id)
+
+    return result
+
+
+async def send_person_templates(data, person_id, triggered):
+    person_data = core.webhook_person(data, person_id) or await fetch_person(person_id)
+    phone, noop = core.person_recipient(person_data)
+    if noop:
+        return noop
+
+    # Bounded concurrency; gather() keeps results in TEMPLATE_FIELD_MAP order and runs
+    # each task in its own copy of the log context
+    limit = asyncio.Semaphore(core.TEMPLATE_FANOUT_LIMIT)
+
+    async def send(spec, value):
+        async with limit:
+            return await send_triggered_template(spec, value, person_id, person_data, phone)
+
+    results = list(await asyncio.gather(*(send(spec, value) for spec, value in triggered)))
+    core.record_template_results(results)
+    return {"status": "done", "results": results}
+
+
+async def process_person_templates(data, person_id):
+    triggered = core.triggered_templates(data)
+    if not triggered:
+        log.info("ℹ️ No fields with values found to process")
+        return {"status": "noop", "message": "No relevant fields found"}
+
+    claimed = await asyncio.to_thread(core.claim_templates, person_id, triggered)
+    if not claimed:
+        return {"status": "noop", "message": "Duplicate delivery"}
+
+    try:
+        response = await send_person_templates(data, person_id, [(spec, value) for spec, value, _ in claimed])
+    except FailFast as e:
+        return await asyncio.to_thread(core.defer_claimed, data, person_id, claimed, 0, e)
+    except Exception:
+        # send_triggered_template doesn't raise, so this came before any template was tried
+        await asyncio.to_thread(core.release_unsent, claimed)
+        raise
+
+    return await asyncio.to_thread(core.settle_claimed, data, person_id, claimed, response)
+
+
+async def process_pipedrive_event(data):
+    person_id = core.get_webhook_person_id(data)
+    if not person_id:
+        log.warning("⚠️ No person_id in webhook meta")
+        return {"status": "noop", "error": "Missing person_id"}
+
+    bind(person_id=person_id)
+    event_key, duplicate = await asyncio.to_thread(core.claim_event, data, person_id)
+    if duplicate:
+        return duplicate
+
+    try:
+        return await process_person_templates(data, person_id)
+    except Exception:
+        await asyncio.to_thread(core.release_event, event_key)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Request hooks and routes
+# ---------------------------------------------------------------------------
+
+@app.before_request
+async def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule else None
+    reset_context(request_id=request.headers.get("X-Request-Id") or uuid.uuid4().hex, route=route)
+    g.request_started = time.perf_counter()
+    g.metrics_route = route or "unmatched"
+    core.metrics.inc("http_requests_in_flight", route=g.metrics_route)
+    start_deadline(core.REQUEST_DEADLINE_SECONDS)
+    if core.tracer:
+        trace = core.tracer.start(f"{request.method} {g.metrics_route}", **{"http.method": request.method})
+        bind(trace_id=trace.trace_id)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    if "metrics_route" in g:
+        labels = {"route": g.metrics_route, "method": request.method}
+        core.metrics.observe("http_request_seconds", time.perf_counter() - g.request_started, **labels)
+        core.metrics.inc("http_requests_total", status=str(response.status_code), **labels)
+    if core.tracer:
+        trace = core.tracer.finish(status_code=response.status_code)
+        if trace:
+            response.headers["Server-Timing"] = trace.server_timing()
+    if core.traffic_capture and "metrics_route" in g and core.traffic_capture.wants(g.metrics_route):
+        if request.is_json:
+            body = await request.get_json(silent=True)
+        else:
+            form = await request.form
+            body = form.to_dict() if form else (await request.get_data(as_text=True))[:10000]
+        core.capture_request(request.method, request.mimetype, body, response.status_code)
+    return response
+
+
+@app.teardown_request
+async def finish_request_metrics(exc):
+    if "metrics_route" in g:
+        core.metrics.dec("http_requests_in_flight", route=g.metrics_route)
+
+
+@app.errorhandler(FailFast)
+async def upstream_unavailable(e):
+    return jsonify({"status": "error", "error": str(e)}), 503
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(core.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/debug/traces", methods=["GET"])
+async def debug_traces():
+    if not core.debug_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    if not core.tracer:
+        return jsonify({"status": "disabled"}), 404
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    return jsonify({"slow_ms": core.tracer.slow_ms, "traces": core.tracer.slowest(limit)}), 200
+
+
+@app.route("/debug/traces/<trace_id>", methods=["GET"])
+async def debug_trace(trace_id):
+    if not core.debug_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    trace = core.tracer.find(trace_id) if core.tracer else None
+    if not trace:
+        return jsonify({"status": "not_found"}), 404
+    return jsonify(trace), 200
+
+
+@app.route("/", methods=["GET"])
+async def home():
+    log.info("Health check received")
+    return "Webhook server is running", 200
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    log.info("Health endpoint hit")
+    body = await asyncio.to_thread(core.health_status)
+    body["async_http_pools"] = {client.name: client.pool_stats() for client in ASYNC_UPSTREAM_CLIENTS}
+    body["status"] = readiness(body["status"])
+    return jsonify(body), 200 if body["status"] == "healthy" else 503
+
+
+@app.route("/front-webhook", methods=["GET"])
+async def verify_webhook():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/front-webhook", methods=["POST"])
+async def handle_front_webhook():
+    try:
+        if not request.is_json:
+            log.info("Non-JSON request received")
+            return jsonify({"status": "noop"}), 200
+
+        data = await request.get_json(force=True, silent=True) or {}
+
+        if "body" not in data or "recipient" not in data:
+            log.info("Front ping received")
+            return jsonify({"status": "noop"}), 200
+
+        log.info("Front event received")
+
+        send_args = core.front_template_send(data)
+        if not send_args:
+            return jsonify({"status": "noop"}), 200
+
+        try:
+            send_status = await send_whatsapp_template(*send_args)
+        except FailFast as e:
+            recipient, content_sid, variables = send_args
+            await asyncio.to_thread(core.defer, "whatsapp_template", recipient, error=e, to=recipient,
+                                    content_sid=content_sid, variables=variables)
+            send_status = {"status": "deferred"}
+        return jsonify(send_status), 200
+
+    except Exception as e:
+        log.exception("Exception in Front webhook")
+        return jsonify({"status": "noop", "error": str(e)}), 200
+
+
+@app.route("/pipedrive-webhook", methods=["POST"])
+async def handle_pipedrive_webhook():
+    try:
+        data = await request.get_json()
+        log.debug("📥 Received PD webhook", extra={"payload": data})
+
+        if not isinstance(data, dict):
+            return jsonify({"status": "noop", "error": "Invalid payload"}), 200
+
+        if core.PIPEDRIVE_QUEUE_MODE:
+            person_id = core.get_webhook_person_id(data)
+            if not person_id:
+                log.warning("⚠️ No person_id in webhook meta")
+                return jsonify({"status": "noop", "error": "Missing person_id"}), 200
+
+            job_id = await asyncio.to_thread(core.pipedrive_queue.enqueue, person_id, data)
+            return jsonify({"status": "queued", "job_id": job_id}), 200
+
+        return jsonify(await process_pipedrive_event(data)), 200
+
+    except Exception as e:
+        log.exception("❌ Exception in PD webhook")
+        return jsonify({"status": "error", "error": str(e)}), 200
+
+
+@app.route("/webhook", methods=["POST"])
+async def handle_twilio_webhook():
+    data = await request.get_json(silent=True) or await request.form
+    log.info("Received Twilio webhook", extra={"message_sid": data.get("MessageSid"), "message_status": data.get("MessageStatus")})
+    log.debug("Twilio data", extra={"payload": dict(data)})
+    core.delivery_store.record_callback(data)
+    core.record_sender_callback(data)
+    return jsonify({"status": "received"}), 200
+
+
+@app.route("/deliveries", methods=["GET"])
+async def deliveries():
+    token = request.headers.get("X-Delivery-Token") or request.args.get("token")
+    if not core.DELIVERY_TOKEN or token != core.DELIVERY_TOKEN:
+        return jsonify({"status": "forbidden"}), 403
+
+    number = request.args.get("to")
+    if not number:
+        return jsonify({"status": "error", "msg": "Missing 'to'"}), 400
+
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    with_events = request.args.get("events") == "true"
+
+    def lookup():
+        sends = core.delivery_store.recent_for_number(core.sanitize_number(number), limit)
+        if with_events:
+            for send in sends:
+                send["events"] = core.delivery_store.events(send["sid"])
+        return sends
+
+    sends = await asyncio.to_thread(lookup)
+    return jsonify({"to": core.sanitize_number(number), "sends": sends}), 200
+
+
+@app.route("/schedule", methods=["POST"])
+async def schedule():
+    if not core.schedule_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    body, status = await asyncio.to_thread(core.schedule_send, await request.get_json(silent=True) or {})
+    return jsonify(body), status
+
+
+@app.route("/schedule/<int:send_id>", methods=["GET", "DELETE"])
+async def scheduled_send(send_id):
+    if not core.schedule_authorized(request.headers, request.args):
+        return jsonify({"status": "forbidden"}), 403
+    if not await asyncio.to_thread(core.send_scheduler.get, send_id):
+        return jsonify({"status": "not_found"}), 404
+    if request.method == "DELETE" and not await asyncio.to_thread(core.send_scheduler.cancel, send_id):
+        return jsonify({"status": "error", "msg": "Only waiting or pending sends can be canceled"}), 409
+    return jsonify(await asyncio.to_thread(core.send_scheduler.get, send_id)), 200
+
+
+@app.route("/vcard/<int:person_id>", methods=["GET"])
+async def vcard_download(person_id: int):
+    if not core.vcard_link_authorized(person_id, request.args):
+        return jsonify({"status": "forbidden"}), 403
+
+    rendered = core.vcard_links.cached(person_id, request.args.get("v"))
+    if rendered is None:
+        data = await fetch_person(person_id, call="vcard_person_get")
+        if not data:
+            return jsonify({"status": "not_found"}), 404
+        rendered = core.vcard_links.render(person_id, data, core.build_vcard)
+
+    return await core.vcard_response(rendered, person_id, Response).make_conditional(request)
+
+
+@app.route("/test-send", methods=["POST"])
+async def test_send():
+    body = await request.get_json()
+    content_sid = core.TEMPLATE_CONTENT_MAP.get(body.get("template"))
+    if not content_sid:
+        return jsonify({"status": "error", "msg": "Unknown template"}), 400
+
+    result = await send_whatsapp_template(body.get("phone"), content_sid, {"1": body.get("variable")})
+    return jsonify(result), 200
+
+
+@app.route("/test-sms", methods=["POST"])
+async def test_sms():
+    body = await request.get_json()
+    result = await send_sms(body.get("phone"), body.get("message"))
+    return jsonify(result), 200
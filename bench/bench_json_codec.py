@@ -0,0 +1,111 @@
+"""
+Microbenchmark: JSON parse/serialize cost per Pipedrive webhook, stdlib json
+vs json_codec (orjson when installed).
+
+Per webhook the app parses the body (full current/previous person objects with
+many custom fields), serializes ContentVariables for each send, renders the
+activity note (indent=2), and jsonifies the response.
+
+    python bench/bench_json_codec.py
+    python bench/bench_json_codec.py --fields 150 --templates 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import json_codec  # noqa: E402
+
+
+def field_id(i):
+    return hashlib.sha1(f"field-{i}".encode()).hexdigest()
+
+
+def make_person(person_id, fields, set_fields):
+    custom = {}
+    for i in range(fields):
+        value = f"value {i} – £1,000.00 ✓" if i % 3 else None
+        if i < set_fields:
+            value = f"Nick {i}"
+        custom[field_id(i)] = {"type": "varchar", "value": value} if value is not None else None
+    return {
+        "id": person_id,
+        "name": "Nick Cornford",
+        "first_name": "Nick",
+        "last_name": "Cornford",
+        "owner_id": {"id": 123, "name": "Owner", "email": "owner@example.com"},
+        "org_id": {"value": 9, "name": "Example Ltd"},
+        "phone": [{"value": "+44 7700 900123", "primary": True, "label": "mobile"}],
+        "email": [{"value": "nick@example.com", "primary": True, "label": "work"}],
+        "label_ids": [1, 4, 7],
+        "add_time": "2024-01-05T10:11:12Z",
+        "update_time": "2025-06-01T09:00:00Z",
+        "custom_fields": custom,
+    }
+
+
+def make_webhook(fields, templates):
+    current = make_person(42, fields, templates)
+    previous = make_person(42, fields, 0)
+    return {
+        "meta": {"id": "4f0c9f4e-8a1d-4b8e-9f3e-0d3d9c8f1a2b", "entity_id": "42", "action": "change",
+                 "entity": "person", "version": "2.0", "timestamp": "2025-06-01T09:00:01Z"},
+        "data": current,
+        "previous": {"custom_fields": {k: previous["custom_fields"][k] for k in list(current["custom_fields"])[:templates]}},
+    }
+
+
+def per_webhook(dumps, loads, body, templates, indent_note):
+    data = loads(body)
+    results = []
+    for i in range(templates):
+        variables = {"1": data["data"]["first_name"], "2": f"{i},000.00"}
+        dumps(variables)
+        indent_note(variables)
+        results.append({"template": f"template_{i}", "status": "success"})
+    return dumps({"status": "done", "results": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, default=80, help="custom fields on the person")
+    parser.add_argument("--templates", type=int, default=2, help="templates triggered per webhook")
+    parser.add_argument("--number", type=int, default=5000)
+    args = parser.parse_args()
+
+    body = json.dumps(make_webhook(args.fields, args.templates)).encode()
+    print(f"webhook body: {len(body):,} bytes, {args.fields} custom fields, {args.templates} templates")
+    print(f"json_codec backend: {json_codec.BACKEND}\n")
+
+    variants = {
+        "stdlib json": (
+            lambda obj: json.dumps(obj, sort_keys=True),
+            json.loads,
+            lambda v: json.dumps(v, indent=2),
+        ),
+        "json_codec": (
+            lambda obj: json_codec.dumps(obj, sort_keys=True),
+            json_codec.loads,
+            lambda v: json_codec.dumps(v, indent=True),
+        ),
+    }
+
+    print(f"{'codec':<14}{'parse µs':>10}{'serialize µs':>14}{'per webhook µs':>16}")
+    baseline = None
+    for name, (dumps, loads, indent_note) in variants.items():
+        parse = timeit.timeit(lambda: loads(body), number=args.number) / args.number * 1e6
+        data = loads(body)
+        serialize = timeit.timeit(lambda: dumps(data), number=args.number) / args.number * 1e6
+        total = timeit.timeit(
+            lambda: per_webhook(dumps, loads, body, args.templates, indent_note), number=args.number
+        ) / args.number * 1e6
+        baseline = baseline or total
+        print(f"{name:<14}{parse:>10.1f}{serialize:>14.1f}{total:>16.1f}   ({baseline / total:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Reconciliation pass against the stub upstreams: how many Pipedrive calls and
+how long it takes to sweep N persons for template fields whose webhook was
+missed, compared with what one GET per person would cost.
+
+Boots the app in-process (no server) against bench/stub_upstreams.py with every
+--stale-every-th person still holding a populated template field.
+
+    python bench/bench_reconcile.py
+    python bench/bench_reconcile.py --persons 20000 --page-size 500 --latency-ms 80
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstreams import StubConfig, start_stub_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--stale-every", type=int, default=250, help="every Nth person has a missed template")
+    parser.add_argument("--template", default="24hrs")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-reconcile-")
+    config = StubConfig(args.latency_ms, persons=args.persons, stale_every=args.stale_every)
+    server = start_stub_server(config)
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ.update({
+        "TWILIO_API_BASE": base, "TWILIO_CONTENT_API_BASE": base, "PIPEDRIVE_API_BASE": base, "QUOTE_API_BASE": base,
+        "TWILIO_ACCOUNT_SID": "ACbench", "TWILIO_AUTH_TOKEN": "bench", "TWILIO_WHATSAPP_FROM": "+447700000000",
+        "PIPEDRIVE_API_KEY": "bench", "SEND_QUOTE_API_KEY": "bench", "TWILIO_SEND_RATE": "1000",
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "DELIVERY_STORE_PATH": os.path.join(workdir, "deliveries.db"),
+        "DEFERRED_QUEUE_PATH": os.path.join(workdir, "deferred.db"),
+        "SCHEDULE_PATH": os.path.join(workdir, "schedule.db"),
+        "CONTENT_SNAPSHOT_PATH": os.path.join(workdir, "content.json"),
+        "SCHEDULER_ENABLED": "false", "RECONCILE_ENABLED": "false",
+    })
+
+    import app
+    from reconciler import Reconciler
+
+    logging.getLogger("webhook").setLevel(logging.WARNING)
+
+    config.stale_fields = {app.TEMPLATE_FIELD_MAP[args.template]: "Bench"}
+    reconciler = Reconciler(
+        app.pipedrive_client, os.path.join(workdir, "reconcile.db"), app.TEMPLATE_FIELD_MAP.values(),
+        app.reconcile_person, page_size=args.page_size,
+    )
+
+    start = time.perf_counter()
+    summary = reconciler.run_pass()
+    elapsed = time.perf_counter() - start
+    if app.pipedrive_writes:
+        app.pipedrive_writes.flush()
+
+    naive = args.persons * args.latency_ms / 1000
+    print(f"persons: {summary['persons']:,} in {summary['pages']} pages, {elapsed:.2f}s "
+          f"(one GET per person: {args.persons:,} calls, ~{naive:.0f}s of latency)")
+    print(f"missed templates found: {summary['pending']}, sent: {summary['sent']}")
+    for key, count in sorted(config.counts.items()):
+        print(f"  {key:<40}{count:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Microbenchmark: cost of finding triggered templates in one Pipedrive webhook
+as the number of registered templates grows.
+
+Compares the old per-template scan (re-reading 'previous' and walking the
+name if/elif chain for every entry of TEMPLATE_FIELD_MAP) with the field-diff
+index in template_registry.
+
+    python bench/bench_template_dispatch.py
+"""
+import hashlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from template_registry import build_registry, find_triggered  # noqa: E402
+
+SPLIT_TWO = ["payment_account", "payment_which", "quote_amount", "feefo_request", "request_settlement_confirmation",
+             "quote_tips", "scio_terms", "scio_and_equals_terms", "1k_reminder", "jumio_ebury", "intro_thanks"]
+
+
+def field_id(i):
+    return hashlib.sha1(f"field-{i}".encode()).hexdigest()
+
+
+def make_maps(n):
+    names = [f"template_{i}" for i in range(n)]
+    field_map = {name: field_id(i) for i, name in enumerate(names)}
+    content_map = {name: f"HX{i:032d}" for i, name in enumerate(names)}
+    return content_map, field_map
+
+
+def make_payload(field_map, other_fields=60, full=True):
+    """One template field set; 'full' payloads also list every other field as null, like Pipedrive does."""
+    fields = {f"other_{i}": {"type": "varchar", "value": "x"} for i in range(other_fields)}
+    if full:
+        fields.update({fid: None for fid in field_map.values()})
+    target = list(field_map.values())[len(field_map) // 2]
+    fields[target] = {"type": "varchar", "value": "Nick"}
+    previous = {target: None}
+    return {"data": {"custom_fields": fields}, "previous": {"custom_fields": previous}}
+
+
+def legacy_dispatch(data, field_map):
+    """The old loop, minus the network calls."""
+    custom_fields = data.get("data", {}).get("custom_fields", {})
+    triggered = []
+    for template_name, fid in field_map.items():
+        field = custom_fields.get(fid)
+        field_value = field.get("value") if field else None
+        previous_fields = data.get("previous", {}).get("custom_fields", {})
+        previous_value = None
+        if previous_fields and fid in previous_fields:
+            prev_field = previous_fields.get(fid)
+            if prev_field and isinstance(prev_field, dict):
+                previous_value = prev_field.get("value")
+        if field_value and not previous_value:
+            if template_name == "24hrs":
+                pass
+            elif template_name in SPLIT_TWO:
+                pass
+            elif template_name in ("tips", "new_sar_details", "payment_released_referral", "quote", "auto_exchange"):
+                pass
+            triggered.append(template_name)
+    return triggered
+
+
+def indexed_dispatch(data, index):
+    return find_triggered(data["data"].get("custom_fields"), data["previous"].get("custom_fields") or {}, index)
+
+
+def run(number=20000):
+    print(f"{'templates':>10} {'payload':>8} {'legacy µs':>10} {'indexed µs':>11}")
+    for n in (46, 100, 250, 500, 1000):
+        content_map, field_map = make_maps(n)
+        index = build_registry(content_map, field_map)
+        for full in (False, True):
+            data = make_payload(field_map, full=full)
+            assert [s.name for s, _ in indexed_dispatch(data, index)] == legacy_dispatch(data, field_map)
+            legacy = timeit.timeit(lambda: legacy_dispatch(data, field_map), number=number) / number * 1e6
+            indexed = timeit.timeit(lambda: indexed_dispatch(data, index), number=number) / number * 1e6
+            print(f"{n:>10} {'full' if full else 'sparse':>8} {legacy:>10.2f} {indexed:>11.2f}")
+
+
+if __name__ == "__main__":
+    run()
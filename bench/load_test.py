@@ -0,0 +1,296 @@
+"""
+Load test: webhook throughput and latency per gunicorn worker model.
+
+Starts the stub upstreams (bench/stub_upstreams.py), boots the app under each
+worker model in turn, and drives /pipedrive-webhook and /front-webhook with
+realistic payloads. Reports requests/s and p50/p95/p99 latency per scenario;
+--json appends the run to a file so results can be compared across commits.
+
+    python bench/load_test.py
+    python bench/load_test.py --models sync,gthread,uvicorn --requests 500 --concurrency 32 \
+        --latency-ms 120 --error-rate 0.01 --json bench/results.jsonl
+
+Worker models whose packages aren't installed (gevent, uvicorn) are skipped.
+Twilio send pacing is opened up (TWILIO_SEND_RATE) so the numbers measure the
+app rather than the rate limiter.
+"""
+import argparse
+import ast
+import datetime
+import importlib.util
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstreams import StubConfig, start_stub_server  # noqa: E402
+
+WORKER_MODELS = {
+    "sync": {"app": "app:app", "args": ["-k", "sync"]},
+    "gthread": {"app": "app:app", "args": ["-k", "gthread", "--threads", "8"]},
+    "gevent": {"app": "app:app", "args": ["-k", "gevent", "--worker-connections", "200"], "requires": "gevent"},
+    "uvicorn": {"app": "asgi_app:app", "args": ["-k", "uvicorn.workers.UvicornWorker"], "requires": "uvicorn"},
+}
+
+SCENARIOS = ["single_template", "multi_template", "vcard", "quote", "no_op_ping", "front_send", "front_ping"]
+
+_ids = itertools.count(1_000_000)
+
+
+def load_field_map():
+    """
+    TEMPLATE_FIELD_MAP read from app.py's source. Importing app here would load the
+    developer's .env, start the deferred queue and scheduler on ./*.db, and call the
+    real Twilio Content API.
+    """
+    with open(os.path.join(ROOT, "app.py")) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "TEMPLATE_FIELD_MAP" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise RuntimeError("TEMPLATE_FIELD_MAP not found in app.py")
+
+
+def pipedrive_payload(field_map, values):
+    """A v2 person.change webhook setting each template field that was empty before."""
+    person_id = next(_ids)
+    return {
+        "meta": {"id": f"bench-{person_id}", "entity_id": person_id, "action": "change", "entity": "person"},
+        "data": {
+            "id": person_id,
+            "custom_fields": {field_map[name]: {"value": value} for name, value in values.items()},
+        },
+        "previous": {"custom_fields": {field_map[name]: None for name in values}},
+    }
+
+
+def scenario_request(name, field_map):
+    """Returns (path, json_body) for one request of the named scenario."""
+    if name == "single_template":
+        return "/pipedrive-webhook", pipedrive_payload(field_map, {"24hrs": "Nick"})
+    if name == "multi_template":
+        return "/pipedrive-webhook", pipedrive_payload(field_map, {
+            "24hrs": "Nick", "tips": "sar/gbp", "quote_amount": "Nick 10,000",
+        })
+    if name == "vcard":
+        return "/pipedrive-webhook", pipedrive_payload(field_map, {"vcard": "+447700900999"})
+    if name == "quote":
+        return "/pipedrive-webhook", pipedrive_payload(field_map, {"quote": "GBPEUR buy 25,000"})
+    if name == "no_op_ping":
+        person_id = next(_ids)
+        return "/pipedrive-webhook", {"meta": {"id": f"bench-{person_id}", "entity_id": person_id}, "data": {"id": person_id}}
+    if name == "front_send":
+        return "/front-webhook", {"body": "24hrs Nick", "recipient": {"handle": "+447700900123"}}
+    if name == "front_ping":
+        return "/front-webhook", {"type": "ping"}
+    raise ValueError(f"Unknown scenario {name!r}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def start_app(model, port, stub_url, workers, workdir):
+    spec = WORKER_MODELS[model]
+    env = {
+        **os.environ,
+        "TWILIO_API_BASE": stub_url,
+        "TWILIO_CONTENT_API_BASE": stub_url,
+        "PIPEDRIVE_API_BASE": stub_url,
+        "QUOTE_API_BASE": stub_url,
+        "TWILIO_ACCOUNT_SID": "ACbench",
+        "TWILIO_AUTH_TOKEN": "bench-auth-token",
+        "TWILIO_WHATSAPP_FROM": "+447700000000",
+        "PIPEDRIVE_API_KEY": "bench-pipedrive-key",
+        "SEND_QUOTE_API_KEY": "bench-quote-key",
+        "VCARD_TOKEN": "bench-vcard-token",
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{port}",
+        "TWILIO_SEND_RATE": "100000",
+        "TWILIO_SEND_BURST": "100000",
+        "METRICS_DIR": os.path.join(workdir, f"metrics-{model}"),
+        "DEDUP_PATH": os.path.join(workdir, f"dedup-{model}.db"),
+        "PIPEDRIVE_QUEUE_PATH": os.path.join(workdir, f"queue-{model}.db"),
+        "DEFERRED_QUEUE_PATH": os.path.join(workdir, f"deferred-{model}.db"),
+        "SCHEDULE_PATH": os.path.join(workdir, f"schedule-{model}.db"),
+        "DELIVERY_STORE_PATH": os.path.join(workdir, f"deliveries-{model}.db"),
+        "BROADCAST_PATH": os.path.join(workdir, f"broadcasts-{model}.db"),
+        "RECONCILE_PATH": os.path.join(workdir, f"reconcile-{model}.db"),
+        "CONTENT_SNAPSHOT_PATH": os.path.join(workdir, f"content-{model}.json"),
+        # Every feature flag pinned to the app's default (or off), and set even when empty, so
+        # neither the shell nor the app's load_dotenv can change what a run measures
+        "TWILIO_WHATSAPP_FROM_POOL": "",
+        "TWILIO_SMS_FROM": "+447700000001",
+        "TWILIO_STATUS_CALLBACK_URL": "",
+        "TWILIO_RATE_LIMIT_PATH": "",
+        "DEDUP_BACKEND": "memory",
+        "PIPEDRIVE_QUEUE_MODE": "false",
+        "PIPEDRIVE_WRITE_COALESCE": "true",
+        "PIPEDRIVE_MERGE_ACTIVITIES": "false",
+        "CONTENT_VALIDATION": "true",
+        "SCHEDULER_ENABLED": "true",
+        "RECONCILE_ENABLED": "false",
+        "VCARD_SIGNING_KEY": "",
+        "VCARD_ALLOW_STATIC_TOKEN": "false",
+        "TRACING_ENABLED": "true",
+        "TRACE_EXPORT_PATH": "",
+        "CAPTURE_DIR": "",
+        "DEBUG_LOGGING": "false",
+        "LOG_SAMPLE_RATE": "100",
+        "DEBUG_TOKEN": "",
+        "DELIVERY_TOKEN": "",
+        "SCHEDULE_TOKEN": "",
+        "BROADCAST_TOKEN": "",
+    }
+    cmd = [sys.executable, "-m", "gunicorn", spec["app"], "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+           *spec["args"]]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode} for worker model {model!r}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"App didn't become healthy for worker model {model!r}")
+
+
+def stop_app(proc):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_scenario(base_url, scenario, field_map, total, concurrency):
+    local = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, body = scenario_request(scenario, field_map)
+        start = time.perf_counter()
+        try:
+            ok = session.post(base_url + path, json=body, timeout=60).status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=",".join(WORKER_MODELS), help="comma-separated worker models")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Twilio sends answered with a 429")
+    parser.add_argument("--json", help="append results to this JSON-lines file")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    stub = start_stub_server(config)
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+    field_map = load_field_map()
+    scenarios = args.scenarios.split(",")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="webhook-bench-") as workdir:
+        for model in args.models.split(","):
+            required = WORKER_MODELS[model].get("requires")
+            if required and importlib.util.find_spec(required) is None:
+                print(f"-- skipping {model}: {required} is not installed")
+                continue
+
+            port = free_port()
+            proc = start_app(model, port, stub_url, args.workers, workdir)
+            try:
+                print(f"\n{model} ({args.workers} workers, concurrency {args.concurrency}, "
+                      f"upstream {args.latency_ms:g}±{args.jitter_ms:g}ms)")
+                print(f"{'scenario':<18}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+                for scenario in scenarios:
+                    result = run_scenario(f"http://127.0.0.1:{port}", scenario, field_map, args.requests, args.concurrency)
+                    result["model"] = model
+                    results.append(result)
+                    print(f"{scenario:<18}{result['rps']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                          f"{result['p99_ms']:>9}{result['errors']:>8}")
+            finally:
+                stop_app(proc)
+
+    stub.shutdown()
+    print(f"\nupstream calls: {dict(config.counts)}")
+
+    if args.json:
+        run = {
+            "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "settings": {k: v for k, v in vars(args).items() if k != "json"},
+            "results": results,
+        }
+        with open(args.json, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Replays captured webhook traffic (CAPTURE_DIR, see capture.py) against the app
+and reports latency and error rates per route.
+
+The capture keeps arrival times, so traffic can be replayed with its real
+shape: --speed 1 is real time, --speed 10 compresses an hour into six minutes,
+and --speed max sends as fast as --concurrency allows. Without --target, the
+app is booted under gunicorn against the stub upstreams (bench/stub_upstreams.py)
+so nothing reaches Twilio or Pipedrive.
+
+    python bench/replay.py captures/
+    python bench/replay.py captures/*.jsonl.gz --speed 20 --model gthread --workers 2 --latency-ms 120
+    python bench/replay.py captures/ --speed max --concurrency 64 --json bench/replay-results.jsonl
+
+Schedule lag is how late requests left compared with the replay clock; if it
+grows, the app (or this driver) couldn't keep up with the offered rate.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from capture import read_capture  # noqa: E402
+from load_test import WORKER_MODELS, free_port, git_revision, percentile, start_app, stop_app  # noqa: E402
+from stub_upstreams import StubConfig, start_stub_server  # noqa: E402
+
+
+def capture_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))))
+        else:
+            files.extend(sorted(glob.glob(path)))
+    return files
+
+
+def load_entries(files, routes=None, limit=None):
+    entries = [e for path in files for e in read_capture(path) if not routes or e["route"] in routes]
+    entries.sort(key=lambda e: e["t"])
+    return entries[:limit] if limit else entries
+
+
+def request_kwargs(entry):
+    content_type = entry.get("content_type") or ""
+    body = entry.get("body")
+    if content_type == "application/json":
+        return {"json": body}
+    if content_type == "application/x-www-form-urlencoded" and isinstance(body, dict):
+        return {"data": body}
+    headers = {"Content-Type": content_type} if content_type else {}
+    return {"data": body if isinstance(body, str) else json.dumps(body), "headers": headers}
+
+
+def replay(base_url, entries, speed, concurrency):
+    local = threading.local()
+    lock = threading.Lock()
+    per_route = defaultdict(lambda: {"latencies": [], "errors": 0, "status_changed": 0})
+    lags = []
+
+    def send(entry, due):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        # Measured when the request actually starts, so a saturated pool shows up as lag
+        lag = max(start - due, 0.0)
+        try:
+            status = session.request(entry["method"], base_url + entry["route"], timeout=60,
+                                     **request_kwargs(entry)).status_code
+        except requests.RequestException:
+            status = None
+        elapsed = time.perf_counter() - start
+        with lock:
+            stats = per_route[entry["route"]]
+            stats["latencies"].append(elapsed)
+            if status is None or status >= 400:
+                stats["errors"] += 1
+            if status != entry.get("status"):
+                stats["status_changed"] += 1
+            lags.append(lag)
+
+    first = entries[0]["t"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            due = started + (entry["t"] - first) / speed if speed else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, entry, due)
+    wall = time.perf_counter() - started
+
+    results = []
+    for route, stats in sorted(per_route.items()):
+        latencies = sorted(stats["latencies"])
+        results.append({
+            "route": route,
+            "requests": len(latencies),
+            "errors": stats["errors"],
+            "error_rate": round(stats["errors"] / len(latencies), 4),
+            "status_changed": stats["status_changed"],
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        })
+    lags.sort()
+    summary = {
+        "requests": len(entries),
+        "wall_seconds": round(wall, 2),
+        "rps": round(len(entries) / wall, 1),
+        "captured_seconds": round(entries[-1]["t"] - first, 2),
+        "lag_p95_ms": round(percentile(lags, 95) * 1000, 1),
+        "lag_max_ms": round(lags[-1] * 1000, 1),
+    }
+    return summary, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="capture files, globs or directories")
+    parser.add_argument("--speed", default="1", help="replay speed multiplier, or 'max'")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--routes", help="comma-separated routes to replay (default: all captured)")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--target", help="base URL of a running app; default boots one against the stubs")
+    parser.add_argument("--model", default="gthread", choices=list(WORKER_MODELS))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with a 500")
+    parser.add_argument("--json", help="append results to this JSON-lines file")
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    files = capture_files(args.captures)
+    entries = load_entries(files, set(args.routes.split(",")) if args.routes else None, args.limit)
+    if not entries:
+        sys.exit("No captured requests found")
+    print(f"{len(entries):,} requests from {len(files)} file(s), speed {args.speed}")
+
+    stub = proc = None
+    config = None
+    with tempfile.TemporaryDirectory(prefix="webhook-replay-") as workdir:
+        base_url = args.target
+        if not base_url:
+            # Don't let the booted app capture the replay itself
+            os.environ.pop("CAPTURE_DIR", None)
+            config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate)
+            stub = start_stub_server(config)
+            port = free_port()
+            proc = start_app(args.model, port, f"http://127.0.0.1:{stub.server_port}", args.workers, workdir)
+            base_url = f"http://127.0.0.1:{port}"
+        try:
+            summary, results = replay(base_url.rstrip("/"), entries, speed, args.concurrency)
+        finally:
+            if proc:
+                stop_app(proc)
+            if stub:
+                stub.shutdown()
+
+    print(f"\n{summary['rps']} req/s over {summary['wall_seconds']}s "
+          f"(captured span {summary['captured_seconds']}s); "
+          f"schedule lag p95 {summary['lag_p95_ms']}ms, max {summary['lag_max_ms']}ms")
+    print(f"{'route':<22}{'requests':>9}{'errors':>8}{'err %':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Δstatus':>9}")
+    for r in results:
+        print(f"{r['route']:<22}{r['requests']:>9}{r['errors']:>8}{r['error_rate'] * 100:>7.2f}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['status_changed']:>9}")
+    if config:
+        print(f"\nupstream calls: {dict(config.counts)}")
+
+    if args.json:
+        run = {
+            "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("json", "captures")},
+            "files": files,
+            "summary": summary,
+            "results": results,
+        }
+        with open(args.json, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Local stand-ins for the Twilio Messages and Content APIs, the Pipedrive persons/activities
+API (including the cursor-paged /v1/persons/collection) and the quote API's
+/send_quote, with configurable latency and error injection. Used by
+bench/load_test.py and bench/bench_reconcile.py; can also be run on its own and
+pointed at with TWILIO_API_BASE / TWILIO_CONTENT_API_BASE / PIPEDRIVE_API_BASE /
+QUOTE_API_BASE:
+
+    python bench/stub_upstreams.py --port 8900 --latency-ms 80 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PERSON_PATH = re.compile(r"^/v1/persons/(\d+)$")
+
+
+class StubConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, persons=0,
+                 stale_fields=None, stale_every=50, content=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        # /v1/persons/collection serves persons 1..persons; every stale_every-th still has stale_fields set
+        self.persons = persons
+        self.stale_fields = stale_fields or {}
+        self.stale_every = stale_every
+        # /v1/Content serves these Content API items; None answers 404
+        self.content = content
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def delay(self):
+        seconds = (self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+def stub_person(person_id):
+    return {
+        "id": person_id,
+        "name": f"Bench Person {person_id}",
+        "phone": [{"value": f"+44 7700 {person_id % 1000000:06d}", "primary": True}],
+        "email": [{"value": f"bench{person_id}@example.com", "primary": True}],
+        "org_name": "Bench Ltd",
+    }
+
+
+def stub_collection_page(config, cursor, limit):
+    """One page of v1-shaped persons (custom fields as top-level keys) and the next cursor."""
+    start = int(cursor or 0)
+    end = min(start + limit, config.persons)
+    persons = []
+    for person_id in range(start + 1, end + 1):
+        person = {**stub_person(person_id), "update_time": "2024-01-01 00:00:00"}
+        if config.stale_every and person_id % config.stale_every == 0:
+            person.update(config.stale_fields)
+        persons.append(person)
+    return persons, str(end) if end < config.persons else None
+
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            path = url.path
+            self._read_body()
+            config.count(f"{method} {PERSON_PATH.sub('/v1/persons/:id', path)}")
+            config.delay()
+
+            if random.random() < config.error_rate:
+                config.count("injected_500")
+                return self._send(500, {"success": False, "error": "injected"})
+
+            if path.endswith("/Messages.json") and method == "POST":
+                if random.random() < config.throttle_rate:
+                    config.count("injected_429")
+                    return self._send(429, {"code": 20429, "message": "Too Many Requests"}, {"Retry-After": "0"})
+                return self._send(201, {"sid": "SM" + "%032x" % random.getrandbits(128), "status": "queued"})
+
+            if path == "/v1/persons/collection" and method == "GET":
+                query = parse_qs(url.query)
+                persons, next_cursor = stub_collection_page(
+                    config, query.get("cursor", [None])[0], min(int(query.get("limit", ["100"])[0]), 500)
+                )
+                return self._send(200, {"success": True, "data": persons, "additional_data": {"next_cursor": next_cursor}})
+
+            if path == "/v1/Content" and method == "GET" and config.content is not None:
+                return self._send(200, {"contents": config.content, "meta": {"next_page_url": None}})
+
+            match = PERSON_PATH.match(path)
+            if match and method == "GET":
+                return self._send(200, {"success": True, "data": stub_person(int(match.group(1)))})
+            if match and method == "PUT":
+                return self._send(200, {"success": True, "data": {"id": int(match.group(1))}})
+            if path == "/v1/activities" and method == "POST":
+                return self._send(201, {"success": True, "data": {"id": random.randint(1, 10 ** 9)}})
+            if path == "/send_quote" and method == "POST":
+                return self._send(200, {"status": "ok"})
+            self._send(404, {"success": False})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+    return StubHandler
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """Serves all three upstreams from one port in a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-upstreams", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Twilio sends answered with a 429")
+    parser.add_argument("--persons", type=int, default=0, help="persons served by /v1/persons/collection")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, persons=args.persons)
+    server = start_stub_server(config, port=args.port)
+    print(f"Stub upstreams on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(dict(config.counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Bulk template sends from a streamed recipient list.
+
+Recipients are read one row at a time from a CSV or NDJSON body and sent with
+a bounded number of sends in flight. Each row is written to SQLite as 'sending'
+before its send and with its outcome as soon as the send returns. Re-running a
+broadcast with the same id and list skips every row already sent (or rejected
+as invalid), so a crash mid-campaign resumes where it stopped. Rows a crash left
+'sending', or whose send failed after the request may have reached Twilio, are
+marked 'unknown' and are not sent again.
+"""
+import codecs
+import contextvars
+import csv
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import json_codec
+from resilience import track_send
+
+log = logging.getLogger("webhook.broadcast")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_rows (
+    broadcast_id TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    phone TEXT,
+    status TEXT NOT NULL,
+    detail TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (broadcast_id, row)
+);
+"""
+
+# Rows in these states are not sent again on resume; 'error' rows are retried
+DONE_STATUSES = ("sent", "invalid", "unknown")
+
+
+class RecipientError(ValueError):
+    """Raised for a recipient row that can't be sent (no phone, bad variables)."""
+
+
+def iter_recipients(stream, fmt):
+    """Yields (row_number, record) from a binary stream without reading it all into memory."""
+    lines = codecs.getreader("utf-8-sig")(stream)
+    if fmt == "csv":
+        for row, record in enumerate(csv.DictReader(lines), start=1):
+            yield row, {k.strip(): (v or "").strip() for k, v in record.items() if k}
+        return
+
+    row = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row += 1
+        try:
+            record = json_codec.loads(line)
+        except ValueError:
+            record = {"_error": "Invalid JSON"}
+        yield row, record if isinstance(record, dict) else {"_error": "Expected a JSON object"}
+
+
+def recipient_variables(record, parser):
+    """
+    ContentVariables for a row: an explicit 'variables' object, numbered columns
+    ("1", "2", ...), or a 'value' run through the template's field parser.
+    """
+    if record.get("_error"):
+        raise RecipientError(record["_error"])
+    if isinstance(record.get("variables"), dict):
+        return {str(k): str(v) for k, v in record["variables"].items()}
+
+    numbered = {k: str(v) for k, v in record.items() if k.isdigit()}
+    if numbered:
+        return numbered
+    if record.get("value"):
+        try:
+            return parser(str(record["value"]))
+        except ValueError as e:
+            raise RecipientError(str(e))
+    raise RecipientError("No template variables")
+
+
+class BroadcastStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def start(self, broadcast_id, template):
+        """Registers (or reopens) a broadcast; returns the set of rows already done."""
+        conn = self._conn()
+        now = time.time()
+        existing = conn.execute("SELECT template FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        if existing and existing[0] != template:
+            raise ValueError(f"Broadcast {broadcast_id!r} was started with template {existing[0]!r}")
+        conn.execute(
+            "INSERT INTO broadcasts (id, template, status, created_at, updated_at) VALUES (?, ?, 'running', ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET status = 'running', updated_at = excluded.updated_at",
+            (broadcast_id, template, now, now),
+        )
+        # A row still 'sending' was interrupted mid-send: it may have gone out
+        conn.execute(
+            "UPDATE broadcast_rows SET status = 'unknown', detail = 'Interrupted during send', updated_at = ? "
+            "WHERE broadcast_id = ? AND status = 'sending'",
+            (now, broadcast_id),
+        )
+        rows = conn.execute(
+            f"SELECT row FROM broadcast_rows WHERE broadcast_id = ? AND status IN ({','.join('?' * len(DONE_STATUSES))})",
+            (broadcast_id, *DONE_STATUSES),
+        ).fetchall()
+        return {row for (row,) in rows}
+
+    def record(self, broadcast_id, results):
+        """Writes [(row, phone, status, detail)] in one transaction."""
+        if not results:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO broadcast_rows (broadcast_id, row, phone, status, detail, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(broadcast_id, row, phone, status, detail, now) for row, phone, status, detail in results],
+            )
+            conn.execute("UPDATE broadcasts SET updated_at = ? WHERE id = ?", (now, broadcast_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish(self, broadcast_id, status="done"):
+        self._conn().execute(
+            "UPDATE broadcasts SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), broadcast_id)
+        )
+
+    def status(self, broadcast_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT template, status, created_at, updated_at FROM broadcasts WHERE id = ?", (broadcast_id,)
+        ).fetchone()
+        if not row:
+            return None
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM broadcast_rows WHERE broadcast_id = ? GROUP BY status", (broadcast_id,)
+        ).fetchall())
+        template, status, created_at, updated_at = row
+        return {
+            "broadcast_id": broadcast_id, "template": template, "status": status,
+            "created_at": created_at, "updated_at": updated_at, "rows": counts,
+        }
+
+
+class BroadcastRunner:
+    """
+    send(phone, variables) -> (ok, detail) sends one message; post_activities(list)
+    writes a batch of [(record, variables)] to Pipedrive for rows that have a
+    person_id. run() is a generator of progress dicts, so the caller can stream
+    them back while the list is still being read.
+    """
+
+    def __init__(self, store, send, post_activities=None, concurrency=8, activity_batch=50, progress_interval=1.0):
+        self.store = store
+        self.send = send
+        self.post_activities = post_activities
+        self.concurrency = max(int(concurrency), 1)
+        self.activity_batch = activity_batch
+        self.progress_interval = progress_interval
+
+    def _send_one(self, broadcast_id, row, record, parser):
+        phone = str(record.get("phone") or "").strip()
+        status, detail, activity = self._attempt(broadcast_id, row, phone, record, parser)
+        # Written from the send thread, so a crash loses no row whose send has returned
+        self.store.record(broadcast_id, [(row, phone, status, detail)])
+        return status, activity
+
+    def _attempt(self, broadcast_id, row, phone, record, parser):
+        try:
+            if not phone:
+                raise RecipientError("Missing phone")
+            variables = recipient_variables(record, parser)
+        except RecipientError as e:
+            return "invalid", str(e), None
+
+        self.store.record(broadcast_id, [(row, phone, "sending", None)])
+        with track_send() as attempt:
+            try:
+                ok, detail = self.send(phone, variables)
+            except Exception as e:
+                log.exception("❌ Broadcast send failed", extra={"row": row})
+                return "unknown" if attempt.may_have_sent else "error", str(e), None
+        activity = (record, variables) if ok and record.get("person_id") else None
+        return "sent" if ok else "error", detail, activity
+
+    def run(self, broadcast_id, template, parser, recipients):
+        done_rows = self.store.start(broadcast_id, template)
+        counts = {"sent": 0, "error": 0, "invalid": 0, "unknown": 0, "skipped": 0}
+        activities, in_flight = [], set()
+        last_progress = time.monotonic()
+
+        def progress(status="running"):
+            return {"broadcast_id": broadcast_id, "status": status, "processed": sum(counts.values()), **counts}
+
+        def harvest(finished):
+            for future in finished:
+                status, activity = future.result()
+                counts[status] += 1
+                if activity:
+                    activities.append(activity)
+            if self.post_activities and len(activities) >= self.activity_batch:
+                activity_pool.submit(contextvars.copy_context().run, self.post_activities, activities[:])
+                activities.clear()
+
+        # One pool sends; a second writes activity batches so Pipedrive latency never stalls sends
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast") as send_pool, \
+                ThreadPoolExecutor(max_workers=2, thread_name_prefix="broadcast-activities") as activity_pool:
+            try:
+                for row, record in recipients:
+                    if row in done_rows:
+                        counts["skipped"] += 1
+                        continue
+                    if len(in_flight) >= self.concurrency * 2:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        harvest(finished)
+                    in_flight.add(send_pool.submit(contextvars.copy_context().run, self._send_one, broadcast_id, row, record, parser))
+
+                    if time.monotonic() - last_progress >= self.progress_interval:
+                        last_progress = time.monotonic()
+                        yield progress()
+
+                finished, in_flight = wait(in_flight)
+                harvest(finished)
+                if self.post_activities and activities:
+                    activity_pool.submit(contextvars.copy_context().run, self.post_activities, activities[:])
+            finally:
+                # Reached on a client disconnect too: let in-flight sends land (each records its row)
+                harvest(wait(in_flight).done)
+
+        status = "done" if not counts["error"] and not counts["unknown"] else "done_with_errors"
+        self.store.finish(broadcast_id, status)
+        log.info("📣 Broadcast finished", extra=progress(status))
+        yield progress(status)
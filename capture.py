@@ -0,0 +1,187 @@
+"""
+Opt-in capture of inbound webhook traffic for replay (bench/replay.py).
+
+Each captured request becomes one JSON line in a gzip file: arrival time,
+route, content type, the sanitized body, response status and handler time.
+Every worker process writes its own file from a background thread, and files
+roll over after max_records. Sanitizing and writing both happen off the
+request path.
+
+Sanitization keeps the shape the app cares about and removes PII:
+- Letters become x/X. Digits are replaced with digits derived from a keyed
+  hash of the value's digits, so a phone number still looks like one and stays
+  distinct, and it masks the same way in every format it appears in.
+- Punctuation and length are kept, so template variable parsers still accept
+  or reject the value the same way.
+- Dict keys (custom field ids), numbers, and the ids and structural fields
+  in KEEP_KEYS are left alone. The template name at the start of a Front
+  comment is kept too.
+- Query strings and headers (tokens, signatures) are never captured.
+"""
+import atexit
+import gzip
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import json_codec
+
+log = logging.getLogger("webhook.capture")
+
+# Values that describe the event rather than the person, kept verbatim
+KEEP_KEYS = {
+    "id", "entity_id", "correlation_id", "action", "entity", "object", "version", "change_source", "event",
+    "type", "is_bulk_update", "timestamp", "add_time", "update_time", "label", "primary",
+    "MessageStatus", "SmsStatus", "ErrorCode", "ChannelPrefix", "ApiVersion",
+}
+
+CHANNEL_PREFIXES = ("whatsapp:", "sms:", "messenger:")
+
+# Front comments are '<template> <variables>'; the template name is kept
+KEEP_FIRST_WORD_KEYS = {"body"}
+
+
+class Sanitizer:
+    def __init__(self, key):
+        self.key = key.encode() if isinstance(key, str) else key
+
+    def mask(self, text):
+        if text.startswith(CHANNEL_PREFIXES):
+            prefix, rest = text.split(":", 1)
+            return f"{prefix}:{self.mask(rest)}"
+        # Keyed on the digits alone, so '+44 7700 900123' and 'whatsapp:+447700900123' mask alike
+        digest = hmac.new(self.key, "".join(c for c in text if c.isdigit()).encode(), hashlib.sha256).digest()
+        out, i = [], 0
+        for ch in text:
+            if ch.isdigit():
+                out.append(str(digest[i % len(digest)] % 10))
+                i += 1
+            elif ch.isalpha():
+                out.append("X" if ch.isupper() else "x")
+            else:
+                out.append(ch)
+        return "".join(out)
+
+    def __call__(self, value, key=None):
+        if isinstance(value, dict):
+            return {k: self(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self(v, key) for v in value]
+        if not isinstance(value, str) or key in KEEP_KEYS:
+            return value
+        if key in KEEP_FIRST_WORD_KEYS and " " in value:
+            first, rest = value.split(" ", 1)
+            return f"{first} {self.mask(rest)}"
+        return self.mask(value)
+
+
+class TrafficCapture:
+    def __init__(self, directory, routes, sample_rate=1.0, key=None, max_records=100000):
+        self.directory = directory
+        self.routes = set(routes)
+        self.sample_rate = sample_rate
+        self.max_records = max_records
+        # Without a shared CAPTURE_KEY each process masks the same number differently
+        self.sanitize = Sanitizer(key or os.urandom(16))
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=10000)
+        self._file = None
+        self._records_in_file = 0
+        self._file_seq = itertools.count()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name="traffic-capture", daemon=True).start()
+        atexit.register(self.close)
+
+    def wants(self, route):
+        return route in self.routes and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def record(self, route, method, content_type, body, status, duration_ms, arrived_at):
+        """Queues one request; body is the parsed JSON or form dict (or raw text)."""
+        entry = {
+            "t": round(arrived_at, 6),
+            "route": route,
+            "method": method,
+            "content_type": content_type,
+            "body": body,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        # The sequence number keeps a rollover within the same millisecond from reopening (and truncating) a file
+        name = (f"capture-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+                f"-{next(self._file_seq):04d}.jsonl.gz")
+        self._file = gzip.open(os.path.join(self.directory, name), "wb")
+        self._records_in_file = 0
+        log.info("🎥 Capturing traffic", extra={"file": name})
+
+    def _write(self, batch):
+        with self._lock:
+            for entry in batch:
+                if self._file is None or self._records_in_file >= self.max_records:
+                    if self._file:
+                        self._file.close()
+                    self._open()
+                entry["body"] = self.sanitize(entry["body"])
+                self._file.write(json_codec.dumps_bytes(entry) + b"\n")
+                self._records_in_file += 1
+                self.captured += 1
+            # A sync flush keeps everything written so far readable if the process dies
+            self._file.flush()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except OSError as e:
+                self.dropped += len(batch)
+                log.warning("⚠️ Capture write failed: %s", e)
+
+    def close(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if batch:
+                self._write(batch)
+        except OSError:
+            pass
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        return {"captured": self.captured, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+def read_capture(path):
+    """Yields entries from a capture file, stopping quietly at a truncated tail."""
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json_codec.loads(line)
+        except (EOFError, gzip.BadGzipFile, ValueError):
+            return
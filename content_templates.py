@@ -0,0 +1,174 @@
+"""
+Local catalog of Twilio Content templates, used to check ContentVariables
+before a send.
+
+The catalog is loaded from the Content API (GET /v1/Content, paged) at startup.
+If that fails, it falls back to the last snapshot written to disk. It is then
+refreshed in the background. Each template's placeholders ({{1}}, {{name}})
+are collected from every content type, so a send can be rejected locally for
+a missing or empty variable, or a value WhatsApp won't accept. That saves a
+Twilio round trip and a 4xx.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import json_codec
+from template_registry import TemplateVariableError
+
+log = logging.getLogger("webhook.content")
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+# WhatsApp rejects template parameters with newlines/tabs or more than 4 consecutive spaces
+INVALID_PARAM = re.compile(r"[\n\r\t]| {5,}")
+MAX_PARAM_LENGTH = 1024
+
+ContentTemplate = namedtuple("ContentTemplate", "sid name language placeholders url_placeholders")
+
+
+def _walk(node, key=None):
+    """Yields (key, string) for every string under node."""
+    if isinstance(node, dict):
+        for k, v in node.items():
+            yield from _walk(v, k)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _walk(v, key)
+    elif isinstance(node, str):
+        yield key, node
+
+
+def parse_content(item):
+    placeholders, url_placeholders = set(), set()
+    for key, text in _walk(item.get("types") or {}):
+        found = PLACEHOLDER.findall(text)
+        placeholders.update(found)
+        if key == "url":
+            url_placeholders.update(found)
+    return ContentTemplate(
+        sid=item["sid"],
+        name=item.get("friendly_name"),
+        language=item.get("language"),
+        placeholders=tuple(sorted(placeholders, key=lambda p: (not p.isdigit(), int(p) if p.isdigit() else 0, p))),
+        url_placeholders=tuple(sorted(url_placeholders)),
+    )
+
+
+class ContentCatalog:
+    """
+    fetch() returns the raw Content API items (a list of dicts). With no fetch, or
+    when it fails, the catalog comes from snapshot_path; with neither, check() is a no-op.
+    """
+
+    def __init__(self, fetch=None, snapshot_path=None, refresh_interval=3600):
+        self.fetch = fetch
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.templates = {}
+        self.source = None
+        self.loaded_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self.source is not None
+
+    def load(self):
+        """Loads from the API (writing a snapshot), else from the snapshot; returns the source used."""
+        items, source = None, None
+        if self.fetch:
+            try:
+                items, source = self.fetch(), "api"
+            except Exception as e:
+                log.warning("⚠️ Content API load failed: %s", e)
+        if items is None and self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "rb") as f:
+                    items, source = json_codec.loads(f.read()), "snapshot"
+            except (OSError, ValueError) as e:
+                log.warning("⚠️ Content snapshot unreadable: %s", e)
+        if items is None:
+            return None
+
+        templates = {}
+        for item in items:
+            if item.get("sid"):
+                templates[item["sid"]] = parse_content(item)
+        with self._lock:
+            self.templates = templates
+            self.source = source
+            self.loaded_at = time.time()
+
+        if source == "api" and self.snapshot_path:
+            self._write_snapshot(items)
+        log.info("📇 Content templates loaded", extra={"source": source, "templates": len(templates)})
+        return source
+
+    def _write_snapshot(self, items):
+        tmp = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(json_codec.dumps_bytes(items, indent=True))
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            log.warning("⚠️ Content snapshot not written: %s", e)
+
+    def unknown(self, content_map):
+        """{template name: ContentSid} for entries that don't exist in Twilio (empty until loaded)."""
+        if not self.loaded:
+            return {}
+        return {name: sid for name, sid in content_map.items() if sid not in self.templates}
+
+    def get(self, content_sid):
+        return self.templates.get(content_sid)
+
+    def check(self, content_sid, variables):
+        """Raises TemplateVariableError when variables can't fill the template; no-op until loaded."""
+        if not self.loaded:
+            return
+        template = self.templates.get(content_sid)
+        if template is None:
+            self._reject(f"ContentSid {content_sid} does not exist in Twilio")
+
+        variables = variables or {}
+        missing = [p for p in template.placeholders if not str(variables.get(p) or "").strip()]
+        if missing:
+            self._reject(f"Template '{template.name}' needs variables {', '.join(missing)}")
+        for key in template.placeholders:
+            value = str(variables[key])
+            if INVALID_PARAM.search(value):
+                self._reject(f"Variable {key} has a newline, tab or more than 4 consecutive spaces")
+            if len(value) > MAX_PARAM_LENGTH:
+                self._reject(f"Variable {key} is longer than {MAX_PARAM_LENGTH} characters")
+            if key in template.url_placeholders and any(c.isspace() for c in value):
+                self._reject(f"Variable {key} is part of a URL and can't contain spaces")
+
+    def _reject(self, message):
+        with self._lock:
+            self.rejected += 1
+        raise TemplateVariableError(message)
+
+    def start(self):
+        if not self.fetch or not self.refresh_interval:
+            return
+        self._thread = threading.Thread(target=self._run, name="content-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.load()
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "templates": len(self.templates),
+            "loaded_at": self.loaded_at,
+            "rejected": self.rejected,
+        }
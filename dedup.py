@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def value_hash(value):
+    return hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:16]
+
+
+class MemoryDedupStore:
+    """Per-process dedup keys with a TTL; fine for a single worker."""
+
+    def __init__(self, ttl=300, maxsize=100_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def claim(self, key):
+        """Returns True the first time key is seen within the TTL, False for a duplicate."""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._keys.get(key)
+            if expires_at is not None and expires_at > now:
+                self.duplicates += 1
+                return False
+            self._keys[key] = now + self.ttl
+            self._keys.move_to_end(key)
+            # Oldest-inserted first, so expired keys sit at the front
+            while self._keys and (len(self._keys) > self.maxsize or next(iter(self._keys.values())) <= now):
+                self._keys.popitem(last=False)
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "keys": len(self._keys), "duplicates": self.duplicates}
+
+
+class SQLiteDedupStore:
+    """Dedup keys in a node-local SQLite file so every gunicorn worker shares them."""
+
+    def __init__(self, path, ttl=300, purge_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._claims = 0
+        self.duplicates = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS dedup_keys (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM dedup_keys WHERE key = ? AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO dedup_keys (key, expires_at) VALUES (?, ?)", (key, now + self.ttl)
+            )
+            self._claims += 1
+            if self._claims % self.purge_every == 0:
+                conn.execute("DELETE FROM dedup_keys WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if cur.rowcount == 0:
+            self.duplicates += 1
+            return False
+        return True
+
+    def release(self, key):
+        self._conn().execute("DELETE FROM dedup_keys WHERE key = ?", (key,))
+
+    def stats(self):
+        keys = self._conn().execute("SELECT COUNT(*) FROM dedup_keys WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "keys": keys, "duplicates": self.duplicates}
+
+
+def create_dedup_store(backend, path, ttl):
+    if backend == "sqlite":
+        return SQLiteDedupStore(path, ttl=ttl)
+    return MemoryDedupStore(ttl=ttl)
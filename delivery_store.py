@@ -0,0 +1,184 @@
+"""
+Local record of sent messages and their Twilio delivery status.
+
+Sends and status callbacks are put on an in-memory queue and written by a
+background thread in batches (one transaction per batch), so neither the send
+path nor the /webhook callback route waits on SQLite. Callbacks can arrive out
+of order (e.g. 'delivered' before 'sent'); a status never moves backwards.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("webhook.deliveries")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    sid TEXT PRIMARY KEY,
+    to_number TEXT,
+    template TEXT,
+    content_sid TEXT,
+    status TEXT,
+    error_code TEXT,
+    sent_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_to_sent ON messages (to_number, sent_at DESC);
+CREATE INDEX IF NOT EXISTS messages_template_sent ON messages (template, sent_at DESC);
+CREATE TABLE IF NOT EXISTS message_events (
+    sid TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error_code TEXT,
+    received_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS message_events_sid ON message_events (sid, received_at);
+"""
+
+# Later states win; failed/undelivered are terminal
+STATUS_RANK = {
+    "accepted": 0, "scheduled": 0, "queued": 1, "sending": 2, "sent": 3,
+    "delivered": 4, "read": 5, "undelivered": 6, "failed": 6, "canceled": 6,
+}
+
+_RANK_SQL = "CASE {col} " + " ".join(f"WHEN '{s}' THEN {r}" for s, r in STATUS_RANK.items()) + " ELSE -1 END"
+
+RECORD_SEND_SQL = """
+INSERT INTO messages (sid, to_number, template, content_sid, status, sent_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(sid) DO UPDATE SET
+    to_number = excluded.to_number, template = excluded.template,
+    content_sid = excluded.content_sid, sent_at = excluded.sent_at
+"""
+
+# A callback that beats its send record creates the row; the send fills in the rest
+RECORD_STATUS_SQL = f"""
+INSERT INTO messages (sid, to_number, status, error_code, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(sid) DO UPDATE SET
+    status = excluded.status, error_code = excluded.error_code, updated_at = excluded.updated_at,
+    to_number = COALESCE(messages.to_number, excluded.to_number)
+WHERE {_RANK_SQL.format(col="excluded.status")} >= {_RANK_SQL.format(col="messages.status")}
+"""
+
+
+def normalize_number(number):
+    """'whatsapp:+44 7700…' -> '+447700…', so sends and callbacks index the same way."""
+    number = (number or "").strip()
+    if number.startswith("whatsapp:"):
+        number = number[len("whatsapp:"):]
+    return number.replace(" ", "") or None
+
+
+class DeliveryStore:
+    def __init__(self, path, batch_size=200, flush_interval=0.5, maxsize=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._local = threading.local()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._conn().executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="delivery-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.drain)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_send(self, sid, to_number, template=None, content_sid=None, status="queued"):
+        if sid:
+            self._put(("send", (sid, normalize_number(to_number), template, content_sid, status, time.time(), time.time())))
+
+    def record_callback(self, data):
+        """Queues a Twilio status callback (form fields MessageSid, MessageStatus, To, ErrorCode)."""
+        sid = data.get("MessageSid") or data.get("SmsSid")
+        status = data.get("MessageStatus") or data.get("SmsStatus")
+        if not sid or not status:
+            return False
+        self._put(("status", (sid, normalize_number(data.get("To")), status, data.get("ErrorCode"), time.time())))
+        return True
+
+    def _write(self, batch):
+        sends = [args for kind, args in batch if kind == "send"]
+        statuses = [args for kind, args in batch if kind == "status"]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(RECORD_SEND_SQL, sends)
+            # Apply in arrival order so the rank guard sees earlier callbacks from this batch
+            for args in statuses:
+                conn.execute(RECORD_STATUS_SQL, args)
+            conn.executemany(
+                "INSERT INTO message_events (sid, status, error_code, received_at) VALUES (?, ?, ?, ?)",
+                [(sid, status, error_code, ts) for sid, _, status, error_code, ts in statuses],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.written += len(batch)
+
+    def _take_batch(self, timeout):
+        batch = [self._queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._take_batch(self.flush_interval)
+            except queue.Empty:
+                continue
+            try:
+                self._write(batch)
+            except sqlite3.Error:
+                log.exception("❌ Delivery batch write failed", extra={"records": len(batch)})
+                self.dropped += len(batch)
+
+    def drain(self):
+        """Writes whatever is still queued; called at exit."""
+        while True:
+            try:
+                batch = self._take_batch(0)
+            except queue.Empty:
+                return
+            self._write(batch)
+
+    def recent_for_number(self, number, limit=10):
+        """Last sends to number, newest first, with their latest status (uses messages_to_sent)."""
+        rows = self._conn().execute(
+            "SELECT sid, template, content_sid, status, error_code, sent_at, updated_at FROM messages "
+            "WHERE to_number = ? ORDER BY sent_at DESC LIMIT ?",
+            (normalize_number(number), int(limit)),
+        ).fetchall()
+        keys = ("sid", "template", "content_sid", "status", "error_code", "sent_at", "updated_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def events(self, sid):
+        rows = self._conn().execute(
+            "SELECT status, error_code, received_at FROM message_events WHERE sid = ? ORDER BY received_at", (sid,)
+        ).fetchall()
+        return [{"status": s, "error_code": e, "received_at": ts} for s, e, ts in rows]
+
+    def stats(self):
+        return {"pending": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
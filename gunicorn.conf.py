@@ -0,0 +1,92 @@
+"""
+Gunicorn server profile for app:app (see Procfile):
+
+    gunicorn app:app -c gunicorn.conf.py
+
+Startup:
+- The master imports the libraries once, and forked workers inherit them.
+  preload_app stays off. app.py starts writer threads and opens per-thread
+  SQLite connections at import, and neither survives a fork, so each worker
+  still builds the app itself.
+- Each worker opens keep-alive connections to Twilio, Pipedrive and the quote
+  API and loads the Content API catalog (app.warm_up) before it accepts a
+  request. /health answers 503 until then. The catalog load is cut off at
+  WARMUP_TIMEOUT and falls back to its snapshot.
+
+Shutdown (SIGTERM):
+- /health answers 503, the queue workers, scheduler and reconciler stop
+  claiming jobs, and gunicorn stops accepting connections.
+- In-flight requests get graceful_timeout to finish. It defaults above
+  REQUEST_DEADLINE_SECONDS, so a webhook's sends and field clears complete.
+- At worker exit, drain waits out the running background jobs in the time left.
+  Any job still running stays claimed in its SQLite store and is recovered by
+  the next process.
+
+Fork-to-ready and SIGTERM-to-exit times are logged per worker. They are also
+exported as worker_startup_seconds and worker_drain_seconds.
+"""
+import importlib
+import os
+import signal
+import sys
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Under gunicorn's timeout, which also covers a worker that hasn't started its loop
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+# Imported in the master; none of these start threads or open files at import
+PRELOAD_MODULES = [
+    "flask", "requests", "urllib3", "dotenv", "orjson",
+    "json_codec", "http_clients", "resilience", "structured_logging", "metrics", "cache", "dedup",
+    "rate_limit", "sender_pool", "template_registry", "content_templates", "work_queue", "broadcast",
+    "delivery_store", "write_coalescer", "vcard_links", "scheduler", "reconciler", "capture", "tracing",
+    "process_owner",
+]
+
+
+def on_starting(server):
+    started = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    server.log.info("Preloaded %d modules in %.3fs", len(PRELOAD_MODULES), time.perf_counter() - started)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # The app was imported by load_wsgi; hold the worker out of the accept loop until it's warm
+    import app
+
+    if not app.warmed_up.wait(WARMUP_TIMEOUT):
+        worker.log.warning("Worker %s not warm after %.0fs; serving anyway", worker.pid, WARMUP_TIMEOUT)
+    worker.log.info("Worker %s ready %.3fs after fork", worker.pid, time.perf_counter() - worker.forked_at)
+
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(sig, frame):
+        worker.drain_started = time.perf_counter()
+        app.begin_drain()
+        if callable(handle_exit):
+            handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get("app")
+    if app is None or not hasattr(app, "drain"):
+        return
+    drain_started = getattr(worker, "drain_started", None) or time.perf_counter()
+    # Leave a second for atexit flushes before the master's SIGKILL at graceful_timeout
+    app.drain(max(graceful_timeout - (time.perf_counter() - drain_started) - 1, 0))
+    worker.log.info("Worker %s exited %.3fs after SIGTERM", worker.pid, time.perf_counter() - drain_started)
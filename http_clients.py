@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+import json_codec
+from resilience import FailFast, bounded_timeout, current_send_attempt
+
+log = logging.getLogger("webhook.http")
+
+
+def encode_json_body(kwargs, body_arg):
+    """Serializes a json= body with json_codec (requests takes it as data=, httpx as content=)."""
+    if kwargs.get("json") is not None:
+        kwargs[body_arg] = json_codec.dumps_bytes(kwargs.pop("json"))
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "Content-Type": "application/json"}
+    return kwargs
+
+
+def mark_sending(creates):
+    """Marks the current SendAttempt before a creating call; returns (attempt, previous state) to undo it."""
+    attempt = current_send_attempt() if creates else None
+    if attempt is None:
+        return None, None
+    previous = attempt.may_have_sent
+    attempt.may_have_sent = True
+    return attempt, previous
+
+
+def never_connected(e):
+    """requests errors raised before the request could reach the upstream."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if isinstance(e, requests.ConnectionError) and e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class PoolStats:
+    """Counts connection checkouts that reused a live socket (hit) vs opened a new one (miss)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, reused):
+        with self._lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else None,
+            }
+
+
+def _counting_pool(base, stats):
+    class CountingPool(base):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            # A pooled connection with no socket (fresh or dropped) has to reconnect
+            stats.record(getattr(conn, "sock", None) is not None)
+            return conn
+
+    return CountingPool
+
+
+class CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class PooledClient:
+    """
+    Long-lived keep-alive session for one upstream host.
+
+    Paths starting with "/" are joined to base_url; absolute URLs are used as-is.
+    A default (connect, read) timeout is applied unless the caller passes one, and
+    is cut down to the time left before the current request's deadline. With a
+    breaker, calls fail fast (CircuitOpenError) while the upstream is unhealthy.
+    observer(call, seconds, status) is told about every request; call defaults to
+    "<name>_<method>" and can be set per request to tell call sites apart.
+    Calls that create something upstream pass creates=True, which marks the current
+    SendAttempt unless the request provably never arrived (no connection, or a 4xx).
+    """
+
+    def __init__(self, name, base_url, pool_maxsize=10, timeout=(3.05, 20), auth=None, headers=None, params=None,
+                 observer=None, breaker=None):
+        self.name = name
+        self.observer = observer
+        self.breaker = breaker
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.stats = PoolStats()
+
+        self.session = requests.Session()
+        if auth:
+            self.session.auth = auth
+        if headers:
+            self.session.headers.update(headers)
+        if params:
+            self.session.params.update(params)
+
+        adapter = CountingAdapter(self.stats, pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_maxsize = pool_maxsize
+
+    def url(self, path):
+        return self.base_url + path if path.startswith("/") else path
+
+    def request(self, method, path, call=None, creates=False, **kwargs):
+        call = call or f"{self.name}_{method.lower()}"
+        start = time.perf_counter()
+        status = "error"
+        # healthy stays None when the call ends without an upstream outcome (e.g. a TypeError
+        # encoding the body, or cancellation); the breaker's probe is still given back
+        admitted, healthy = False, None
+        try:
+            kwargs["timeout"] = bounded_timeout(kwargs.get("timeout", self.timeout), call)
+            if self.breaker:
+                self.breaker.before_call()
+                admitted = True
+            attempt, previous = mark_sending(creates)
+            try:
+                response = self.session.request(method, self.url(path), **encode_json_body(kwargs, "data"))
+            except requests.RequestException as e:
+                healthy = False
+                if attempt and never_connected(e):
+                    attempt.may_have_sent = previous
+                raise
+            status = response.status_code
+            if attempt and 400 <= status < 500:
+                attempt.may_have_sent = previous
+            healthy = status < 500
+            return response
+        except FailFast as e:
+            status = type(e).__name__
+            raise
+        finally:
+            if admitted:
+                if healthy is None:
+                    self.breaker.release()
+                else:
+                    self.breaker.record(healthy)
+            if self.observer:
+                self.observer(call, time.perf_counter() - start, status)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def warm(self, connections=1):
+        """
+        Opens up to `connections` keep-alive connections (TCP and TLS) to base_url
+        and leaves them in the pool, so the first requests skip the handshakes.
+        Returns how many were opened; failures are left for the first real request.
+        """
+        pool, checked_out, opened = None, [], 0
+        try:
+            # The same pool (keyed on TLS settings and proxy) that session.request will pick
+            settings = self.session.merge_environment_settings(self.base_url, {}, None, None, None)
+            prepared = self.session.prepare_request(requests.Request("GET", self.base_url))
+            pool = self.session.get_adapter(self.base_url).get_connection_with_tls_context(
+                prepared, settings["verify"], settings["proxies"], settings["cert"]
+            )
+            for _ in range(min(connections, self.pool_maxsize)):
+                conn = pool._get_conn()
+                checked_out.append(conn)
+                if getattr(conn, "sock", None) is None:
+                    conn.timeout = self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+                    conn.connect()
+                opened += 1
+        except Exception as e:
+            log.warning("⚠️ Connection warm-up failed: %s", e, extra={"upstream": self.name})
+        finally:
+            for conn in checked_out:
+                pool._put_conn(conn)
+        return opened
+
+    def pool_stats(self):
+        return {"pool_maxsize": self.pool_maxsize, **self.stats.snapshot()}
+
+
+class AsyncPooledClient:
+    """
+    PooledClient counterpart on httpx.AsyncClient, for the ASGI app. httpx is only
+    imported when one is created, so the WSGI app doesn't need it installed.
+    """
+
+    def __init__(self, name, base_url, pool_maxsize=100, timeout=(3.05, 20), auth=None, headers=None, params=None,
+                 observer=None, breaker=None):
+        import httpx
+
+        self._httpx = httpx
+        self.name = name
+        self.observer = observer
+        self.breaker = breaker
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            auth=auth if auth and all(auth) else None,
+            headers=headers,
+            params={k: v for k, v in (params or {}).items() if v is not None},
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+        )
+
+    async def request(self, method, path, call=None, creates=False, **kwargs):
+        call = call or f"{self.name}_{method.lower()}"
+        start = time.perf_counter()
+        status = "error"
+        admitted, healthy = False, None
+        try:
+            connect, read = bounded_timeout(self.timeout, call)
+            if self.breaker:
+                self.breaker.before_call()
+                admitted = True
+            attempt, previous = mark_sending(creates)
+            try:
+                response = await self.client.request(
+                    method, path, timeout=self._httpx.Timeout(read, connect=connect), **encode_json_body(kwargs, "content")
+                )
+            except self._httpx.HTTPError as e:
+                healthy = False
+                if attempt and isinstance(e, (self._httpx.ConnectError, self._httpx.ConnectTimeout)):
+                    attempt.may_have_sent = previous
+                raise
+            status = response.status_code
+            if attempt and 400 <= status < 500:
+                attempt.may_have_sent = previous
+            healthy = status < 500
+            return response
+        except FailFast as e:
+            status = type(e).__name__
+            raise
+        finally:
+            if admitted:
+                if healthy is None:
+                    self.breaker.release()
+                else:
+                    self.breaker.record(healthy)
+            if self.observer:
+                self.observer(call, time.perf_counter() - start, status)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path, **kwargs):
+        return await self.request("PUT", path, **kwargs)
+
+    async def warm(self, connections=1):
+        """
+        Opens up to `connections` keep-alive connections to base_url with concurrent
+        HEAD requests, as httpx can't open one without a request. Returns how many
+        were opened; failures are left for the first real request.
+        """
+        async def open_one():
+            try:
+                await self.client.head("/", timeout=self._httpx.Timeout(self.timeout[1], connect=self.timeout[0]))
+                return 1
+            except Exception as e:
+                log.warning("⚠️ Connection warm-up failed: %s", e, extra={"upstream": self.name})
+                return 0
+
+        return sum(await asyncio.gather(*(open_one() for _ in range(min(connections, self.pool_maxsize)))))
+
+    def pool_stats(self):
+        return {"pool_maxsize": self.pool_maxsize}
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,66 @@
+"""
+JSON encoding/decoding with orjson when it's installed and the stdlib otherwise.
+
+Everything that parses webhook bodies or builds JSON payloads goes through
+here: Flask/Quart request parsing and jsonify (via JSONCodecProvider), outbound
+request bodies, Twilio ContentVariables, activity notes, queue payloads and log
+lines. Values orjson can't encode (e.g. non-string dict keys) fall back to the
+stdlib rather than failing.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def dumps_bytes(obj, indent=False, sort_keys=False, default=None):
+    if orjson:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass
+    return dumps_stdlib(obj, indent, sort_keys, default).encode()
+
+
+def dumps(obj, indent=False, sort_keys=False, default=None):
+    if orjson:
+        return dumps_bytes(obj, indent, sort_keys, default).decode()
+    return dumps_stdlib(obj, indent, sort_keys, default)
+
+
+def dumps_stdlib(obj, indent=False, sort_keys=False, default=None):
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys, default=default, ensure_ascii=False)
+
+
+def loads(data):
+    """Accepts str or UTF-8 bytes."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONCodecProvider(DefaultJSONProvider):
+    """Flask/Quart JSON provider backed by this module; keeps Flask's sort_keys and default hooks."""
+
+    def dumps(self, obj, **kwargs):
+        extra = set(kwargs) - {"indent", "separators", "sort_keys", "default"}
+        if not orjson or extra:
+            return super().dumps(obj, **kwargs)
+        return dumps(
+            obj,
+            indent=bool(kwargs.get("indent")),
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            default=kwargs.get("default", self.default),
+        )
+
+    def loads(self, s, **kwargs):
+        if not orjson or kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
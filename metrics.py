@@ -0,0 +1,230 @@
+"""
+Small Prometheus-style metrics registry that works across gunicorn workers.
+
+Every process keeps its own counters, gauges and histograms in memory (a lock
+and a dict update per observation). A background thread writes a snapshot to
+<metrics_dir>/metrics_<pid>.json about once a second, and /metrics merges the
+snapshots of all processes: counters and histograms from every file (dead
+workers included, so totals don't go backwards), gauges from live workers only.
+"""
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+log = logging.getLogger("webhook.metrics")
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    def __init__(self, metrics_dir=None, flush_interval=1.0):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._meta = {}      # name -> (type, help, buckets)
+        self._values = {}    # name -> {label_key: value | [bucket_counts..., sum, count]}
+        self._dirty = False
+        self._pid = None
+        self._flusher = None
+
+    # -- definitions -------------------------------------------------------
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+        self._values.setdefault(name, {})
+
+    def gauge(self, name, help_text):
+        self._meta[name] = ("gauge", help_text, None)
+        self._values.setdefault(name, {})
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+        self._values.setdefault(name, {})
+
+    # -- hot path ----------------------------------------------------------
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + amount
+            self._dirty = True
+        self._ensure_flusher()
+
+    def dec(self, name, amount=1, **labels):
+        self.inc(name, -amount, **labels)
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [0] * (len(buckets) + 2)
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+            self._dirty = True
+        self._ensure_flusher()
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    # -- multi-process snapshots ------------------------------------------
+
+    def _snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return {
+                name: [[list(key), value if not isinstance(value, list) else list(value)] for key, value in series.items()]
+                for name, series in self._values.items()
+            }
+
+    def _ensure_flusher(self):
+        # Started lazily (and again after a fork) so each worker flushes its own file
+        if not self.metrics_dir or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked child: drop the parent's numbers, they're in the parent's file
+                for series in self._values.values():
+                    series.clear()
+            self._pid = os.getpid()
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _path(self, pid):
+        return os.path.join(self.metrics_dir, f"metrics_{pid}.json")
+
+    def flush(self):
+        if not self.metrics_dir or not self._dirty:
+            return
+        snapshot = self._snapshot()
+        path = self._path(os.getpid())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                log.warning("⚠️ Metrics flush failed: %s", e)
+
+    def _collect(self):
+        """Merged {name: {label_key: value}} across this process and every snapshot file."""
+        own_pid = os.getpid()
+        merged = {name: {} for name in self._meta}
+
+        def add(name, key, value):
+            if name not in merged:
+                return
+            series = merged[name]
+            if isinstance(value, list):
+                current = series.get(key)
+                series[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                series[key] = series.get(key, 0) + value
+
+        if self.metrics_dir and os.path.isdir(self.metrics_dir):
+            for filename in os.listdir(self.metrics_dir):
+                if not (filename.startswith("metrics_") and filename.endswith(".json")):
+                    continue
+                pid = int(filename[len("metrics_"):-len(".json")])
+                if pid == own_pid:
+                    continue
+                live = _pid_alive(pid)
+                try:
+                    with open(os.path.join(self.metrics_dir, filename)) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for name, series in snapshot.items():
+                    if self._meta.get(name, ("",))[0] == "gauge" and not live:
+                        continue
+                    for key, value in series:
+                        add(name, tuple(tuple(pair) for pair in key), value)
+
+        with self._lock:
+            for name, series in self._values.items():
+                for key, value in series.items():
+                    add(name, key, list(value) if isinstance(value, list) else value)
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, series in self._collect().items():
+            kind, help_text, buckets = self._meta[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value[-2]}")
+                lines.append(f"{name}_count{_format_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def default_metrics_dir():
+    # Gunicorn workers share the master's pid as parent, so each deploy gets its own directory
+    return os.getenv("METRICS_DIR") or os.path.join(tempfile.gettempdir(), f"front-twilio-metrics-{os.getppid()}")
@@ -0,0 +1,58 @@
+"""
+Which process owns a claimed row in the node's shared SQLite stores.
+
+A bare PID can't tell a live owner from a dead one: PIDs are reused, and in a
+container every restart hands out the same low PIDs, so a fresh worker can look
+like the owner of the jobs its predecessor died holding. Claims record a token
+of the PID plus that process's start time instead, and an owner only counts as
+alive while a process with that PID and that start time exists.
+"""
+import os
+
+_token = (None, None)  # (pid, token), recomputed after a fork
+
+
+def _start_time(pid):
+    """Start time of pid in clock ticks since boot (/proc), or None where that isn't available."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 2 (comm) is parenthesized and may hold spaces; starttime is field 22
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def owner_token():
+    """'<pid>:<start time>' for this process ('<pid>' without /proc)."""
+    global _token
+    pid = os.getpid()
+    if _token[0] != pid:
+        start = _start_time(pid)
+        _token = (pid, f"{pid}:{start}" if start else str(pid))
+    return _token[1]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def owner_alive(token):
+    """Whether the process that wrote token is still running. Bare PIDs (older rows) get a PID check only."""
+    if not token:
+        return False
+    pid, _, start = str(token).partition(":")
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    if not _pid_alive(pid):
+        return False
+    # A token with a start time was written where /proc exists, so a missing entry means gone
+    return not start or _start_time(pid) == start
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+
+class SenderRateLimiter:
+    """
+    Token-bucket pacing per sender key (GCRA form). Each acquire() reserves the next
+    free slot and sleeps until it, so senders over their rate are queued in arrival
+    order instead of being rejected.
+
+    With a path, bucket state lives in SQLite and the rate is shared by every
+    worker process on the node; without one it is per process.
+    """
+
+    def __init__(self, rate, burst=1, path=None):
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self.path = path
+        self._interval = 1.0 / self.rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = defaultdict(lambda: {
+            "waiting": 0, "max_waiting": 0, "sent": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            "throttled": 0, "retries": 0,
+        })
+        if path:
+            self._conn().execute("CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _reserve(self, key, now):
+        """Returns how long to wait before sending, and books that slot."""
+        if not self.path:
+            with self._lock:
+                tat = max(self._tat.get(key, now), now)
+                self._tat[key] = tat + self._interval
+            return max(0.0, tat - self._tolerance - now)
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tat FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tat = max(row[0] if row else now, now)
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tat) VALUES (?, ?)", (key, tat + self._interval))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return max(0.0, tat - self._tolerance - now)
+
+    def acquire(self, key):
+        """Blocks until key may send; returns the seconds spent waiting."""
+        wait = self._reserve(key, time.time())
+        self._begin_wait(key)
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            self._end_wait(key, wait)
+        return wait
+
+    async def acquire_async(self, key):
+        """acquire() for the ASGI app: waits on the event loop instead of blocking a thread."""
+        if self.path:
+            # BEGIN IMMEDIATE can wait on other processes for the lock; keep that off the loop
+            wait = await asyncio.to_thread(self._reserve, key, time.time())
+        else:
+            wait = self._reserve(key, time.time())
+        self._begin_wait(key)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._end_wait(key, wait)
+        return wait
+
+    def _begin_wait(self, key):
+        with self._lock:
+            stats = self._stats[key]
+            stats["waiting"] += 1
+            stats["max_waiting"] = max(stats["max_waiting"], stats["waiting"])
+
+    def _end_wait(self, key, wait):
+        with self._lock:
+            stats = self._stats[key]
+            stats["waiting"] -= 1
+            stats["sent"] += 1
+            stats["wait_seconds"] += wait
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+
+    def record_throttled(self, key, retried):
+        with self._lock:
+            self._stats[key]["throttled"] += 1
+            if retried:
+                self._stats[key]["retries"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                key: {**s, "wait_seconds": round(s["wait_seconds"], 3), "max_wait_seconds": round(s["max_wait_seconds"], 3)}
+                for key, s in self._stats.items()
+            }
+
+
+def retry_after_seconds(response, attempt, cap=60):
+    """Honours a Retry-After header (in seconds) and falls back to exponential backoff."""
+    header = response.headers.get("Retry-After")
+    try:
+        return min(float(header), cap)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, cap)
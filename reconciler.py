@@ -0,0 +1,244 @@
+"""
+Catches template fields whose webhook never arrived.
+
+Pipedrive drops webhooks it can't deliver, leaving a template field populated
+but never sent. The reconciler pages through persons with the cursor-based
+/v1/persons/collection endpoint (up to 500 per call, custom fields inline), and
+hands every person with a template field still set to the normal pipeline.
+
+The cursor is saved after each page, so a restart continues mid-pass. Each
+finished pass records when it started, and the next pass asks only for persons
+updated since then (minus an overlap). A lease in the same SQLite file keeps
+one worker process polling at a time.
+
+With no stored window, the first pass only covers persons updated in the last
+`overlap` seconds. A full first pass (full_first_pass) would hand every person
+whose field was never cleared back to the pipeline, including ones whose send
+was attempted with an unknown outcome and whose dedup key has since expired,
+so it can send those twice and is opt-in.
+"""
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+import json_codec
+from process_owner import owner_token
+
+log = logging.getLogger("webhook.reconcile")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reconcile_state (
+    name TEXT PRIMARY KEY,
+    cursor TEXT,
+    since REAL,
+    pass_started_at REAL,
+    owner_pid INTEGER,  -- process_owner token ("pid:start"), despite the name
+    lease_until REAL,
+    last_pass_at REAL,
+    persons_seen INTEGER NOT NULL DEFAULT 0,
+    persons_sent INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+COLLECTION_PATH = "/v1/persons/collection"
+PIPEDRIVE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_update_time(value):
+    """Pipedrive's 'YYYY-MM-DD HH:MM:SS' (UTC), or ISO-8601; None when missing or unparseable."""
+    if not value:
+        return None
+    try:
+        when = datetime.datetime.strptime(value, PIPEDRIVE_TIME_FORMAT)
+    except ValueError:
+        try:
+            when = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+
+def format_since(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(PIPEDRIVE_TIME_FORMAT)
+
+
+class Reconciler:
+    """
+    process(person, custom_fields) runs the template pipeline for one person, where
+    custom_fields holds only its populated template fields ({field_id: {"value": ...}},
+    the webhook shape); it returns True if anything was sent.
+    """
+
+    def __init__(self, client, path, field_ids, process, interval=300, page_size=500, min_age=120,
+                 overlap=300, lease_seconds=900, name="persons", full_first_pass=False):
+        self.client = client
+        self.path = path
+        self.field_ids = list(field_ids)
+        self.process = process
+        self.interval = interval
+        self.page_size = page_size
+        self.min_age = min_age
+        # Persons skipped as too fresh must fall inside the next pass's window
+        self.overlap = max(overlap, min_age)
+        self.lease_seconds = lease_seconds
+        self.name = name
+        self.full_first_pass = full_first_pass
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO reconcile_state (name) VALUES (?)", (name,))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _acquire_lease(self):
+        conn = self._conn()
+        now = time.time()
+        cur = conn.execute(
+            "UPDATE reconcile_state SET owner_pid = ?, lease_until = ? "
+            "WHERE name = ? AND (owner_pid IS NULL OR owner_pid = ? OR lease_until < ?)",
+            (owner_token(), now + self.lease_seconds, self.name, owner_token(), now),
+        )
+        return bool(cur.rowcount)
+
+    def _release_lease(self):
+        self._conn().execute(
+            "UPDATE reconcile_state SET owner_pid = NULL, lease_until = NULL WHERE name = ? AND owner_pid = ?",
+            (self.name, owner_token()),
+        )
+
+    def _state(self):
+        return self._conn().execute(
+            "SELECT cursor, since, pass_started_at FROM reconcile_state WHERE name = ?", (self.name,)
+        ).fetchone()
+
+    def pending_fields(self, person):
+        """The person's template fields that still hold a value, in webhook shape."""
+        fields = {}
+        for field_id in self.field_ids:
+            value = person.get(field_id)
+            if isinstance(value, dict):
+                value = value.get("value")
+            if value is not None and str(value).strip():
+                fields[field_id] = {"value": str(value)}
+        return fields
+
+    def fetch_page(self, cursor, since):
+        params = {"limit": self.page_size}
+        if cursor:
+            params["cursor"] = cursor
+        if since:
+            params["since"] = format_since(since)
+        resp = self.client.get(COLLECTION_PATH, call="pipedrive_persons_collection", params=params)
+        resp.raise_for_status()
+        body = json_codec.loads(resp.content)
+        return body.get("data") or [], (body.get("additional_data") or {}).get("next_cursor")
+
+    def run_pass(self, max_pages=None):
+        """
+        Reads pages until the collection is exhausted (or max_pages), saving the cursor
+        after each. Returns a summary, or None when another process holds the lease.
+        """
+        if not self._acquire_lease():
+            return None
+        conn = self._conn()
+        summary = {"pages": 0, "persons": 0, "pending": 0, "sent": 0, "skipped_recent": 0, "complete": False}
+        try:
+            cursor, since, pass_started_at = self._state()
+            if not cursor:
+                pass_started_at = time.time()
+                if since is None and not self.full_first_pass:
+                    since = pass_started_at - self.overlap
+                conn.execute("UPDATE reconcile_state SET pass_started_at = ?, since = ? WHERE name = ?",
+                             (pass_started_at, since, self.name))
+
+            while max_pages is None or summary["pages"] < max_pages:
+                if self._stop.is_set():
+                    break
+                persons, next_cursor = self.fetch_page(cursor, since)
+                summary["pages"] += 1
+                summary["persons"] += len(persons)
+                fresh_after = time.time() - self.min_age
+                page_sent = 0
+                for person in persons:
+                    fields = self.pending_fields(person)
+                    if not fields:
+                        continue
+                    updated = parse_update_time(person.get("update_time"))
+                    if updated and updated > fresh_after:
+                        # Its webhook is probably still on the way; the next pass's window covers it
+                        summary["skipped_recent"] += 1
+                        continue
+                    summary["pending"] += 1
+                    try:
+                        if self.process(person, fields):
+                            page_sent += 1
+                    except Exception:
+                        log.exception("❌ Reconcile failed for person", extra={"person_id": person.get("id")})
+
+                summary["sent"] += page_sent
+                cursor = next_cursor
+                conn.execute(
+                    "UPDATE reconcile_state SET cursor = ?, lease_until = ?, pages = pages + 1, "
+                    "persons_seen = persons_seen + ?, persons_sent = persons_sent + ? WHERE name = ?",
+                    (cursor, time.time() + self.lease_seconds, len(persons), page_sent, self.name),
+                )
+                if not cursor:
+                    summary["complete"] = True
+                    conn.execute(
+                        "UPDATE reconcile_state SET since = ?, last_pass_at = ? WHERE name = ?",
+                        (pass_started_at - self.overlap, time.time(), self.name),
+                    )
+                    break
+        finally:
+            self._release_lease()
+
+        log.info("🔎 Reconcile pass", extra=summary)
+        return summary
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        return not (self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_pass()
+            except Exception as e:
+                # The saved cursor is kept; the next run resumes from it
+                log.warning("⚠️ Reconcile pass failed: %s", e)
+                self._release_lease()
+
+    def stats(self):
+        row = self._conn().execute(
+            "SELECT cursor, since, last_pass_at, persons_seen, persons_sent, pages FROM reconcile_state WHERE name = ?",
+            (self.name,),
+        ).fetchone()
+        cursor, since, last_pass_at, persons_seen, persons_sent, pages = row
+        return {
+            "in_pass": bool(cursor),
+            "since": format_since(since) if since else None,
+            "last_pass_at": format_since(last_pass_at) if last_pass_at else None,
+            "persons_seen": persons_seen,
+            "persons_sent": persons_sent,
+            "pages": pages,
+        }
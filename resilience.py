@@ -0,0 +1,142 @@
+"""
+Request deadlines, per-upstream circuit breakers, and tracking whether a send
+may have reached its upstream.
+
+A deadline is set once per inbound request and carried in a ContextVar (so it
+follows fan-out tasks that copy the context); each outbound call gets whatever
+time is left, capped by its client's own timeout. A breaker opens after
+failure_threshold consecutive failures (connection errors, timeouts, 5xx) and
+fails calls fast until reset_timeout has passed, then lets one probe through.
+
+A SendAttempt (track_send) records whether a call that creates something upstream
+(a Twilio message, a quote) may have been received. If a failure happens before
+that, the work can be replayed. After it, for example a read timeout on the POST,
+a replay could send the message twice.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+_send_attempt = contextvars.ContextVar("send_attempt", default=None)
+
+
+class FailFast(Exception):
+    """An upstream call that was not attempted; the work can be retried later."""
+
+
+class CircuitOpenError(FailFast):
+    pass
+
+
+class DeadlineExceeded(FailFast):
+    pass
+
+
+def start_deadline(seconds):
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def clear_deadline():
+    _deadline.set(None)
+
+
+def remaining_time():
+    """Seconds left before the current request's deadline, or None when there isn't one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded_timeout(timeout, call):
+    """Caps a (connect, read) timeout at the time left; raises DeadlineExceeded when none is."""
+    left = remaining_time()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded(f"{call}: request deadline exceeded")
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    return min(connect, left), min(read, left)
+
+
+class SendAttempt:
+    def __init__(self):
+        self.may_have_sent = False
+
+
+@contextmanager
+def track_send():
+    """
+    Scope for one logical send; clients mark it from calls made with creates=True.
+    A nested scope passes its mark on to the enclosing one when it exits.
+    """
+    parent = _send_attempt.get()
+    attempt = SendAttempt()
+    token = _send_attempt.set(attempt)
+    try:
+        yield attempt
+    finally:
+        _send_attempt.reset(token)
+        if parent is not None and attempt.may_have_sent:
+            parent.may_have_sent = True
+
+
+def current_send_attempt():
+    return _send_attempt.get()
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._opened = 0
+
+    def before_call(self):
+        with self._lock:
+            if self._state == "closed":
+                return
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit open")
+
+    def release(self):
+        """Ends an admitted call with no upstream outcome (e.g. cancelled), so the half-open probe is freed."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success):
+        with self._lock:
+            self._probe_in_flight = False
+            if success:
+                self._state = "closed"
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._opened += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            state = self._state
+            if state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                state = "half_open"
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._opened,
+                "rejected": self._rejected,
+            }
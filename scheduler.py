@@ -0,0 +1,301 @@
+"""
+Scheduled and delayed template sends.
+
+Sends live in a SQLite timer table ordered by an index on (status, due_at), so
+the scheduler only ever reads the head of the queue. A send is either due at a
+fixed time, or 'waiting' for another template to go out to the same person
+(e.g. quote_followup 24h after quote_amount) and becomes due then.
+
+Each send is claimed atomically and marked 'firing' before the message goes
+out. After a crash, claimed-but-unfired rows go back to pending, but rows that
+were firing are parked as 'interrupted' and never retried. On stop(), claimed
+sends that haven't started firing go straight back to pending. A claim's lease is
+renewed before waiting for the pacer, and the move to 'firing' only happens while
+this process still holds the claim, so a send recovered by another process in
+the meantime is skipped here. A scheduled send is never fired twice. Sends due at the same moment are paced through a shared
+token bucket rather than all going out in one burst.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+import json_codec
+from process_owner import owner_alive, owner_token
+from rate_limit import SenderRateLimiter
+from resilience import track_send
+
+log = logging.getLogger("webhook.scheduler")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled_sends (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE,
+    template TEXT NOT NULL,
+    person_id TEXT,
+    phone TEXT,
+    variables TEXT,
+    value TEXT,
+    status TEXT NOT NULL,
+    due_at REAL,
+    after_template TEXT,
+    delay_seconds REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,  -- process_owner token ("pid:start"), despite the name
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    fired_at REAL
+);
+CREATE INDEX IF NOT EXISTS scheduled_due ON scheduled_sends (status, due_at);
+CREATE INDEX IF NOT EXISTS scheduled_waiting ON scheduled_sends (person_id, after_template, status);
+"""
+
+COLUMNS = ("id", "key", "template", "person_id", "phone", "variables", "value", "status", "due_at",
+           "after_template", "delay_seconds", "attempts", "last_error", "created_at", "fired_at")
+
+
+class SendScheduler:
+    """
+    fire(send) is called for each due send and returns (outcome, detail) where
+    outcome is 'sent', 'failed' (final) or 'retry' (not sent; try again later).
+    """
+
+    def __init__(self, path, fire, rate=5, poll_interval=1.0, batch_size=50, lease_seconds=300, max_attempts=5,
+                 recover_interval=30):
+        self.path = path
+        self.fire = fire
+        self.poll_interval = poll_interval
+        self.recover_interval = recover_interval
+        self._recovered_at = 0.0
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Shared through SQLite, so the budget holds across every worker process
+        self.pacer = SenderRateLimiter(rate, burst=1, path=path)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn().executescript(SCHEMA)
+        self.recover()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def schedule(self, template, due_at=None, after_template=None, delay_seconds=0, person_id=None, phone=None,
+                 variables=None, value=None, key=None):
+        """
+        Adds a send due at due_at, or delay_seconds after after_template is next sent
+        to person_id. Returns (id, created); an existing key returns its id unchanged.
+        """
+        if after_template and not person_id:
+            raise ValueError("after_template needs a person_id")
+        status = "waiting" if after_template else "pending"
+        if status == "pending" and due_at is None:
+            due_at = time.time() + delay_seconds
+
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO scheduled_sends (key, template, person_id, phone, variables, value, status, due_at, "
+            "after_template, delay_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO NOTHING",
+            (key, template, str(person_id) if person_id else None, phone,
+             json_codec.dumps(variables) if variables else None, value, status, due_at,
+             after_template, delay_seconds, time.time()),
+        )
+        if cur.rowcount:
+            self._wakeup.set()
+            return cur.lastrowid, True
+        return conn.execute("SELECT id FROM scheduled_sends WHERE key = ?", (key,)).fetchone()[0], False
+
+    def template_sent(self, person_id, template, sent_at=None):
+        """Starts the clock on sends waiting for template to go out to person_id."""
+        cur = self._conn().execute(
+            "UPDATE scheduled_sends SET status = 'pending', due_at = ? + delay_seconds "
+            "WHERE person_id = ? AND after_template = ? AND status = 'waiting'",
+            (sent_at or time.time(), str(person_id), template),
+        )
+        if cur.rowcount:
+            log.info("⏰ Follow-ups armed", extra={"person_id": person_id, "after": template, "count": cur.rowcount})
+        return cur.rowcount
+
+    def cancel(self, send_id):
+        cur = self._conn().execute(
+            "UPDATE scheduled_sends SET status = 'canceled' WHERE id = ? AND status IN ('waiting', 'pending')", (send_id,)
+        )
+        return bool(cur.rowcount)
+
+    def get(self, send_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM scheduled_sends WHERE id = ?", (send_id,)
+        ).fetchone()
+        if not row:
+            return None
+        send = dict(zip(COLUMNS, row))
+        send["variables"] = json_codec.loads(send["variables"]) if send["variables"] else None
+        return send
+
+    def recover(self):
+        """Claimed rows of dead processes go back to pending; rows caught mid-send are never refired."""
+        conn = self._conn()
+        now = time.time()
+        self._recovered_at = now
+        rows = conn.execute(
+            "SELECT id, status, owner_pid, lease_until FROM scheduled_sends WHERE status IN ('claimed', 'firing')"
+        ).fetchall()
+        requeued = interrupted = 0
+        for send_id, status, owner, lease_until in rows:
+            if owner_alive(owner) and (lease_until or 0) >= now:
+                continue
+            if status == "claimed":
+                conn.execute(
+                    "UPDATE scheduled_sends SET status = 'pending', owner_pid = NULL, lease_until = NULL "
+                    "WHERE id = ? AND status = 'claimed'", (send_id,)
+                )
+                requeued += 1
+            else:
+                conn.execute(
+                    "UPDATE scheduled_sends SET status = 'interrupted', owner_pid = NULL, lease_until = NULL "
+                    "WHERE id = ? AND status = 'firing'", (send_id,)
+                )
+                interrupted += 1
+        if requeued or interrupted:
+            log.warning("♻️ Recovered scheduled sends", extra={"requeued": requeued, "interrupted": interrupted})
+        return requeued, interrupted
+
+    def claim_due(self, now=None, limit=None):
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM scheduled_sends WHERE status = 'pending' AND due_at <= ? "
+                "ORDER BY due_at LIMIT ?",
+                (now, limit or self.batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE scheduled_sends SET status = 'claimed', owner_pid = ?, lease_until = ? WHERE id = ?",
+                [(owner_token(), now + self.lease_seconds, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        sends = [dict(zip(COLUMNS, row)) for row in rows]
+        for send in sends:
+            send["variables"] = json_codec.loads(send["variables"]) if send["variables"] else None
+        return sends
+
+    def _set(self, send_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._conn().execute(f"UPDATE scheduled_sends SET {assignments} WHERE id = ?", (*fields.values(), send_id))
+
+    def release(self, sends):
+        """Returns claimed sends that were never fired to pending, for any worker to pick up."""
+        self._conn().executemany(
+            "UPDATE scheduled_sends SET status = 'pending', owner_pid = NULL, lease_until = NULL "
+            "WHERE id = ? AND status = 'claimed' AND owner_pid = ?",
+            [(send["id"], owner_token()) for send in sends],
+        )
+
+    def _hold(self, send_id, status):
+        """Renews the lease (and sets status) only if this process still holds the claim."""
+        cursor = self._conn().execute(
+            "UPDATE scheduled_sends SET status = ?, lease_until = ? "
+            "WHERE id = ? AND status = 'claimed' AND owner_pid = ?",
+            (status, time.time() + self.lease_seconds, send_id, owner_token()),
+        )
+        return cursor.rowcount == 1
+
+    def _fire_one(self, send):
+        """
+        Fires one claimed send. Returns 'fired', 'lost' if another process recovered
+        the claim first, or 'stopped', leaving it claimed, if stop() came while
+        waiting for the pacer.
+        """
+        # The shared pacer can keep a batch waiting past the lease taken by claim_due
+        if not self._hold(send["id"], "claimed"):
+            log.warning("⚠️ Scheduled send claim lost", extra={"send_id": send["id"]})
+            return "lost"
+        self.pacer.acquire("scheduled")
+        if self._stop.is_set():
+            return "stopped"
+        if not self._hold(send["id"], "firing"):
+            log.warning("⚠️ Scheduled send claim lost", extra={"send_id": send["id"]})
+            return "lost"
+        with track_send() as attempt:
+            try:
+                outcome, detail = self.fire(send)
+            except Exception as e:
+                log.exception("❌ Scheduled send raised", extra={"send_id": send["id"]})
+                # Only a send that provably never left can be retried
+                outcome, detail = ("failed" if attempt.may_have_sent else "retry"), str(e)
+
+        attempts = send["attempts"] + 1
+        if outcome == "sent":
+            self._set(send["id"], status="sent", fired_at=time.time(), attempts=attempts, last_error=None,
+                      owner_pid=None, lease_until=None)
+        elif outcome == "retry" and attempts < self.max_attempts:
+            self._set(send["id"], status="pending", due_at=time.time() + min(30 * 2 ** attempts, 3600),
+                      attempts=attempts, last_error=detail, owner_pid=None, lease_until=None)
+        else:
+            self._set(send["id"], status="failed", attempts=attempts, last_error=detail, owner_pid=None,
+                      lease_until=None)
+        log.info("⏰ Scheduled send", extra={"send_id": send["id"], "template": send["template"], "outcome": outcome})
+        return "fired"
+
+    def run_due(self):
+        """Fires everything due now, one pacer slot apart; returns how many were fired."""
+        fired = 0
+        while not self._stop.is_set():
+            sends = self.claim_due()
+            if not sends:
+                break
+            for i, send in enumerate(sends):
+                # Checked per send: a batch paced at `rate` can outlast the drain window
+                result = "stopped" if self._stop.is_set() else self._fire_one(send)
+                if result == "stopped":
+                    self.release(sends[i:])
+                    return fired
+                fired += result == "fired"
+        return fired
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="send-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        return not (self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_due()
+                # Picks up sends another process died holding after this one started
+                if time.time() - self._recovered_at >= self.recover_interval:
+                    self.recover()
+            except sqlite3.Error as e:
+                log.warning("⚠️ Scheduler tick failed: %s", e)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def stats(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM scheduled_sends GROUP BY status").fetchall()
+        counts = {"waiting": 0, "pending": 0, "sent": 0, "failed": 0, "interrupted": 0}
+        counts.update(dict(rows))
+        next_due = self._conn().execute(
+            "SELECT MIN(due_at) FROM scheduled_sends WHERE status = 'pending'"
+        ).fetchone()[0]
+        counts["next_due_in"] = round(next_due - time.time(), 1) if next_due else None
+        return counts
@@ -0,0 +1,160 @@
+"""
+A pool of WhatsApp sender numbers.
+
+Recipients are mapped to senders on a consistent-hash ring (with virtual
+nodes), so a conversation stays on one number and adding a number only moves
+the recipients that land on it. Each sender tracks its own sends, errors and
+recent throughput. A sender that keeps failing is taken out of rotation for a
+cooldown; its recipients move to the next sender on the ring meanwhile, and
+return once the cooldown has passed.
+
+Two kinds of failure feed a sender's health:
+- Rejections in the send response (429, 2160x) are seen at POST time, and the
+  send can fail over to another sender right away.
+- Most 63xxx errors only arrive later in a status callback. By then the message
+  is lost, so those failures don't fail over. A sender with failure_threshold
+  of them within the window is put on cooldown.
+"""
+import bisect
+import hashlib
+import threading
+import time
+from collections import deque
+
+# Twilio errors that are about the From number or its WhatsApp channel, not the
+# recipient. The 2xxxx codes come back from the send; the 63xxx ones mostly
+# arrive in status callbacks (record_delivery_failure).
+SENDER_ERROR_CODES = {
+    21606,  # From number is not a valid, message-capable number
+    21608,  # Unverified From number (trial accounts)
+    21659,  # From is not a Twilio number on this account
+    63007,  # No WhatsApp channel for the From address
+    63018,  # WhatsApp rate limit exceeded for the sender
+    63023,  # Sender's messaging tier limit reached
+    63038,  # Account's daily messages limit reached
+    63112,  # Meta disabled the sender's business account
+}
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class SenderPool:
+    def __init__(self, numbers, vnodes=100, failure_threshold=3, cooldown=60, window=60):
+        self.numbers = list(dict.fromkeys(n.strip() for n in numbers if n and n.strip()))
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self._ring = sorted((_hash(f"{number}#{i}"), number) for number in self.numbers for i in range(vnodes))
+        self._hashes = [h for h, _ in self._ring]
+        self._lock = threading.Lock()
+        self._senders = {
+            number: {"sent": 0, "errors": 0, "failovers": 0, "consecutive_failures": 0, "down_until": 0.0,
+                     "last_error": None, "recent": deque(), "callback_failures": deque()}
+            for number in self.numbers
+        }
+
+    def candidates(self, recipient):
+        """Every sender in ring order from the recipient's point; the first is its home sender."""
+        if not self._ring:
+            return []
+        order, seen = [], set()
+        start = bisect.bisect(self._hashes, _hash(recipient))
+        for i in range(len(self._ring)):
+            number = self._ring[(start + i) % len(self._ring)][1]
+            if number not in seen:
+                seen.add(number)
+                order.append(number)
+                if len(order) == len(self.numbers):
+                    break
+        return order
+
+    def route(self, recipient):
+        """Senders to try for recipient: healthy ones in ring order, then the rest as a last resort."""
+        now = time.monotonic()
+        order = self.candidates(recipient)
+        with self._lock:
+            healthy = [n for n in order if self._senders[n]["down_until"] <= now]
+        return healthy + [n for n in order if n not in healthy]
+
+    def sender_for(self, recipient):
+        route = self.route(recipient)
+        return route[0] if route else None
+
+    def record(self, sender, status_code, error_code=None):
+        """
+        Tracks the outcome of one send from sender. Returns True when the message was
+        rejected because of the sender and can safely be retried from another one.
+        """
+        stats = self._senders.get(sender)
+        if stats is None:
+            return False
+        now = time.monotonic()
+        sender_fault = status_code == 429 or error_code in SENDER_ERROR_CODES
+        with self._lock:
+            if status_code < 400:
+                stats["sent"] += 1
+                stats["consecutive_failures"] = 0
+                stats["down_until"] = 0.0
+                stats["recent"].append(now)
+                while stats["recent"] and stats["recent"][0] < now - self.window:
+                    stats["recent"].popleft()
+                return False
+
+            # Recipient errors (bad number, closed session window) say nothing about the sender
+            if not sender_fault and status_code < 500:
+                return False
+            stats["errors"] += 1
+            stats["consecutive_failures"] += 1
+            stats["last_error"] = error_code or status_code
+            if stats["consecutive_failures"] >= self.failure_threshold:
+                stats["down_until"] = now + self.cooldown
+            if sender_fault:
+                stats["failovers"] += 1
+        return sender_fault
+
+    def record_delivery_failure(self, sender, error_code):
+        """
+        Tracks a failed/undelivered status callback for a message sent from sender.
+        Returns True when the error was the sender's and it has been put on cooldown.
+        """
+        stats = self._senders.get(sender)
+        try:
+            error_code = int(error_code)
+        except (TypeError, ValueError):
+            return False
+        if stats is None or error_code not in SENDER_ERROR_CODES:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            stats["errors"] += 1
+            stats["last_error"] = error_code
+            failures = stats["callback_failures"]
+            failures.append(now)
+            while failures and failures[0] < now - self.window:
+                failures.popleft()
+            # Sends keep succeeding at POST time, so consecutive_failures can't see these
+            if len(failures) >= self.failure_threshold:
+                stats["down_until"] = now + self.cooldown
+                failures.clear()
+                return True
+        return False
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                number: {
+                    "healthy": s["down_until"] <= now,
+                    "sent": s["sent"],
+                    "errors": s["errors"],
+                    "failovers": s["failovers"],
+                    "consecutive_failures": s["consecutive_failures"],
+                    "last_error": s["last_error"],
+                    "sends_per_minute": round(
+                        sum(1 for t in s["recent"] if t >= now - self.window) * 60 / self.window, 1
+                    ),
+                }
+                for number, s in self._senders.items()
+            }
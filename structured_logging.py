@@ -0,0 +1,157 @@
+"""
+Non-blocking JSON-lines logging.
+
+Handlers only put the record on an in-memory queue, along with the current
+request context (request_id, person_id, template, route). A background thread
+formats, redacts and writes records in batches, one stdout write per batch.
+If the queue is full the record is dropped and counted; logging never blocks
+a request.
+"""
+import atexit
+import contextvars
+import datetime
+import itertools
+import logging
+import queue
+import re
+import sys
+import threading
+
+import json_codec
+
+_context = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "ctx"}
+
+_SECRET_PARAMS = re.compile(r"((?:api_token|token|auth_token|api_key)=)[^&\s\"']+", re.IGNORECASE)
+
+
+def bind(**fields):
+    """Adds fields to the log context of the current request/thread."""
+    _context.set({**_context.get(), **fields})
+
+
+def reset_context(**fields):
+    _context.set(dict(fields))
+
+
+def current_context():
+    return _context.get()
+
+
+class Redactor:
+    def __init__(self, secrets=()):
+        self.secrets = [s for s in secrets if s and len(s) >= 6]
+
+    def __call__(self, text):
+        text = _SECRET_PARAMS.sub(r"\1[REDACTED]", text)
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, "[REDACTED]")
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps 1 in N records from noisy routes (e.g. "/" and "/health"); warnings always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._counters = {route: itertools.count() for route in rates}
+
+    def filter(self, record):
+        route = getattr(record, "ctx", {}).get("route")
+        rate = self.rates.get(route)
+        if not rate or rate <= 1 or record.levelno >= logging.WARNING:
+            return True
+        return next(self._counters[route]) % rate == 0
+
+
+class AsyncBatchHandler(logging.Handler):
+    def __init__(self, stream=None, redactor=None, maxsize=10000, batch_size=500, flush_interval=0.2):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.redactor = redactor or Redactor()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.drain)
+
+    def handle(self, record):
+        # Context is captured on the caller's thread; filters run after so they can see it
+        record.ctx = _context.get()
+        return super().handle(record)
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def format_record(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(record.ctx)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = logging.Formatter().formatException(record.exc_info)
+        return self.redactor(json_codec.dumps(entry, default=str))
+
+    def _write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format_record(record))
+            except Exception:
+                self.dropped += 1
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                pass
+
+    def drain(self):
+        """Writes whatever is still queued; called at exit."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write(batch)
+
+
+def setup_logging(name="webhook", level=logging.INFO, secrets=(), sample_rates=None):
+    handler = AsyncBatchHandler(redactor=Redactor(secrets))
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,202 @@
+import re
+from collections import namedtuple
+
+
+class TemplateVariableError(ValueError):
+    """Raised by a parser when a field value can't be turned into template variables."""
+
+
+# ---------------------------------------------------------------------------
+# Variable parsers: field value -> ContentVariables dict (or action payload)
+# ---------------------------------------------------------------------------
+
+def parse_single(field_value):
+    return {"1": field_value}
+
+
+def parse_single_stripped(field_value):
+    return {"1": field_value.strip()}
+
+
+def parse_split_two(field_value):
+    # Split into two variables by the first space
+    parts = field_value.strip().split(" ", 1)
+    return {
+        "1": parts[0],
+        "2": parts[1] if len(parts) > 1 else ""
+    }
+
+
+def parse_split_three(field_value):
+    # Split into three variables by spaces
+    parts = field_value.strip().split(" ", 2)
+    return {
+        "1": parts[0],
+        "2": parts[1] if len(parts) > 1 else "",
+        "3": parts[2] if len(parts) > 2 else ""
+    }
+
+
+def split_pair_to_vars(pair_text: str):
+    """Accepts 'SARGBP', 'sar/gbp', 'SAR GBP' etc. Returns {'1': base, '2': quote, '3': base}."""
+    pair = re.sub(r'[^A-Z]', '', (pair_text or '').upper())
+    if len(pair) != 6:
+        raise TemplateVariableError(f"Currency pair must be 6 letters (e.g. SARGBP). Got: {pair_text!r}")
+    base, quote = pair[:3], pair[3:]
+    return {"1": base, "2": quote, "3": base}
+
+
+def parse_sar_details(field_value):
+    raw = field_value.strip()
+
+    if "|" in raw:
+        tokens = [t.strip() for t in raw.split("|")]
+    else:
+        # Fallback: first token = first name, last token = IBAN, middle = full name
+        tokens_ws = raw.split()
+        if len(tokens_ws) >= 3:
+            tokens = [tokens_ws[0], " ".join(tokens_ws[1:-1]), tokens_ws[-1]]
+        else:
+            tokens = tokens_ws
+
+    if len(tokens) < 3:
+        raise TemplateVariableError("Need 3 variables: first_name full_name iban")
+
+    return {
+        "1": tokens[0],   # e.g. Nick
+        "2": tokens[1],   # e.g. Nick Cornford
+        "3": tokens[2],   # e.g. GB95SPPV23188420383356
+    }
+
+
+def parse_referral_amount(field_value):
+    raw = field_value.strip()
+
+    # Prefer a strict delimiter if provided; otherwise split on whitespace ONLY
+    if "|" in raw:
+        tokens = [t.strip() for t in raw.split("|")]
+    else:
+        tokens = raw.split()  # whitespace split (won't split the comma inside 30,001.29)
+
+    if len(tokens) < 3:
+        raise TemplateVariableError("Need 3 variables: amount currency pd_id")
+
+    amount_raw, currency_raw, pd_id_raw = tokens[0], tokens[1], tokens[2]
+
+    # Normalise amount: strip currency symbols/spaces, remove thousands commas
+    amount_norm = re.sub(r'^[£$€]\s*', '', amount_raw).replace(",", "")
+    try:
+        float(amount_norm)
+    except ValueError:
+        raise TemplateVariableError("Invalid amount")
+
+    # PD person id should be digits
+    if not re.fullmatch(r"\d+", pd_id_raw):
+        raise TemplateVariableError("Invalid PD ID")
+
+    return {
+        "1": amount_norm,            # e.g., 30001.29
+        "2": currency_raw.upper(),   # e.g., GBP
+        "3": pd_id_raw,              # e.g., 9
+    }
+
+
+def parse_quote_request(field_value):
+    """'GBPEUR buy 1,000' -> quote API payload fields (not Twilio variables)."""
+    parts = field_value.strip().split(" ", 2)
+    if len(parts) != 3:
+        raise TemplateVariableError("Invalid format")
+
+    amount = parts[2].replace(",", "").replace("£", "")  # Strip commas or currency symbols if needed
+    try:
+        amount_value = float(amount)
+    except ValueError:
+        raise TemplateVariableError("Invalid amount")
+
+    return {"pair": parts[0], "direction": parts[1], "amount": amount_value}
+
+
+def parse_vcard_destination(field_value):
+    # field_value should be the destination number (e.g. your number)
+    return {"to": field_value.strip()}
+
+
+# Templates not listed here use parse_single
+TEMPLATE_PARSERS = {
+    "24hrs": parse_single_stripped,
+    "payment_account": parse_split_two,
+    "payment_which": parse_split_two,
+    "quote_amount": parse_split_two,
+    "feefo_request": parse_split_two,
+    "request_settlement_confirmation": parse_split_two,
+    "quote_tips": parse_split_two,
+    "scio_terms": parse_split_two,
+    "scio_and_equals_terms": parse_split_two,
+    "1k_reminder": parse_split_two,
+    "jumio_ebury": parse_split_two,
+    "intro_thanks": parse_split_two,
+    "tips": split_pair_to_vars,
+    "new_sar_details": parse_sar_details,
+    "payment_released_referral": parse_referral_amount,
+    "auto_exchange": parse_split_three,
+    "quote": parse_quote_request,
+    "vcard": parse_vcard_destination,
+}
+
+# Templates handled by something other than a Twilio Content template send
+TEMPLATE_ACTIONS = {
+    "vcard": "vcard",
+    "quote": "quote",
+}
+
+
+# ---------------------------------------------------------------------------
+# Registry and field-diff index
+# ---------------------------------------------------------------------------
+
+TemplateSpec = namedtuple("TemplateSpec", ["name", "field_id", "content_sid", "parser", "action", "position"])
+
+
+def build_registry(content_map, field_map, parsers=TEMPLATE_PARSERS, actions=TEMPLATE_ACTIONS):
+    """Returns {field_id: TemplateSpec}; position preserves field_map order for results."""
+    index = {}
+    for position, (name, field_id) in enumerate(field_map.items()):
+        index[field_id] = TemplateSpec(
+            name=name,
+            field_id=field_id,
+            content_sid=content_map.get(name),
+            parser=parsers.get(name, parse_single),
+            action=actions.get(name, "whatsapp"),
+            position=position,
+        )
+    return index
+
+
+def _field_value(field):
+    return field.get("value") if isinstance(field, dict) else None
+
+
+def find_triggered(custom_fields, previous_fields, index):
+    """
+    Returns [(TemplateSpec, value)] for template fields that are set now and were empty
+    before, in registry order.
+
+    Pipedrive v2 webhooks list only changed fields under 'previous', so when a previous
+    snapshot is given only its keys are visited and the cost doesn't grow with the number
+    of registered templates. With no previous snapshot (None), every current field is a
+    candidate.
+    """
+    custom_fields = custom_fields or {}
+    candidates = custom_fields if previous_fields is None else previous_fields
+    previous_fields = previous_fields or {}
+
+    triggered = []
+    for field_id in candidates:
+        spec = index.get(field_id)
+        if spec is None:
+            continue
+        value = _field_value(custom_fields.get(field_id))
+        if value and not _field_value(previous_fields.get(field_id)):
+            triggered.append((spec, value))
+    triggered.sort(key=lambda item: item[0].position)
+    return triggered
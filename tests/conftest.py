@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """bench/stub_upstreams serving Twilio, Pipedrive and the quote API on a local port."""
+    from stub_upstreams import StubConfig, start_stub_server
+
+    config = StubConfig()
+    server = start_stub_server(config)
+    config.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield config
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def app_module(stub, tmp_path_factory):
+    """
+    app.py imported once against the stubs, with every store in a temp dir. Set
+    before the import (load_dotenv doesn't override), so a local .env can't point
+    the suite at real upstreams or the working tree's databases.
+    """
+    workdir = tmp_path_factory.mktemp("app")
+    os.environ.update({
+        "TWILIO_API_BASE": stub.base_url,
+        "TWILIO_CONTENT_API_BASE": stub.base_url,
+        "PIPEDRIVE_API_BASE": stub.base_url,
+        "QUOTE_API_BASE": stub.base_url,
+        "TWILIO_ACCOUNT_SID": "ACtest",
+        "TWILIO_AUTH_TOKEN": "test",
+        "TWILIO_WHATSAPP_FROM": "+447700000000",
+        "TWILIO_WHATSAPP_FROM_POOL": "",
+        "TWILIO_STATUS_CALLBACK_URL": "",
+        "TWILIO_RATE_LIMIT_PATH": "",
+        "PIPEDRIVE_API_KEY": "test",
+        "PIPEDRIVE_QUEUE_MODE": "false",
+        "PIPEDRIVE_WRITE_COALESCE": "false",
+        "DEDUP_BACKEND": "memory",
+        "SCHEDULER_ENABLED": "false",
+        "RECONCILE_ENABLED": "false",
+        "CAPTURE_DIR": "",
+        "TRACE_EXPORT_PATH": "",
+        "METRICS_DIR": str(workdir / "metrics"),
+        "DEFERRED_QUEUE_PATH": str(workdir / "deferred.db"),
+        "DELIVERY_STORE_PATH": str(workdir / "deliveries.db"),
+        "SCHEDULE_PATH": str(workdir / "schedule.db"),
+        "BROADCAST_PATH": str(workdir / "broadcasts.db"),
+        "CONTENT_SNAPSHOT_PATH": str(workdir / "content_templates.json"),
+    })
+    import app
+
+    return app
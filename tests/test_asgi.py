@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("httpx")
+
+
+@pytest.fixture(scope="module")
+def asgi_module(app_module):
+    import asgi_app
+
+    return asgi_app
+
+
+def test_health_waits_for_the_async_pools(asgi_module):
+    async def scenario():
+        client = asgi_module.app.test_client()
+        before = await client.get("/health")
+        async with asgi_module.app.test_app():
+            after = await client.get("/health")
+        return before.status_code, (await before.get_json())["status"], after.status_code, await after.get_json()
+
+    app_module_ready = asgi_module.core.warmed_up.wait(10)
+    before_status, before_body, after_status, after = asyncio.run(scenario())
+
+    assert app_module_ready
+    assert (before_status, before_body) == (503, "starting")
+    assert after_status == 200
+    assert after["startup"]["async_warm_connections"] == {"twilio": 2, "pipedrive": 2, "quote": 2}
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+import requests
+
+from broadcast import BroadcastRunner, BroadcastStore, iter_recipients
+from resilience import current_send_attempt
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BroadcastStore(str(tmp_path / "broadcasts.db"))
+
+
+class FakeSend:
+    """send(phone, variables) that fails the phones in fail_before (never sent) or fail_after (may exist)."""
+
+    def __init__(self, fail_before=(), fail_after=()):
+        self.fail_before = set(fail_before)
+        self.fail_after = set(fail_after)
+        self.calls = []
+
+    def __call__(self, phone, variables):
+        self.calls.append(phone)
+        if phone in self.fail_before:
+            raise requests.ConnectTimeout("connect timed out")
+        current_send_attempt().may_have_sent = True
+        if phone in self.fail_after:
+            raise requests.ReadTimeout("read timed out")
+        return True, f"SM{phone}"
+
+
+def recipients(rows=5):
+    body = "phone,1\n" + "".join(f"+4477009000{i:02d},value {i}\n" for i in range(1, rows + 1)) + ",no phone\n"
+    return iter_recipients(io.BytesIO(body.encode()), "csv")
+
+
+def run(store, send, broadcast_id="b1"):
+    return list(BroadcastRunner(store, send, concurrency=2).run(broadcast_id, "24hrs", None, recipients()))[-1]
+
+
+def test_every_row_gets_an_outcome(store):
+    send = FakeSend(fail_before={"+447700900002"}, fail_after={"+447700900003"})
+
+    final = run(store, send)
+
+    assert final["status"] == "done_with_errors"
+    assert (final["sent"], final["error"], final["unknown"], final["invalid"]) == (3, 1, 1, 1)
+    assert store.status("b1")["rows"] == {"sent": 3, "error": 1, "unknown": 1, "invalid": 1}
+
+
+def test_resume_only_retries_sends_that_never_went_out(store):
+    run(store, FakeSend(fail_before={"+447700900002"}, fail_after={"+447700900003"}))
+    retry = FakeSend()
+
+    final = run(store, retry)
+
+    assert retry.calls == ["+447700900002"]
+    assert final["skipped"] == 5
+    assert store.status("b1")["rows"] == {"sent": 4, "unknown": 1, "invalid": 1}
+
+
+def test_rows_interrupted_mid_send_are_not_resent(store):
+    # A crash after row 4 was written as 'sending' but before its outcome was
+    store.start("b1", "24hrs")
+    store.record("b1", [(row, f"+4477009000{row:02d}", "sent", "SM") for row in (1, 2, 3)])
+    store.record("b1", [(4, "+447700900004", "sending", None)])
+    send = FakeSend()
+
+    run(store, send)
+
+    assert send.calls == ["+447700900005"]
+    assert store.status("b1")["rows"] == {"sent": 4, "unknown": 1, "invalid": 1}
+
+
+def test_broadcast_id_is_tied_to_its_template(store):
+    store.start("b1", "24hrs")
+    with pytest.raises(ValueError):
+        store.start("b1", "payment_released")
@@ -0,0 +1,86 @@
+import glob
+import gzip
+import os
+import time
+
+import pytest
+
+from capture import Sanitizer, TrafficCapture, read_capture
+
+
+@pytest.fixture
+def sanitize():
+    return Sanitizer("capture-key")
+
+
+def test_phone_masks_alike_in_every_format(sanitize):
+    plain = sanitize("+447700900123")
+    assert plain != "+447700900123"
+    assert len(plain) == len("+447700900123") and plain.startswith("+")
+    assert sanitize("whatsapp:+447700900123") == f"whatsapp:{plain}"
+    assert sanitize("+44 7700 900123").replace(" ", "") == plain
+    assert sanitize("+447700900124") != plain
+
+
+def test_letters_are_masked_and_punctuation_kept(sanitize):
+    assert sanitize("Jane Doe, £1,250.00") == f"Xxxx Xxx, £{sanitize('1,250.00')}"
+    assert sanitize("£1,250.00").count(",") == 1
+
+
+def test_event_fields_and_keys_are_kept(sanitize):
+    event = {
+        "meta": {"action": "updated", "entity_id": 42, "id": "evt-1"},
+        "current": {"name": "Jane Doe", "phone": [{"value": "+447700900123", "label": "mobile", "primary": True}]},
+        "data": {"custom_fields": {"9e5dc6414616946268d3d02df75bdee7599795d2": {"value": "Jane"}}},
+    }
+
+    masked = sanitize(event)
+
+    assert masked["meta"] == event["meta"]
+    assert masked["current"]["name"] == "Xxxx Xxx"
+    assert masked["current"]["phone"][0]["label"] == "mobile"
+    assert list(masked["data"]["custom_fields"]) == list(event["data"]["custom_fields"])
+
+
+def test_front_comment_keeps_its_template_name(sanitize):
+    assert sanitize({"body": "24hrs Jane 12:00"}) == {"body": f"24hrs {sanitize('Jane 12:00')}"}
+
+
+def test_different_keys_mask_differently(sanitize):
+    assert Sanitizer("other-key")("+447700900123") != sanitize("+447700900123")
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_captured_requests_are_sanitized_on_disk(tmp_path):
+    capture = TrafficCapture(str(tmp_path), routes=["/webhook"], key="capture-key", max_records=2)
+    assert capture.wants("/webhook") and not capture.wants("/health")
+    for i in range(3):
+        capture.record("/webhook", "POST", "application/json", {"To": f"+44770090012{i}"}, 200, 1.5, 1_800_000_000 + i)
+    wait_for(lambda: capture.stats()["captured"] == 3)
+    capture.close()
+
+    files = sorted(glob.glob(os.path.join(tmp_path, "capture-*.jsonl.gz")))
+    entries = [entry for path in files for entry in read_capture(path)]
+    assert len(files) == 2
+    assert [entry["status"] for entry in entries] == [200, 200, 200]
+    assert all("+447700900" not in entry["body"]["To"] for entry in entries)
+
+
+def test_read_capture_stops_at_a_truncated_tail(tmp_path):
+    path = tmp_path / "capture.jsonl.gz"
+    with gzip.open(path, "wb") as f:
+        for i in range(100):
+            f.write(b'{"route": "/webhook", "n": %d}\n' % i)
+            if i == 49:
+                # What TrafficCapture does after each batch
+                f.flush()
+    # A worker killed mid-write
+    path.write_bytes(path.read_bytes()[:-30])
+
+    entries = list(read_capture(str(path)))
+    assert [entry["n"] for entry in entries[:50]] == list(range(50))
@@ -0,0 +1,91 @@
+import pytest
+
+import json_codec
+from content_templates import ContentCatalog, parse_content
+from template_registry import TemplateVariableError
+
+ITEMS = [
+    {
+        "sid": "HX1",
+        "friendly_name": "payment_released",
+        "language": "en",
+        "types": {
+            "twilio/text": {"body": "Hi {{1}}, £{{2}} is on its way."},
+            "twilio/call-to-action": {"actions": [{"title": "Track", "url": "https://example.com/t/{{ 3 }}"}]},
+        },
+    },
+    {"sid": "HX2", "friendly_name": "no_variables", "types": {"twilio/text": {"body": "Thanks!"}}},
+]
+
+
+@pytest.fixture
+def catalog():
+    catalog = ContentCatalog(lambda: ITEMS)
+    catalog.load()
+    return catalog
+
+
+def test_placeholders_come_from_every_content_type():
+    template = parse_content(ITEMS[0])
+    assert template.placeholders == ("1", "2", "3")
+    assert template.url_placeholders == ("3",)
+
+
+def test_complete_variables_pass(catalog):
+    catalog.check("HX1", {"1": "Jane", "2": "1,250.00", "3": "abc123"})
+    catalog.check("HX2", None)
+
+
+@pytest.mark.parametrize("variables, error", [
+    ({"1": "Jane", "2": "10"}, "needs variables 3"),
+    ({"1": " ", "2": "10", "3": "a"}, "needs variables 1"),
+    ({"1": "Jane\nDoe", "2": "10", "3": "a"}, "newline"),
+    ({"1": "Jane     Doe", "2": "10", "3": "a"}, "consecutive spaces"),
+    ({"1": "x" * 1025, "2": "10", "3": "a"}, "longer than"),
+    ({"1": "Jane", "2": "10", "3": "a b"}, "part of a URL"),
+])
+def test_variables_twilio_would_reject_fail_locally(catalog, variables, error):
+    with pytest.raises(TemplateVariableError, match=error):
+        catalog.check("HX1", variables)
+    assert catalog.stats()["rejected"] == 1
+
+
+def test_unknown_content_sid_is_rejected_and_reported(catalog):
+    with pytest.raises(TemplateVariableError, match="does not exist"):
+        catalog.check("HXmissing", {})
+    assert catalog.unknown({"24hrs": "HXmissing", "payment_released": "HX1"}) == {"24hrs": "HXmissing"}
+
+
+def test_nothing_is_checked_until_loaded():
+    catalog = ContentCatalog()
+    assert catalog.load() is None
+    catalog.check("HXanything", {})
+    assert catalog.unknown({"24hrs": "HXanything"}) == {}
+
+
+def test_api_failure_falls_back_to_the_snapshot(tmp_path):
+    path = str(tmp_path / "content.json")
+    assert ContentCatalog(lambda: ITEMS, snapshot_path=path).load() == "api"
+
+    def down():
+        raise ConnectionError("Content API unreachable")
+
+    catalog = ContentCatalog(down, snapshot_path=path)
+    assert catalog.load() == "snapshot"
+    assert catalog.get("HX1").placeholders == ("1", "2", "3")
+
+
+def test_unreadable_snapshot_leaves_the_catalog_unloaded(tmp_path):
+    path = tmp_path / "content.json"
+    path.write_bytes(json_codec.dumps_bytes(ITEMS)[:20])
+    assert ContentCatalog(snapshot_path=str(path)).load() is None
+
+
+def test_send_with_rejected_variables_never_reaches_twilio(app_module, stub, monkeypatch, catalog):
+    monkeypatch.setattr(app_module, "content_catalog", catalog)
+    before = stub.counts["POST /2010-04-01/Accounts/ACtest/Messages.json"]
+
+    result = app_module.send_whatsapp_template("+447700900123", "HX1", {"1": "Jane"})
+
+    assert result["status"] == "error" and "needs variables 2, 3" in result["details"]
+    assert stub.counts["POST /2010-04-01/Accounts/ACtest/Messages.json"] == before
@@ -0,0 +1,67 @@
+import pytest
+
+from dedup import MemoryDedupStore, SQLiteDedupStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteDedupStore(str(tmp_path / "dedup.db"), ttl=60)
+    return MemoryDedupStore(ttl=60)
+
+
+def test_claim_is_first_come(store):
+    assert store.claim("send:1:field:abc")
+    assert not store.claim("send:1:field:abc")
+    assert store.claim("send:1:field:def")
+    assert store.stats()["duplicates"] == 1
+
+
+def test_release_lets_the_key_be_claimed_again(store):
+    assert store.claim("event:1")
+    store.release("event:1")
+    assert store.claim("event:1")
+
+
+def test_expired_key_can_be_claimed(store):
+    store.ttl = 0
+    assert store.claim("event:2")
+    assert store.claim("event:2")
+
+
+def test_sqlite_keys_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    first, second = SQLiteDedupStore(path), SQLiteDedupStore(path)
+    assert first.claim("event:3")
+    assert not second.claim("event:3")
+    first.release("event:3")
+    assert second.claim("event:3")
+
+
+def test_release_unsent_keeps_keys_of_sends_that_may_exist(app_module):
+    spec = next(iter(app_module.TEMPLATE_INDEX.values()))
+    keys = [f"test-release:{i}" for i in range(4)]
+    for key in keys:
+        assert app_module.dedup_store.claim(key)
+    claimed = [(spec, "value", key) for key in keys]
+    results = [
+        {"status": "success"},
+        {"status": "error", "replayable": False},
+        {"status": "error", "replayable": True},
+        {"status": "deferred"},
+    ]
+
+    app_module.release_unsent(claimed, {"results": results})
+
+    assert [app_module.dedup_store.claim(key) for key in keys] == [False, False, True, True]
+
+
+def test_release_unsent_without_results_frees_every_key(app_module):
+    spec = next(iter(app_module.TEMPLATE_INDEX.values()))
+    keys = ["test-release:none:0", "test-release:none:1"]
+    for key in keys:
+        app_module.dedup_store.claim(key)
+
+    app_module.release_unsent([(spec, "value", key) for key in keys], {"status": "noop", "error": "No phone number"})
+
+    assert all(app_module.dedup_store.claim(key) for key in keys)
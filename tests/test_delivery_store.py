@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from delivery_store import DeliveryStore, normalize_number
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DeliveryStore(str(tmp_path / "deliveries.db"), flush_interval=0.01)
+
+    def settled(count):
+        deadline = time.time() + 5
+        while store.written < count and time.time() < deadline:
+            time.sleep(0.01)
+        return store
+
+    store.settled = settled
+    return store
+
+
+def callback(sid, status, error_code=None):
+    return {"MessageSid": sid, "MessageStatus": status, "To": "whatsapp:+447700900123", "ErrorCode": error_code}
+
+
+def test_numbers_are_normalized():
+    assert normalize_number("whatsapp:+44 7700 900123") == "+447700900123"
+    assert normalize_number(" ") is None
+
+
+def test_send_and_callbacks_are_recorded(store):
+    store.record_send("SM1", "+447700900123", template="24hrs", content_sid="HX2")
+    store.record_callback(callback("SM1", "sent"))
+    store.record_callback(callback("SM1", "delivered"))
+
+    [message] = store.settled(3).recent_for_number("whatsapp:+447700900123")
+    assert (message["sid"], message["template"], message["status"]) == ("SM1", "24hrs", "delivered")
+    assert [e["status"] for e in store.events("SM1")] == ["sent", "delivered"]
+
+
+def test_status_never_moves_backwards(store):
+    store.record_send("SM2", "+447700900123")
+    store.record_callback(callback("SM2", "delivered"))
+    store.record_callback(callback("SM2", "sent"))
+
+    assert store.settled(3).recent_for_number("+447700900123")[0]["status"] == "delivered"
+
+
+def test_callback_before_its_send_record_is_kept(store):
+    store.record_callback(callback("SM3", "failed", "63016"))
+    store.settled(1)
+    store.record_send("SM3", "+447700900123", template="24hrs")
+
+    [message] = store.settled(2).recent_for_number("+447700900123")
+    assert (message["status"], message["error_code"], message["template"]) == ("failed", "63016", "24hrs")
+
+
+def test_incomplete_callbacks_are_ignored(store):
+    assert not store.record_callback({"MessageSid": "SM4"})
+    store.record_send(None, "+447700900123")
+    assert store.stats()["pending"] == 0
+
+
+def test_newest_sends_come_first(store):
+    for i in range(3):
+        store.record_send(f"SM{i}", "+447700900123")
+        time.sleep(0.01)
+
+    assert [m["sid"] for m in store.settled(3).recent_for_number("+447700900123", limit=2)] == ["SM2", "SM1"]
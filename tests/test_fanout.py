@@ -0,0 +1,93 @@
+import itertools
+
+import pytest
+import requests
+
+person_ids = itertools.count(1000)
+
+
+def twilio_posts(stub):
+    return stub.counts["POST /2010-04-01/Accounts/ACtest/Messages.json"]
+
+
+def webhook(app, person_id, *templates):
+    fields = app.TEMPLATE_FIELD_MAP
+    return {
+        "meta": {"entity_id": person_id},
+        "current": {"id": person_id, "name": "Test Person", "phone": [{"value": "+447700900123"}]},
+        "data": {"id": person_id, "custom_fields": {fields[t]: {"value": f"{t} value"} for t in templates}},
+        "previous": {"custom_fields": {fields[t]: None for t in templates}},
+    }
+
+
+@pytest.fixture
+def fail_template(app_module, monkeypatch):
+    """fail_template(name, exc) makes the Twilio POST for that template raise exc, before or after it's sent."""
+    send = app_module.twilio_client.session.request
+
+    def install(name, exc, after_send):
+        content_sid = app_module.TEMPLATE_CONTENT_MAP[name]
+
+        def request(method, url, **kwargs):
+            if content_sid not in str(kwargs.get("data")):
+                return send(method, url, **kwargs)
+            if after_send:
+                send(method, url, **kwargs)
+            raise exc
+
+        monkeypatch.setattr(app_module.twilio_client.session, "request", request)
+
+    return install
+
+
+def test_fanout_sends_every_triggered_template(app_module, stub):
+    before = twilio_posts(stub)
+    response = app_module.process_pipedrive_event(webhook(app_module, next(person_ids), "payment_released", "24hrs"))
+
+    assert response["status"] == "done"
+    assert [(r["template"], r["status"]) for r in response["results"]] == [
+        ("payment_released", "success"), ("24hrs", "success"),
+    ]
+    assert twilio_posts(stub) - before == 2
+
+
+def test_partial_failure_after_send_is_not_resent(app_module, stub, fail_template):
+    fail_template("settlement_received", requests.ReadTimeout("read timed out"), after_send=True)
+    data = webhook(app_module, next(person_ids), "payment_released", "settlement_received", "24hrs")
+    before = twilio_posts(stub)
+
+    response = app_module.process_pipedrive_event(data)
+    results = {r["template"]: r for r in response["results"]}
+    assert results["payment_released"]["status"] == "success"
+    assert results["24hrs"]["status"] == "success"
+    assert results["settlement_received"]["status"] == "error"
+    assert results["settlement_received"]["replayable"] is False
+
+    # Pipedrive's retry of the same webhook: the timed-out template may exist in Twilio, so nothing goes out
+    assert app_module.process_pipedrive_event(data) == {"status": "noop", "message": "Duplicate delivery"}
+    assert twilio_posts(stub) - before == 3
+
+
+def test_partial_failure_before_send_is_retried_alone(app_module, stub, fail_template):
+    fail_template("settlement_received", requests.ConnectTimeout("connect timed out"), after_send=False)
+    data = webhook(app_module, next(person_ids), "payment_released", "settlement_received")
+    before = twilio_posts(stub)
+
+    response = app_module.process_pipedrive_event(data)
+    results = {r["template"]: r for r in response["results"]}
+    assert results["payment_released"]["status"] == "success"
+    assert results["settlement_received"]["replayable"] is True
+
+    retry = app_module.process_pipedrive_event(data)
+    assert [(r["template"], r["status"]) for r in retry["results"]] == [("settlement_received", "error")]
+    assert twilio_posts(stub) - before == 1
+
+
+def test_duplicate_event_id_is_dropped(app_module, stub):
+    data = webhook(app_module, next(person_ids), "24hrs")
+    data["meta"]["id"] = "event-1"
+    before = twilio_posts(stub)
+
+    assert app_module.process_pipedrive_event(data)["status"] == "done"
+    assert app_module.process_pipedrive_event(data) == {"status": "noop", "message": "Duplicate delivery"}
+    assert twilio_posts(stub) - before == 1
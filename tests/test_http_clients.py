@@ -0,0 +1,56 @@
+import pytest
+import requests
+
+import json_codec
+from http_clients import PooledClient
+from resilience import track_send
+
+
+@pytest.fixture
+def client(stub):
+    observed = []
+    client = PooledClient("stub", stub.base_url, pool_maxsize=2,
+                          observer=lambda call, seconds, status: observed.append((call, status)))
+    client.observed = observed
+    return client
+
+
+def test_keep_alive_connections_are_reused(client):
+    for person_id in range(5):
+        assert client.get(f"/v1/persons/{person_id}").status_code == 200
+
+    stats = client.pool_stats()
+    assert (stats["misses"], stats["hits"]) == (1, 4)
+
+
+def test_json_bodies_and_observed_calls(client):
+    response = client.post("/v1/activities", call="pipedrive_activity_post", json={"subject": "Zoë"})
+
+    assert json_codec.loads(response.content)["success"]
+    assert client.observed == [("pipedrive_activity_post", 201)]
+
+
+def test_creating_call_marks_the_send_attempt(client):
+    with track_send() as attempt:
+        client.post("/v1/activities", creates=True, json={})
+    assert attempt.may_have_sent
+
+
+def test_rejected_creating_call_never_sent(client):
+    with track_send() as attempt:
+        assert client.post("/v1/unknown", creates=True, json={}).status_code == 404
+    assert not attempt.may_have_sent
+
+
+def test_refused_connection_never_sent():
+    client = PooledClient("closed-port", "http://127.0.0.1:9", timeout=(0.5, 0.5))
+    with track_send() as attempt:
+        with pytest.raises(requests.ConnectionError):
+            client.post("/", creates=True)
+    assert not attempt.may_have_sent
+
+
+def test_calls_that_do_not_create_leave_the_attempt_alone(client):
+    with track_send() as attempt:
+        client.get("/v1/persons/1")
+    assert not attempt.may_have_sent
@@ -0,0 +1,53 @@
+import datetime
+import json
+
+import pytest
+from flask import Flask, jsonify, request
+
+import json_codec
+
+
+@pytest.fixture(params=["orjson", "json"])
+def codec(request, monkeypatch):
+    if request.param == "orjson":
+        if not json_codec.orjson:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(json_codec, "orjson", None)
+    return json_codec
+
+
+PAYLOAD = {"name": "Zoë", "phone": [{"value": "+447700900123"}], "count": 3, "ok": True, "none": None}
+
+
+def test_round_trip(codec):
+    assert codec.loads(codec.dumps(PAYLOAD)) == PAYLOAD
+    assert codec.loads(codec.dumps_bytes(PAYLOAD)) == PAYLOAD
+
+
+def test_output_matches_the_stdlib(codec):
+    assert json.loads(codec.dumps(PAYLOAD, sort_keys=True)) == PAYLOAD
+    assert "Zoë" in codec.dumps(PAYLOAD)
+    assert list(json.loads(codec.dumps({"b": 1, "a": 2}, sort_keys=True))) == ["a", "b"]
+
+
+def test_values_orjson_rejects_fall_back_to_the_stdlib(codec):
+    # Non-string keys are a TypeError for orjson
+    assert codec.loads(codec.dumps({1: "one"})) == {"1": "one"}
+
+
+def test_default_hook_is_used(codec):
+    when = datetime.date(2026, 1, 2)
+    assert codec.loads(codec.dumps({"when": when}, default=str)) == {"when": str(when)}
+
+
+def test_loads_accepts_bytes_and_str(codec):
+    assert codec.loads(b'{"a": 1}') == codec.loads('{"a": 1}') == {"a": 1}
+
+
+def test_flask_provider(codec):
+    app = Flask(__name__)
+    app.json = codec.JSONCodecProvider(app)
+    with app.test_request_context(json={"z": 1, "a": [1, 2]}):
+        assert request.get_json() == {"z": 1, "a": [1, 2]}
+        assert json.loads(jsonify({"b": 1, "a": 2}).get_data()) == {"a": 2, "b": 1}
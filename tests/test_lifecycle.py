@@ -0,0 +1,57 @@
+from http_clients import PooledClient
+
+
+class FakeConsumer:
+    def __init__(self, finishes):
+        self.finishes = finishes
+        self.stopped = []
+
+    def stop(self, timeout=None):
+        self.stopped.append(timeout)
+        return self.finishes
+
+
+def test_warm_opens_connections(stub):
+    client = PooledClient("stub", stub.base_url)
+    assert client.warm(2) == 2
+
+
+def test_warm_never_raises(stub, monkeypatch):
+    client = PooledClient("stub", stub.base_url)
+
+    def broken(*args, **kwargs):
+        raise TypeError("bad proxy settings")
+
+    monkeypatch.setattr(client.session, "merge_environment_settings", broken)
+    assert client.warm(2) == 0
+
+
+def test_worker_reports_ready_when_warm_up_fails(app_module, monkeypatch):
+    def broken(connections):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(app_module.twilio_client, "warm", broken)
+    monkeypatch.setattr(app_module, "content_catalog", None)
+    monkeypatch.setattr(app_module, "startup_stats", {"ready_seconds": None, "warm_connections": {}})
+    app_module.warmed_up.clear()
+
+    app_module.warm_up()
+
+    assert app_module.readiness() == "healthy"
+    assert app_module.startup_stats["ready_seconds"] is not None
+
+
+def test_drain_reports_what_did_not_finish(app_module, monkeypatch):
+    consumers = {"deferred_queue": FakeConsumer(True), "scheduler": FakeConsumer(False)}
+    monkeypatch.setattr(app_module, "background_consumers", lambda: consumers)
+    monkeypatch.setattr(app_module, "startup_stats", {"drain_seconds": None})
+    monkeypatch.setattr(app_module, "draining", type(app_module.draining)())
+
+    assert app_module.drain(1) >= 0
+
+    assert app_module.readiness() == "draining"
+    # begin_drain stops claiming without waiting, then drain waits within the timeout
+    assert consumers["scheduler"].stopped[0] == 0
+    assert 0 < consumers["scheduler"].stopped[1] <= 1
+    assert app_module.startup_stats["drain_seconds"] is not None
+
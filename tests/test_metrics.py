@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from metrics import MetricsRegistry
+
+DEAD_PID = 2 ** 22 + 1  # above the default pid_max
+
+
+@pytest.fixture(autouse=True)
+def no_live_dead_pid():
+    try:
+        os.kill(DEAD_PID, 0)
+    except ProcessLookupError:
+        return
+    except PermissionError:
+        pass
+    pytest.skip("test pid is in use")
+
+
+def make(metrics_dir=None):
+    registry = MetricsRegistry(metrics_dir=str(metrics_dir) if metrics_dir else None, flush_interval=3600)
+    registry.counter("sends_total", "Sends")
+    registry.gauge("queue_depth", "Queued jobs")
+    registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    return registry
+
+
+def write_snapshot(metrics_dir, pid, snapshot):
+    with open(os.path.join(metrics_dir, f"metrics_{pid}.json"), "w") as f:
+        json.dump(snapshot, f)
+
+
+def test_render_exposition_format():
+    registry = make()
+    registry.inc("sends_total", template="24hrs")
+    registry.observe("latency_seconds", 0.05)
+    registry.observe("latency_seconds", 0.5)
+    registry.observe("latency_seconds", 5)
+
+    text = registry.render()
+
+    assert 'sends_total{template="24hrs"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_counters_merge_across_workers_dead_or_alive(tmp_path):
+    registry = make(tmp_path)
+    registry.inc("sends_total", 2)
+    write_snapshot(tmp_path, os.getppid(), {"sends_total": [[[], 3]]})
+    write_snapshot(tmp_path, DEAD_PID, {"sends_total": [[[], 5]]})
+
+    # An exited worker's sends still count, so the total never goes backwards
+    assert "sends_total 10" in registry.render()
+
+
+def test_gauges_only_come_from_live_workers(tmp_path):
+    registry = make(tmp_path)
+    registry.inc("queue_depth", 1)
+    write_snapshot(tmp_path, os.getppid(), {"queue_depth": [[[], 4]]})
+    write_snapshot(tmp_path, DEAD_PID, {"queue_depth": [[[], 100]]})
+
+    assert "queue_depth 5" in registry.render()
+
+
+def test_histograms_merge_bucket_by_bucket(tmp_path):
+    registry = make(tmp_path)
+    registry.observe("latency_seconds", 0.05)
+    write_snapshot(tmp_path, DEAD_PID, {"latency_seconds": [[[], [0, 1, 0.5, 1]]]})
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert "latency_seconds_sum 0.55" in text
+
+
+def test_flush_writes_this_process_snapshot(tmp_path):
+    registry = make(tmp_path)
+    registry.inc("sends_total", template="24hrs")
+
+    registry.flush()
+
+    with open(tmp_path / f"metrics_{os.getpid()}.json") as f:
+        assert json.load(f) == {"sends_total": [[[["template", "24hrs"]], 1]], "queue_depth": [], "latency_seconds": []}
+
+
+def test_unreadable_snapshot_is_skipped(tmp_path):
+    registry = make(tmp_path)
+    (tmp_path / f"metrics_{DEAD_PID}.json").write_text("{not json")
+    registry.inc("sends_total")
+
+    assert "sends_total 1" in registry.render()
+
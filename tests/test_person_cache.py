@@ -0,0 +1,66 @@
+import itertools
+import time
+
+from cache import TTLCache
+
+person_ids = itertools.count(5000)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_person_comes_from_the_webhook_when_it_has_a_phone(app_module):
+    v1 = {"current": {"id": 1, "name": "Jane", "phone": [{"value": "+447700900123"}]}}
+    v2 = {"data": {"id": 1, "name": "Jane", "phones": [{"value": "+447700900123"}], "emails": []}}
+
+    assert app_module.person_from_webhook(v1)["phone"] == [{"value": "+447700900123"}]
+    assert app_module.person_from_webhook(v2)["email"] == []
+    assert app_module.person_from_webhook({"current": {"id": 1, "phone": [{"value": ""}]}}) is None
+
+
+def test_repeat_lookups_are_served_from_the_cache(app_module, stub):
+    person_id = next(person_ids)
+    before = stub.counts["GET /v1/persons/:id"]
+
+    first = app_module.fetch_person(person_id)
+    assert app_module.fetch_person(person_id) == first
+    assert stub.counts["GET /v1/persons/:id"] - before == 1
+
+
+def test_only_changes_to_cached_fields_invalidate(app_module):
+    current = {"name": "Jane", "phone": [{"value": "+447700900123"}], "custom_fields": {"abc": None}}
+
+    # One of our field clears echoed back: nothing the cache holds has changed
+    assert not app_module.person_cache_stale({"current": current, "previous": {"custom_fields": {"abc": "x"}}})
+    assert app_module.person_cache_stale({"current": current, "previous": {"name": "Janet"}})
+    assert not app_module.person_cache_stale({"current": current, "previous": {"name": "Jane"}})
+    assert app_module.person_cache_stale({"current": current})
+
+
+def test_changed_phone_refetches_the_person(app_module, stub):
+    person_id = next(person_ids)
+    app_module.fetch_person(person_id)
+    before = stub.counts["GET /v1/persons/:id"]
+    event = {"meta": {"entity_id": person_id}, "current": {"id": person_id, "phone": [{"value": "+447700900999"}]},
+             "previous": {"phone": [{"value": "+447700900123"}]}}
+
+    app_module.claim_event(event, person_id)
+    app_module.fetch_person(person_id)
+
+    assert stub.counts["GET /v1/persons/:id"] - before == 1
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+
+from rate_limit import SenderRateLimiter, retry_after_seconds
+
+
+class Response:
+    def __init__(self, retry_after=None):
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path):
+    path = str(tmp_path / "rate.db") if request.param == "sqlite" else None
+    return SenderRateLimiter(rate=10, burst=3, path=path)
+
+
+def test_burst_goes_out_then_sends_are_spaced(limiter):
+    waits = [limiter._reserve("+1", 100.0) for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3:] == pytest.approx([0.1, 0.2])
+
+
+def test_bucket_refills_over_time(limiter):
+    for _ in range(4):
+        limiter._reserve("+1", 100.0)
+    assert limiter._reserve("+1", 101.0) == 0.0
+
+
+def test_senders_are_paced_independently(limiter):
+    for _ in range(4):
+        limiter._reserve("+1", 100.0)
+    assert limiter._reserve("+2", 100.0) == 0.0
+
+
+def test_sqlite_buckets_are_shared_between_limiters(tmp_path):
+    path = str(tmp_path / "rate.db")
+    first, second = SenderRateLimiter(rate=10, path=path), SenderRateLimiter(rate=10, path=path)
+    assert first._reserve("+1", 100.0) == 0.0
+    assert second._reserve("+1", 100.0) == pytest.approx(0.1)
+
+
+def test_concurrent_acquires_queue_in_order():
+    limiter = SenderRateLimiter(rate=50)
+    threads = [threading.Thread(target=limiter.acquire, args=("+1",)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    stats = limiter.stats()["+1"]
+    assert (stats["sent"], stats["waiting"]) == (5, 0)
+    assert stats["max_wait_seconds"] == pytest.approx(0.08, abs=0.02)
+
+
+def test_acquire_async_waits_on_the_loop(limiter):
+    async def scenario():
+        return await asyncio.gather(*(limiter.acquire_async("+1") for _ in range(4)))
+
+    waits = asyncio.run(scenario())
+    assert sorted(waits)[-1] == pytest.approx(0.1, abs=0.02)
+
+
+def test_retry_after_header_wins_over_backoff():
+    assert retry_after_seconds(Response("3"), attempt=0) == 3
+    assert retry_after_seconds(Response("600"), attempt=0) == 60
+    assert retry_after_seconds(Response(), attempt=2) == 4
+    assert retry_after_seconds(Response("soon"), attempt=10) == 60
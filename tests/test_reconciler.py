@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+import json_codec
+from reconciler import Reconciler, format_since
+
+FIELD = "abc123"
+
+
+class Response:
+    def __init__(self, body):
+        self.content = json_codec.dumps_bytes(body)
+
+    def raise_for_status(self):
+        pass
+
+
+class FakePipedrive:
+    """/v1/persons/collection over `persons`, two per page, filtered by `since` like Pipedrive."""
+
+    def __init__(self, persons):
+        self.persons = persons
+        self.calls = []
+
+    def get(self, path, call=None, params=None):
+        self.calls.append(dict(params))
+        persons = [p for p in self.persons if "since" not in params or p["update_time"] >= params["since"]]
+        start = int(params.get("cursor") or 0)
+        page = persons[start:start + params["limit"]]
+        more = start + params["limit"] < len(persons)
+        return Response({"data": page, "additional_data": {"next_cursor": str(start + params["limit"]) if more else None}})
+
+
+def person(person_id, age, value="x"):
+    return {"id": person_id, "update_time": format_since(time.time() - age), FIELD: value}
+
+
+@pytest.fixture
+def processed():
+    seen = []
+
+    def process(person, fields):
+        seen.append(person["id"])
+        return True
+
+    process.seen = seen
+    return process
+
+
+def make(tmp_path, client, process, **kwargs):
+    return Reconciler(client, str(tmp_path / "reconcile.db"), [FIELD], process, page_size=2, min_age=60, **kwargs)
+
+
+def test_first_pass_skips_history_unless_opted_in(tmp_path, processed):
+    client = FakePipedrive([person(1, 86400), person(2, 200)])
+
+    summary = make(tmp_path, client, processed).run_pass()
+
+    assert summary["complete"]
+    # Person 1's field may be left over from a send with an unknown outcome
+    assert processed.seen == [2]
+    assert "since" in client.calls[0]
+
+
+def test_full_first_pass_covers_every_person(tmp_path, processed):
+    client = FakePipedrive([person(1, 86400), person(2, 200), person(3, 200, value="")])
+
+    make(tmp_path, client, processed, full_first_pass=True).run_pass()
+
+    assert processed.seen == [1, 2]
+    assert "since" not in client.calls[0]
+
+
+def test_recent_updates_wait_for_their_webhook(tmp_path, processed):
+    client = FakePipedrive([person(1, 5), person(2, 200)])
+
+    summary = make(tmp_path, client, processed).run_pass()
+
+    assert processed.seen == [2]
+    assert summary["skipped_recent"] == 1
+
+
+def test_interrupted_pass_resumes_from_its_cursor(tmp_path, processed):
+    client = FakePipedrive([person(i, 200) for i in range(1, 6)])
+    reconciler = make(tmp_path, client, processed)
+
+    assert not reconciler.run_pass(max_pages=2)["complete"]
+    assert reconciler.stats()["in_pass"]
+    restarted = make(tmp_path, client, processed)
+    assert restarted.run_pass()["complete"]
+
+    assert processed.seen == [1, 2, 3, 4, 5]
+    assert client.calls[-1]["cursor"] == "4"
+
+
+def test_next_pass_only_asks_for_updates_since_the_last(tmp_path, processed):
+    client = FakePipedrive([person(1, 200)])
+    reconciler = make(tmp_path, client, processed, full_first_pass=True, overlap=300)
+    started = time.time()
+    reconciler.run_pass()
+
+    reconciler.run_pass()
+
+    assert client.calls[-1]["since"] >= format_since(started - 301)
+
+
+def test_lease_keeps_a_second_process_out(tmp_path, processed):
+    client = FakePipedrive([person(1, 200)])
+    reconciler = make(tmp_path, client, processed)
+    reconciler._conn().execute(
+        "UPDATE reconcile_state SET owner_pid = ?, lease_until = ?", ("1:1", time.time() + 60)
+    )
+
+    assert reconciler.run_pass() is None
+    reconciler._conn().execute("UPDATE reconcile_state SET lease_until = ?", (time.time() - 1,))
+    assert reconciler.run_pass()["complete"]
+    # Released after the pass
+    owner = reconciler._conn().execute("SELECT owner_pid FROM reconcile_state").fetchone()[0]
+    assert owner is None
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from http_clients import AsyncPooledClient, PooledClient
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, bounded_timeout, clear_deadline, start_deadline
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("stub", failure_threshold=2, reset_timeout=0.05)
+
+
+def trip(breaker):
+    breaker.record(False)
+    breaker.record(False)
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    breaker.before_call()
+
+    breaker.record(False)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.snapshot()["times_opened"] == 1
+
+
+def test_half_open_lets_one_probe_through(breaker):
+    trip(breaker)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True)
+    assert breaker.snapshot()["state"] == "closed"
+
+
+def test_failed_probe_reopens(breaker):
+    trip(breaker)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record(False)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.snapshot()["state"] == "open"
+
+
+def test_probe_that_raises_outside_the_http_layer_is_released(stub, breaker):
+    client = PooledClient("stub", stub.base_url, breaker=breaker)
+    trip(breaker)
+    time.sleep(0.06)
+
+    with pytest.raises(TypeError):
+        # Not JSON-serialisable: fails while encoding the body, before any request is made
+        client.post("/v1/activities", json={"when": object()})
+
+    # The next call is let through as the probe instead of the breaker staying half-open forever
+    assert client.get("/v1/persons/1").status_code == 200
+    assert breaker.snapshot()["state"] == "closed"
+
+
+def test_cancelled_async_probe_is_released(stub, breaker):
+    pytest.importorskip("httpx")
+
+    async def scenario():
+        client = AsyncPooledClient("stub", stub.base_url, breaker=breaker)
+        trip(breaker)
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(client.get("/v1/persons/1"))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        response = await client.get("/v1/persons/1")
+        await client.aclose()
+        return response.status_code
+
+    assert asyncio.run(scenario()) == 200
+
+
+def test_connection_errors_count_as_failures(breaker):
+    client = PooledClient("closed-port", "http://127.0.0.1:9", timeout=(0.5, 0.5), breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.get("/")
+
+    with pytest.raises(CircuitOpenError):
+        client.get("/")
+
+
+def test_timeouts_are_capped_by_the_deadline():
+    start_deadline(1)
+    try:
+        connect, read = bounded_timeout((3.05, 20), "call")
+        assert connect <= 1 and read <= 1
+        start_deadline(-1)
+        with pytest.raises(DeadlineExceeded):
+            bounded_timeout((3.05, 20), "call")
+    finally:
+        clear_deadline()
+    assert bounded_timeout((3.05, 20), "call") == (3.05, 20)
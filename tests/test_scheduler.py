@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+import requests
+
+from process_owner import owner_token
+from resilience import track_send
+from scheduler import SendScheduler
+
+
+def make_scheduler(path, fire, **kwargs):
+    return SendScheduler(str(path), fire, **{"rate": 1000, "poll_interval": 0.05, "batch_size": 5, **kwargs})
+
+
+@pytest.fixture
+def fired():
+    counts, lock = Counter(), threading.Lock()
+
+    def fire(send):
+        with lock:
+            counts[send["id"]] += 1
+        return "sent", None
+
+    fire.counts = counts
+    return fire
+
+
+def test_concurrent_schedulers_fire_each_send_once(tmp_path, fired):
+    path = tmp_path / "schedule.db"
+    schedulers = [make_scheduler(path, fired) for _ in range(3)]
+    ids = [schedulers[0].schedule("24hrs", due_at=time.time() - 1, key=f"k{i}")[0] for i in range(40)]
+
+    threads = [threading.Thread(target=s.run_due) for s in schedulers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert sorted(fired.counts) == sorted(ids)
+    assert set(fired.counts.values()) == {1}
+    assert schedulers[0].stats()["sent"] == 40
+
+
+def test_schedule_key_is_idempotent(tmp_path, fired):
+    scheduler = make_scheduler(tmp_path / "schedule.db", fired)
+    first = scheduler.schedule("24hrs", delay_seconds=60, key="same")
+    assert scheduler.schedule("24hrs", delay_seconds=60, key="same") == (first[0], False)
+
+
+def test_send_caught_firing_is_never_refired(tmp_path, fired):
+    path = tmp_path / "schedule.db"
+    scheduler = make_scheduler(path, fired)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+    scheduler.claim_due()
+    # The process died mid-send: still 'firing', lease long gone
+    scheduler._set(send_id, status="firing", lease_until=time.time() - 1)
+
+    restarted = make_scheduler(path, fired)
+    assert restarted.get(send_id)["status"] == "interrupted"
+    assert restarted.run_due() == 0
+    assert not fired.counts
+
+
+def test_claimed_sends_of_a_dead_owner_go_back_to_pending(tmp_path, fired):
+    path = tmp_path / "schedule.db"
+    scheduler = make_scheduler(path, fired)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+    scheduler.claim_due()
+    scheduler._set(send_id, owner_pid=owner_token(), lease_until=time.time() - 1)
+
+    restarted = make_scheduler(path, fired)
+    assert restarted.run_due() == 1
+    assert fired.counts[send_id] == 1
+
+
+def test_stop_releases_claimed_sends(tmp_path):
+    started = threading.Event()
+
+    def slow_fire(send):
+        started.set()
+        time.sleep(0.2)
+        return "sent", None
+
+    scheduler = make_scheduler(tmp_path / "schedule.db", slow_fire, batch_size=10)
+    for i in range(10):
+        scheduler.schedule("24hrs", due_at=time.time() - 1)
+    scheduler.start()
+    assert started.wait(5)
+
+    assert scheduler.stop(5)
+    stats = scheduler.stats()
+    assert stats["sent"] == 1
+    assert stats["pending"] == 9
+
+
+def test_follow_up_waits_for_its_template(tmp_path, fired):
+    scheduler = make_scheduler(tmp_path / "schedule.db", fired)
+    send_id, _ = scheduler.schedule("quote_followup", after_template="quote_amount", delay_seconds=0, person_id=7)
+
+    assert scheduler.run_due() == 0
+    assert scheduler.template_sent(7, "quote_amount") == 1
+    assert scheduler.run_due() == 1
+    assert scheduler.get(send_id)["status"] == "sent"
+
+
+def test_claim_recovered_by_another_process_is_not_fired(tmp_path, fired):
+    scheduler = make_scheduler(tmp_path / "schedule.db", fired)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+    send = scheduler.claim_due()[0]
+    # The lease ran out while this process waited on the pacer; another process took the send over
+    scheduler._set(send_id, owner_pid="1:1")
+
+    assert scheduler._fire_one(send) == "lost"
+    assert not fired.counts
+    assert scheduler.get(send_id)["status"] == "claimed"
+
+
+def test_firing_renews_the_lease(tmp_path):
+    leases = []
+
+    def fire(send):
+        leases.append(scheduler._conn().execute(
+            "SELECT lease_until FROM scheduled_sends WHERE id = ?", (send["id"],)).fetchone()[0])
+        return "sent", None
+
+    scheduler = make_scheduler(tmp_path / "schedule.db", fire)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+    send = scheduler.claim_due()[0]
+    scheduler._set(send_id, lease_until=time.time() + 1)
+
+    assert scheduler._fire_one(send) == "fired"
+    assert leases[0] > time.time() + scheduler.lease_seconds - 5
+
+
+def test_exception_before_the_send_left_is_retried(tmp_path):
+    def fire(send):
+        raise requests.ConnectTimeout("connect timed out")
+
+    scheduler = make_scheduler(tmp_path / "schedule.db", fire)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+
+    assert scheduler.run_due() == 1
+    assert scheduler.get(send_id)["status"] == "pending"
+
+
+def test_exception_after_the_send_may_have_left_fails_it(tmp_path):
+    def fire(send):
+        # The client marks its own scope; the scheduler sees it through the nested track_send
+        with track_send() as attempt:
+            attempt.may_have_sent = True
+            raise requests.ReadTimeout("read timed out")
+
+    scheduler = make_scheduler(tmp_path / "schedule.db", fire)
+    send_id, _ = scheduler.schedule("24hrs", due_at=time.time() - 1)
+
+    assert scheduler.run_due() == 1
+    assert scheduler.get(send_id)["status"] == "failed"
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from sender_pool import SenderPool
+
+NUMBERS = ["+447700000001", "+447700000002", "+447700000003"]
+RECIPIENTS = [f"+4477009{i:05d}" for i in range(300)]
+
+
+@pytest.fixture
+def pool():
+    return SenderPool(NUMBERS, failure_threshold=2, cooldown=0.1, window=60)
+
+
+def test_recipients_stick_to_one_sender_and_spread_across_the_pool(pool):
+    homes = {r: pool.sender_for(r) for r in RECIPIENTS}
+
+    assert all(pool.sender_for(r) == homes[r] for r in RECIPIENTS)
+    assert set(homes.values()) == set(NUMBERS)
+    assert min(list(homes.values()).count(n) for n in NUMBERS) > len(RECIPIENTS) / 6
+
+
+def test_adding_a_sender_only_moves_recipients_onto_it(pool):
+    before = {r: pool.sender_for(r) for r in RECIPIENTS}
+    grown = SenderPool(NUMBERS + ["+447700000004"])
+
+    moved = {r: grown.sender_for(r) for r in RECIPIENTS if grown.sender_for(r) != before[r]}
+
+    assert moved and set(moved.values()) == {"+447700000004"}
+
+
+def test_sender_rejection_fails_over_and_cools_down(pool):
+    recipient = RECIPIENTS[0]
+    home = pool.sender_for(recipient)
+
+    # 63018 is the sender's rate limit: safe to retry from another number
+    assert pool.record(home, 400, 63018)
+    assert pool.record(home, 429)
+
+    route = pool.route(recipient)
+    assert route[0] != home and route[-1] == home
+    assert not pool.stats()[home]["healthy"]
+    time.sleep(0.11)
+    assert pool.sender_for(recipient) == home
+
+
+def test_recipient_errors_do_not_count_against_the_sender(pool):
+    home = pool.sender_for(RECIPIENTS[0])
+    for _ in range(5):
+        assert not pool.record(home, 400, 21211)  # invalid To number
+    assert pool.stats()[home]["healthy"]
+
+
+def test_server_errors_count_but_do_not_fail_over(pool):
+    home = pool.sender_for(RECIPIENTS[0])
+    assert not pool.record(home, 503)
+    assert not pool.record(home, 503)
+    assert not pool.stats()[home]["healthy"]
+
+
+def test_success_resets_the_failure_streak(pool):
+    home = pool.sender_for(RECIPIENTS[0])
+    pool.record(home, 503)
+    pool.record(home, 201)
+    pool.record(home, 503)
+    assert pool.stats()[home]["healthy"]
+
+
+def test_callback_failures_put_the_sender_on_cooldown(pool):
+    home = pool.sender_for(RECIPIENTS[0])
+    assert not pool.record_delivery_failure(home, "63112")
+    assert not pool.record_delivery_failure(home, "30008")  # unknown error, not the sender's
+    assert pool.record_delivery_failure(home, 63112)
+    assert not pool.stats()[home]["healthy"]
+
+
+def test_empty_pool_routes_nowhere():
+    pool = SenderPool(["", " "])
+    assert pool.route("+447700900001") == []
+    assert pool.sender_for("+447700900001") is None
+
+
+def test_status_callback_feeds_the_sender_pool(app_module, monkeypatch):
+    pool = SenderPool(["+447700000000"], failure_threshold=1)
+    monkeypatch.setattr(app_module, "sender_pool", pool)
+
+    app_module.record_sender_callback({"MessageStatus": "undelivered", "ErrorCode": "63018",
+                                       "From": "whatsapp:+447700000000"})
+
+    assert not pool.stats()["+447700000000"]["healthy"]
@@ -0,0 +1,92 @@
+import io
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+from structured_logging import AsyncBatchHandler, Redactor, SamplingFilter, bind, reset_context
+
+
+@pytest.fixture
+def captured():
+    """A logger writing JSON lines to a StringIO; lines(n) waits for the writer thread to emit n."""
+    stream = io.StringIO()
+    handler = AsyncBatchHandler(stream=stream, redactor=Redactor(["sk-live-secret"]), flush_interval=0.01)
+    logger = logging.getLogger("test.structured")
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def lines(count):
+        deadline = time.time() + 5
+        while len(stream.getvalue().splitlines()) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    logger.lines = lines
+    logger.handler = handler
+    yield logger
+    reset_context()
+
+
+def test_secrets_are_redacted():
+    redact = Redactor(["sk-live-secret", "short"])
+    text = redact("GET /v1/persons?api_token=abc123&limit=5 with sk-live-secret, short")
+    assert text == "GET /v1/persons?api_token=[REDACTED]&limit=5 with [REDACTED], short"
+
+
+def test_records_carry_the_request_context(captured):
+    reset_context(request_id="r1", route="/pipedrive-webhook")
+    bind(person_id=7)
+
+    captured.info("Sent %s", "24hrs", extra={"template": "24hrs"})
+
+    [line] = captured.lines(1)
+    assert line["msg"] == "Sent 24hrs"
+    assert (line["request_id"], line["person_id"], line["template"]) == ("r1", 7, "24hrs")
+    assert line["level"] == "info"
+
+
+def test_formatted_lines_are_redacted(captured):
+    captured.info("Calling https://api.pipedrive.com/v1/persons/1?api_token=sk-live-secret")
+    assert "sk-live-secret" not in json.dumps(captured.lines(1))
+
+
+def test_noisy_routes_are_sampled_but_warnings_kept(captured):
+    captured.handler.addFilter(SamplingFilter({"/health": 3}))
+    reset_context(route="/health")
+    for _ in range(6):
+        captured.info("Health endpoint hit")
+    captured.warning("Slow health check")
+    reset_context(route="/pipedrive-webhook")
+    captured.info("Webhook")
+
+    msgs = [line["msg"] for line in captured.lines(4)]
+    assert msgs == ["Health endpoint hit", "Health endpoint hit", "Slow health check", "Webhook"]
+
+
+class BlockedStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    stream = BlockedStream()
+    handler = AsyncBatchHandler(stream=stream, maxsize=1, flush_interval=0.01)
+    handler.handle(logging.makeLogRecord({"msg": "writing"}))
+    while not handler._queue.empty():
+        time.sleep(0.01)
+
+    # The writer is stuck on the stream: one record fits in the queue, the next is dropped
+    handler.handle(logging.makeLogRecord({"msg": "queued"}))
+    handler.handle(logging.makeLogRecord({"msg": "dropped"}))
+    stream.release.set()
+
+    assert handler.dropped == 1
@@ -0,0 +1,70 @@
+import pytest
+
+from template_registry import (
+    TemplateVariableError, build_registry, find_triggered, parse_quote_request, parse_referral_amount,
+    parse_sar_details, parse_split_two, split_pair_to_vars,
+)
+
+FIELD_MAP = {"payment_released": "f1", "24hrs": "f2", "quote": "f3", "tips": "f4"}
+CONTENT_MAP = {"payment_released": "HX1", "24hrs": "HX2", "tips": "HX4"}
+
+
+@pytest.fixture
+def index():
+    return build_registry(CONTENT_MAP, FIELD_MAP)
+
+
+def test_registry_maps_fields_to_their_template(index):
+    assert index["f2"].name == "24hrs"
+    assert index["f2"].content_sid == "HX2"
+    assert index["f3"].action == "quote"
+    assert index["f1"].parser("  Jane  ") == {"1": "  Jane  "}
+    assert [spec.position for spec in index.values()] == [0, 1, 2, 3]
+
+
+def test_only_fields_that_went_from_empty_to_set_trigger(index):
+    current = {"f1": {"value": "a"}, "f2": {"value": "b"}, "f4": {"value": "SARGBP"}, "other": {"value": "x"}}
+    previous = {"f1": None, "f2": {"value": "old"}, "f4": {"value": ""}, "other": None}
+
+    triggered = find_triggered(current, previous, index)
+
+    assert [(spec.name, value) for spec, value in triggered] == [("payment_released", "a"), ("tips", "SARGBP")]
+
+
+def test_only_changed_fields_are_visited(index):
+    # v2 'previous' lists just the changed fields; f2 is set but didn't change in this event
+    current = {"f1": {"value": "a"}, "f2": {"value": "b"}}
+    assert [spec.name for spec, _ in find_triggered(current, {"f1": None}, index)] == ["payment_released"]
+
+
+def test_without_previous_every_set_field_triggers_in_registry_order(index):
+    current = {"f4": {"value": "SARGBP"}, "f1": {"value": "a"}, "f2": {"value": ""}}
+    assert [spec.name for spec, _ in find_triggered(current, None, index)] == ["payment_released", "tips"]
+
+
+def test_clear_echo_triggers_nothing(index):
+    assert find_triggered({"f1": {"value": ""}}, {"f1": {"value": "a"}}, index) == []
+
+
+@pytest.mark.parametrize("parser, value, expected", [
+    (parse_split_two, " Jane  Doe Smith ", {"1": "Jane", "2": " Doe Smith"}),
+    (split_pair_to_vars, "sar/gbp", {"1": "SAR", "2": "GBP", "3": "SAR"}),
+    (parse_sar_details, "Nick Nick Cornford GB95SPPV23188420383356",
+     {"1": "Nick", "2": "Nick Cornford", "3": "GB95SPPV23188420383356"}),
+    (parse_referral_amount, "£30,001.29 gbp 9", {"1": "30001.29", "2": "GBP", "3": "9"}),
+    (parse_quote_request, "GBPEUR buy £1,000", {"pair": "GBPEUR", "direction": "buy", "amount": 1000.0}),
+])
+def test_parsers(parser, value, expected):
+    assert parser(value) == expected
+
+
+@pytest.mark.parametrize("parser, value", [
+    (split_pair_to_vars, "SAR"),
+    (parse_sar_details, "Nick GB95"),
+    (parse_referral_amount, "lots GBP 9"),
+    (parse_referral_amount, "100 GBP nine"),
+    (parse_quote_request, "GBPEUR buy"),
+])
+def test_parsers_reject_bad_values(parser, value):
+    with pytest.raises(TemplateVariableError):
+        parser(value)
@@ -0,0 +1,122 @@
+import contextvars
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+from structured_logging import bind, reset_context
+
+
+@pytest.fixture
+def in_context():
+    """Runs fn in a fresh context, so a trace started by a test doesn't leak into the next."""
+    def run(fn, *args):
+        return contextvars.copy_context().run(fn, *args)
+
+    return run
+
+
+def test_spans_nest_under_the_current_span(in_context):
+    def scenario():
+        tracer = tracing.Tracer("test", slow_ms=10_000)
+        trace = tracer.start("POST /pipedrive-webhook")
+        reset_context(person_id=7)
+        with tracing.span("template", template="24hrs") as outer:
+            tracing.record_call("twilio_send", 0.01, 201)
+        tracer.finish(status_code=200)
+        return trace, outer
+
+    trace, outer = in_context(scenario)
+    spans = {span["name"]: span for span in trace.summary()["spans"]}
+
+    assert spans["template"]["parent_id"] == trace.root["span_id"]
+    assert spans["twilio_send"]["parent_id"] == outer["span_id"]
+    # Tags come from the log context, so calls inside a template are attributed to its person
+    assert spans["template"]["attributes"] == {"person_id": 7, "template": "24hrs"}
+    assert spans["twilio_send"]["attributes"] == {"person_id": 7, "http.status_code": 201}
+
+
+def test_fan_out_threads_report_into_the_request_trace(in_context):
+    def scenario():
+        tracer = tracing.Tracer("test")
+        trace = tracer.start("POST /pipedrive-webhook")
+        with ThreadPoolExecutor(2) as pool:
+            contexts = [contextvars.copy_context() for _ in range(2)]
+            list(pool.map(lambda ctx: ctx.run(tracing.record_call, "twilio_send", 0.02, 201), contexts))
+        return trace
+
+    trace = in_context(scenario)
+    assert [span["name"] for span in trace.spans].count("twilio_send") == 2
+
+
+def test_server_timing_sums_repeated_calls(in_context):
+    def scenario():
+        tracer = tracing.Tracer("test")
+        trace = tracer.start("GET /")
+        tracing.record_call("pipedrive_person_get", 0.010, 200)
+        tracing.record_call("twilio_send", 0.020, 201)
+        tracing.record_call("twilio_send", 0.020, 201)
+        tracer.finish(status_code=200)
+        return trace.server_timing()
+
+    timing = in_context(scenario)
+    assert re.fullmatch(r'twilio_send;dur=4\d\.\d;desc="x2", pipedrive_person_get;dur=1\d\.\d, total;dur=[\d.]+', timing)
+
+
+def test_slow_traces_are_kept_and_failures_marked(in_context):
+    tracer = tracing.Tracer("test", slow_ms=5, ring_size=2)
+
+    def request(name, seconds, status):
+        trace = tracer.start(name)
+        time.sleep(seconds)
+        tracer.finish(status_code=status)
+        return trace
+
+    fast = in_context(request, "GET /fast", 0, 200)
+    slow = in_context(request, "GET /slow", 0.01, 502)
+
+    assert [t["name"] for t in tracer.slowest()] == ["GET /slow"]
+    assert tracer.find(fast.trace_id) is None
+    assert slow.root["error"]
+
+
+def test_spans_are_no_ops_outside_a_trace(in_context):
+    def scenario():
+        with tracing.span("template") as record:
+            tracing.record_call("twilio_send", 0.01, 201)
+        return record
+
+    assert in_context(scenario) is None
+
+
+def test_finished_traces_export_as_otlp_json(in_context, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = tracing.Tracer("webhook", export_path=str(path))
+
+    def scenario():
+        reset_context()
+        tracer.start("GET /")
+        bind(person_id=7)
+        tracing.record_call("twilio_send", 0.01, 201)
+        tracer.finish(status_code=200)
+
+    in_context(scenario)
+    tracer.drain()
+    deadline = time.time() + 5
+    while not (path.exists() and path.read_text().endswith("\n")) and time.time() < deadline:
+        time.sleep(0.01)
+
+    [line] = path.read_text().splitlines()
+    resource = json.loads(line)["resourceSpans"][0]
+    spans = resource["scopeSpans"][0]["spans"]
+    assert resource["resource"]["attributes"][0]["value"]["stringValue"] == "webhook"
+    assert {span["name"] for span in spans} == {"GET /", "twilio_send"}
+    assert {"key": "person_id", "value": {"stringValue": "7"}} in spans[0]["attributes"]
+
+
+def test_responses_carry_server_timing(app_module):
+    response = app_module.app.test_client().get("/")
+    assert response.headers["Server-Timing"].startswith("total;dur=")
@@ -0,0 +1,80 @@
+from urllib.parse import parse_qs
+
+import pytest
+
+from vcard_links import VCardLinks
+
+NOW = 1_800_000_000
+
+
+def args(query):
+    return {key: values[0] for key, values in parse_qs(query).items()}
+
+
+@pytest.fixture
+def links():
+    return VCardLinks("signing-key", ttl=3600)
+
+
+def test_signed_link_verifies_until_it_expires(links):
+    signed = args(links.query(7, "abc", now=NOW))
+
+    assert links.verify(7, signed, now=NOW + 3599)
+    assert not links.verify(7, signed, now=NOW + 3601)
+
+
+@pytest.mark.parametrize("tamper", [
+    {"v": "other"},
+    {"exp": str(NOW + 99999)},
+    {"sig": "0" * 64},
+    {"sig": ""},
+    {"exp": "soon"},
+])
+def test_tampered_link_is_rejected(links, tamper):
+    signed = {**args(links.query(7, "abc", now=NOW)), **tamper}
+    assert not links.verify(7, signed, now=NOW)
+
+
+def test_link_is_bound_to_its_person_and_key(links):
+    signed = args(links.query(7, "abc", now=NOW))
+    assert not links.verify(8, signed, now=NOW)
+    assert not VCardLinks("other-key", ttl=3600).verify(7, signed, now=NOW)
+
+
+def test_render_reuses_the_card_for_unchanged_content(links):
+    first = links.render(7, {"name": "A"}, lambda person: f"FN:{person['name']}")
+    again = links.render(7, {"name": "A"}, lambda person: f"FN:{person['name']}")
+    changed = links.render(7, {"name": "B"}, lambda person: f"FN:{person['name']}")
+
+    assert again is first
+    assert changed.version != first.version
+    assert links.cached(7, first.version) is first
+    assert links.cached(7, None) is None
+
+
+@pytest.fixture
+def signed_vcard(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.vcard_links, "key", "signing-key")
+    client = app_module.app.test_client()
+
+    def get(person_id, **headers):
+        rendered = app_module.vcard_links.render(person_id, app_module.fetch_person(person_id), app_module.build_vcard)
+        query = app_module.vcard_links.query(person_id, rendered.version)
+        return client.get(f"/vcard/{person_id}?{query}", headers=headers)
+
+    get.client = client
+    return get
+
+
+def test_vcard_route_serves_an_etag_and_answers_304(signed_vcard):
+    response = signed_vcard(41)
+    assert response.status_code == 200
+    assert response.mimetype == "text/vcard"
+    assert response.headers["ETag"]
+
+    assert signed_vcard(41, **{"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_vcard_route_rejects_unsigned_links(signed_vcard):
+    assert signed_vcard.client.get("/vcard/41").status_code == 403
+    assert signed_vcard.client.get("/vcard/41?token=anything").status_code == 403
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import pytest
+
+from process_owner import owner_alive, owner_token
+from work_queue import DurableQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = DurableQueue(str(tmp_path / "queue.db"), workers=1, poll_interval=0.05, recover_interval=0.1)
+    yield q
+    q.stop(2)
+
+
+def set_owner(queue, job_id, owner, lease_until=None):
+    queue._conn().execute(
+        "UPDATE jobs SET owner_pid = ?, lease_until = ? WHERE id = ?",
+        (owner, lease_until or time.time() + 300, job_id),
+    )
+
+
+needs_proc = pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="start times come from /proc")
+
+
+def test_owner_token_is_alive_for_this_process():
+    assert owner_alive(owner_token())
+    assert owner_alive(str(os.getpid()))
+    assert not owner_alive(None)
+
+
+@needs_proc
+def test_owner_token_tells_a_reused_pid_apart():
+    # Same PID, different start time: an earlier process (e.g. before a container restart)
+    assert not owner_alive(f"{os.getpid()}:1")
+
+
+def test_jobs_of_a_key_run_in_order(queue):
+    for i in range(3):
+        queue.enqueue("person-1", {"n": i})
+    queue.enqueue("person-2", {"n": 9})
+
+    first = queue.claim()
+    assert first["payload"] == {"n": 0}
+    # person-1 has a job running, so its next one waits
+    assert queue.claim()["payload"] == {"n": 9}
+    assert queue.claim() is None
+    queue.complete(first["id"])
+    assert queue.claim()["payload"] == {"n": 1}
+
+
+@needs_proc
+def test_recover_requeues_jobs_of_a_dead_owner(queue):
+    queue.enqueue("k", {})
+    job = queue.claim()
+    set_owner(queue, job["id"], f"{os.getpid()}:1")
+
+    assert queue.recover() == 1
+
+
+def test_recover_requeues_expired_leases_and_keeps_live_ones(queue):
+    queue.enqueue("a", {})
+    queue.enqueue("b", {})
+    expired, live = queue.claim(), queue.claim()
+    set_owner(queue, expired["id"], owner_token(), lease_until=time.time() - 1)
+    set_owner(queue, live["id"], owner_token())
+
+    assert queue.recover() == 1
+    assert queue.stats() == {"pending": 1, "running": 1, "failed": 0}
+
+
+def test_running_workers_pick_up_orphaned_jobs(queue):
+    queue.enqueue("k", {"n": 1})
+    job = queue.claim()
+    set_owner(queue, job["id"], owner_token(), lease_until=time.time() - 1)
+    done = threading.Event()
+
+    queue.start(lambda payload: done.set())
+
+    # Orphaned after startup: found by the periodic recover, not only at construction
+    assert done.wait(5)
+
+
+def test_failed_jobs_back_off_then_park(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"), workers=0, max_attempts=2)
+    queue.enqueue("k", {})
+
+    queue.fail(queue.claim(), "first")
+    assert queue.claim() is None
+    queue._conn().execute("UPDATE jobs SET available_at = 0")
+    queue.fail(queue.claim(), "second")
+
+    assert queue.stats() == {"pending": 0, "running": 0, "failed": 1}
@@ -0,0 +1,122 @@
+import pytest
+import requests
+
+from resilience import current_send_attempt
+from write_coalescer import PipedriveWriteCoalescer, merge_activities
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakePipedrive:
+    """Records writes; `fail` holds (exception or status, before_send) answers for the next calls."""
+
+    def __init__(self):
+        self.writes = []
+        self.fail = []
+
+    def request(self, method, path, call=None, creates=False, json=None):
+        answer, before_send = self.fail.pop(0) if self.fail else (201, False)
+        if creates and not before_send:
+            current_send_attempt().may_have_sent = True
+        self.writes.append((method, path, json))
+        if isinstance(answer, Exception):
+            raise answer
+        return Response(answer)
+
+
+@pytest.fixture
+def client():
+    return FakePipedrive()
+
+
+@pytest.fixture
+def coalescer(client):
+    writes = PipedriveWriteCoalescer(client, flush_interval=3600)
+    yield writes
+    writes._stop.set()
+
+
+def activity(person_id, template):
+    return {"person_id": person_id, "subject": f"WhatsApp Message Sent: {template}", "note": f"{template} body"}
+
+
+def due_now(coalescer):
+    for pending in (coalescer._clears, coalescer._activities):
+        for entry in pending.values():
+            entry["not_before"] = 0
+
+
+def test_clears_for_a_person_become_one_put(coalescer, client):
+    coalescer.clear_field(7, "a")
+    coalescer.clear_field(7, "b")
+    coalescer.clear_field(8, "a")
+
+    coalescer.flush()
+
+    puts = sorted((path, sorted(body)) for _, path, body in client.writes)
+    assert puts == [("/v1/persons/7", ["a", "b"]), ("/v1/persons/8", ["a"])]
+
+
+def test_activities_stay_separate_by_default(coalescer, client):
+    coalescer.add_activity(activity(7, "24hrs"))
+    coalescer.add_activity(activity(7, "payment_released"))
+
+    coalescer.flush()
+
+    assert len(client.writes) == 2
+
+
+def test_merged_activities_are_opt_in(client):
+    coalescer = PipedriveWriteCoalescer(client, flush_interval=3600, merge_person_activities=True)
+    coalescer.add_activity(activity(7, "24hrs"))
+    coalescer.add_activity(activity(7, "payment_released"))
+
+    coalescer.flush()
+    coalescer._stop.set()
+
+    assert [body["subject"] for _, _, body in client.writes] == ["WhatsApp Messages Sent: 24hrs, payment_released"]
+
+
+def test_merge_activities_keeps_each_note():
+    merged = merge_activities([activity(7, "a"), activity(7, "b")])
+    assert merged["note"] == "a\na body\n\n---\n\nb\nb body"
+
+
+def test_failed_clear_is_retried_merged_with_later_clears(coalescer, client):
+    client.fail = [(503, False)]
+    coalescer.clear_field(7, "a")
+    coalescer.flush()
+    coalescer.clear_field(7, "b")
+    due_now(coalescer)
+
+    coalescer.flush()
+
+    assert sorted(client.writes[-1][2]) == ["a", "b"]
+    assert coalescer.stats()["retries"] == 1
+
+
+def test_activity_that_never_connected_is_retried(coalescer, client):
+    client.fail = [(requests.ConnectionError("refused"), True)]
+    coalescer.add_activity(activity(7, "24hrs"))
+    coalescer.flush()
+    due_now(coalescer)
+
+    coalescer.flush()
+
+    assert len(client.writes) == 2
+    assert coalescer.stats()["pending_activities"] == 0
+
+
+@pytest.mark.parametrize("answer", [requests.ReadTimeout("read timed out"), 502])
+def test_activity_that_may_exist_is_not_retried(coalescer, client, answer):
+    client.fail = [(answer, False)]
+    coalescer.add_activity(activity(7, "24hrs"))
+
+    coalescer.flush()
+
+    assert len(client.writes) == 1
+    assert coalescer.stats()["pending_activities"] == 0
+    assert coalescer.stats()["dropped"] == 1
@@ -0,0 +1,250 @@
+"""
+Lightweight per-request tracing.
+
+A trace is started per inbound request and carried in a ContextVar, so spans
+from fan-out threads and tasks (which copy the context) land in the same trace.
+The handler is the root span; template sends and every outbound call are child
+spans, tagged with the template and person_id from the log context. A finished
+trace yields a Server-Timing header, is kept in a ring buffer if it was slow,
+and can be appended to a file as OTLP/JSON (one ExportTraceServiceRequest per
+line) by a background writer.
+"""
+import atexit
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import json_codec
+from structured_logging import current_context
+
+log = logging.getLogger("webhook.tracing")
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("trace_parent", default=None)
+
+# Log-context fields copied onto spans as attributes
+SPAN_TAGS = ("template", "person_id", "kind", "send_id")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+class Trace:
+    def __init__(self, name, attributes):
+        self.trace_id = _new_id(16)
+        self.root = {
+            "name": name, "span_id": _new_id(8), "parent_id": None, "kind": SPAN_KIND_SERVER,
+            "start_ns": time.time_ns(), "end_ns": None, "attributes": dict(attributes), "error": False,
+        }
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def duration_ms(self):
+        end = self.root["end_ns"] or time.time_ns()
+        return (end - self.root["start_ns"]) / 1e6
+
+    def server_timing(self):
+        """Server-Timing value: outbound time per call (summed over repeats) and the handler total."""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                if span["kind"] == SPAN_KIND_CLIENT and span["end_ns"]:
+                    total, count = totals.get(span["name"], (0.0, 0))
+                    totals[span["name"]] = (total + (span["end_ns"] - span["start_ns"]) / 1e6, count + 1)
+        parts = [
+            f'{name};dur={total:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+            for name, (total, count) in sorted(totals.items(), key=lambda item: -item[1][0])
+        ]
+        parts.append(f"total;dur={self.duration_ms:.1f}")
+        return ", ".join(parts)
+
+    def summary(self):
+        with self._lock:
+            spans = [
+                {
+                    "name": span["name"],
+                    "span_id": span["span_id"],
+                    "parent_id": span["parent_id"],
+                    "start_ms": round((span["start_ns"] - self.root["start_ns"]) / 1e6, 1),
+                    "duration_ms": round(((span["end_ns"] or time.time_ns()) - span["start_ns"]) / 1e6, 1),
+                    "attributes": span["attributes"],
+                    "error": span["error"],
+                }
+                for span in sorted(self.spans, key=lambda s: s["start_ns"])
+            ]
+        return {"trace_id": self.trace_id, "name": self.root["name"], "duration_ms": round(self.duration_ms, 1),
+                "spans": spans}
+
+    def otlp_spans(self):
+        def attributes(attrs):
+            return [{"key": k, "value": {"stringValue": str(v)}} for k, v in attrs.items() if v is not None]
+
+        with self._lock:
+            return [
+                {
+                    "traceId": self.trace_id,
+                    "spanId": span["span_id"],
+                    **({"parentSpanId": span["parent_id"]} if span["parent_id"] else {}),
+                    "name": span["name"],
+                    "kind": span["kind"],
+                    "startTimeUnixNano": str(span["start_ns"]),
+                    "endTimeUnixNano": str(span["end_ns"] or span["start_ns"]),
+                    "attributes": attributes(span["attributes"]),
+                    "status": {"code": 2 if span["error"] else 1},
+                }
+                for span in self.spans
+            ]
+
+
+def current_trace():
+    return _trace.get()
+
+
+def _tags(extra):
+    ctx = current_context()
+    return {**{k: ctx[k] for k in SPAN_TAGS if ctx.get(k) is not None}, **extra}
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Child span of whatever span is current; a no-op outside a trace."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    record = {
+        "name": name, "span_id": _new_id(8), "parent_id": _parent.get() or trace.root["span_id"], "kind": SPAN_KIND_INTERNAL,
+        "start_ns": time.time_ns(), "end_ns": None, "attributes": _tags(attributes), "error": False,
+    }
+    token = _parent.set(record["span_id"])
+    try:
+        yield record
+    except BaseException:
+        record["error"] = True
+        raise
+    finally:
+        _parent.reset(token)
+        record["end_ns"] = time.time_ns()
+        trace.add(record)
+
+
+def record_call(call, seconds, status):
+    """Adds a finished outbound call as a client span (called from the HTTP clients' observer)."""
+    trace = _trace.get()
+    if trace is None:
+        return
+    end = time.time_ns()
+    error = not isinstance(status, int) or status >= 500
+    trace.add({
+        "name": call, "span_id": _new_id(8), "parent_id": _parent.get() or trace.root["span_id"],
+        "kind": SPAN_KIND_CLIENT, "start_ns": end - int(seconds * 1e9), "end_ns": end,
+        "attributes": _tags({"http.status_code": status}), "error": error,
+    })
+
+
+class Tracer:
+    def __init__(self, service_name, slow_ms=250, ring_size=100, export_path=None):
+        self.service_name = service_name
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self._slowest = deque(maxlen=ring_size)
+        self._lock = threading.Lock()
+        self._export_queue = None
+        if export_path:
+            self._export_queue = queue.Queue(maxsize=10000)
+            threading.Thread(target=self._run_exporter, name="trace-exporter", daemon=True).start()
+            atexit.register(self.drain)
+
+    def start(self, name, **attributes):
+        trace = Trace(name, attributes)
+        _trace.set(trace)
+        _parent.set(None)
+        return trace
+
+    def finish(self, trace=None, status_code=None):
+        trace = trace or _trace.get()
+        if trace is None or trace.root["end_ns"]:
+            return trace
+        trace.root["end_ns"] = time.time_ns()
+        if current_context().get("person_id") is not None:
+            trace.root["attributes"]["person_id"] = current_context()["person_id"]
+        if status_code is not None:
+            trace.root["attributes"]["http.status_code"] = status_code
+            trace.root["error"] = status_code >= 500
+        if trace.duration_ms >= self.slow_ms:
+            with self._lock:
+                self._slowest.append(trace)
+        if self._export_queue is not None:
+            try:
+                self._export_queue.put_nowait(trace)
+            except queue.Full:
+                pass
+        return trace
+
+    def slowest(self, limit=20):
+        with self._lock:
+            traces = sorted(self._slowest, key=lambda t: t.duration_ms, reverse=True)
+        return [trace.summary() for trace in traces[:limit]]
+
+    def find(self, trace_id):
+        with self._lock:
+            for trace in self._slowest:
+                if trace.trace_id == trace_id:
+                    return trace.summary()
+        return None
+
+    def otlp_payload(self, traces):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "webhook.tracing"},
+                    "spans": [span for trace in traces for span in trace.otlp_spans()],
+                }],
+            }]
+        }
+
+    def _export(self, traces):
+        with open(self.export_path, "ab") as f:
+            f.write(json_codec.dumps_bytes(self.otlp_payload(traces)) + b"\n")
+
+    def _run_exporter(self):
+        while True:
+            batch = [self._export_queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+            except OSError as e:
+                log.warning("⚠️ Trace export failed: %s", e)
+
+    def drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._export_queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                self._export(batch)
+            except OSError:
+                pass
@@ -0,0 +1,59 @@
+"""
+Signed, expiring /vcard links and the rendered-vCard cache behind them.
+
+A link carries exp (unix time) and sig = HMAC-SHA256(key, "<person_id>:<exp>:<v>"),
+where v is the content hash of the card that was rendered when the link was
+made. Checking a link is a constant-time compare, with no I/O. The cache is
+keyed by (person_id, v), so Twilio's repeated media fetches of the same link are
+served from memory.
+"""
+import hashlib
+import hmac
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from cache import TTLCache
+
+RenderedVCard = namedtuple("RenderedVCard", ["body", "version", "last_modified"])
+
+
+def content_version(body):
+    return hashlib.sha256(body.encode()).hexdigest()[:16]
+
+
+def _signature(key, person_id, exp, version):
+    message = f"{person_id}:{exp}:{version}".encode()
+    return hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+
+
+class VCardLinks:
+    def __init__(self, key, ttl=86400, cache_size=500):
+        self.key = key
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    def render(self, person_id, person_data, build):
+        """Renders (or reuses) the card for person_data and caches it under its content hash."""
+        body = build(person_data)
+        version = content_version(body)
+        key = f"{person_id}:{version}"
+        rendered = self.cache.get(key)
+        if rendered is None:
+            rendered = RenderedVCard(body, version, time.time())
+            self.cache.set(key, rendered)
+        return rendered
+
+    def cached(self, person_id, version):
+        return self.cache.get(f"{person_id}:{version}") if version else None
+
+    def query(self, person_id, version, now=None):
+        exp = int((now or time.time()) + self.ttl)
+        return urlencode({"v": version, "exp": exp, "sig": _signature(self.key, person_id, exp, version)})
+
+    def verify(self, person_id, args, now=None):
+        """True when args (v, exp, sig) are a valid, unexpired signature for person_id."""
+        version, exp, sig = args.get("v", ""), args.get("exp", ""), args.get("sig", "")
+        if not sig or not exp.isdigit() or int(exp) < (now or time.time()):
+            return False
+        return hmac.compare_digest(sig, _signature(self.key, person_id, exp, version))
@@ -0,0 +1,194 @@
+import logging
+import sqlite3
+import threading
+import time
+
+import json_codec
+from process_owner import owner_alive, owner_token
+
+log = logging.getLogger("webhook.queue")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    owner_pid INTEGER,  -- process_owner token ("pid:start"), despite the name
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_id ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_key_status ON jobs (key, status, id);
+"""
+
+# Oldest runnable job whose key has nothing running and nothing older still waiting,
+# so jobs sharing a key (person_id) are processed strictly in arrival order.
+CLAIM_SQL = """
+SELECT id, key, payload, attempts FROM jobs AS j
+WHERE j.status = 'pending'
+  AND j.available_at <= ?
+  AND NOT EXISTS (SELECT 1 FROM jobs r WHERE r.key = j.key AND r.status = 'running')
+  AND NOT EXISTS (SELECT 1 FROM jobs e WHERE e.key = j.key AND e.status = 'pending' AND e.id < j.id)
+ORDER BY j.id
+LIMIT 1
+"""
+
+
+class DurableQueue:
+    """
+    SQLite-backed work queue shared by every worker process on the node.
+
+    Jobs survive restarts; a job left 'running' by a dead process (or past its
+    lease) goes back to 'pending', at startup and every recover_interval seconds
+    while idle. Failed jobs are retried with backoff up to max_attempts, then
+    parked as 'failed' for inspection.
+    """
+
+    def __init__(self, path, workers=4, lease_seconds=300, max_attempts=5, poll_interval=0.5, recover_interval=30):
+        self.path = path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.recover_interval = recover_interval
+        self._recovered_at = 0.0
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._handler = None
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self.recover()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, key, payload, delay=0):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO jobs (key, payload, available_at, created_at) VALUES (?, ?, ?, ?)",
+            (str(key), json_codec.dumps(payload), now + delay, now),
+        )
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def recover(self):
+        """Return jobs orphaned by dead workers or expired leases to the pending state."""
+        conn = self._conn()
+        now = time.time()
+        self._recovered_at = now
+        rows = conn.execute("SELECT id, owner_pid, lease_until FROM jobs WHERE status = 'running'").fetchall()
+        orphaned = [
+            job_id for job_id, owner, lease_until in rows
+            if (lease_until or 0) < now or not owner_alive(owner)
+        ]
+        for job_id in orphaned:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', owner_pid = NULL, lease_until = NULL WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+        if orphaned:
+            log.warning("♻️ Requeued orphaned jobs", extra={"jobs": len(orphaned)})
+            self._wakeup.set()
+        return len(orphaned)
+
+    def claim(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(CLAIM_SQL, (now,)).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner_pid = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (owner_token(), now + self.lease_seconds, row[0]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        job_id, key, payload, attempts = row
+        return {"id": job_id, "key": key, "payload": json_codec.loads(payload), "attempts": attempts + 1}
+
+    def complete(self, job_id):
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        # Finishing a job may unblock the next one for the same key
+        self._wakeup.set()
+
+    def fail(self, job, error):
+        if job["attempts"] >= self.max_attempts:
+            self._conn().execute(
+                "UPDATE jobs SET status = 'failed', last_error = ?, lease_until = NULL WHERE id = ?",
+                (error, job["id"]),
+            )
+        else:
+            backoff = min(2 ** job["attempts"], 300)
+            self._conn().execute(
+                "UPDATE jobs SET status = 'pending', last_error = ?, available_at = ?, owner_pid = NULL, lease_until = NULL WHERE id = ?",
+                (error, time.time() + backoff, job["id"]),
+            )
+        self._wakeup.set()
+
+    def stats(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"pending": 0, "running": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def start(self, handler):
+        """Start worker threads that pass each job's payload to handler(payload)."""
+        self._handler = handler
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"queue-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        """Stops claiming jobs and waits for running ones; returns False if any were still running at timeout."""
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        return not any(t.is_alive() for t in self._threads)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.OperationalError as e:
+                log.warning("⚠️ Queue claim failed: %s", e)
+                job = None
+
+            if not job:
+                # Another process (or container) may have died holding jobs since startup
+                if time.time() - self._recovered_at >= self.recover_interval:
+                    try:
+                        self.recover()
+                    except sqlite3.OperationalError as e:
+                        log.warning("⚠️ Queue recovery failed: %s", e)
+                # Other processes enqueue too, so fall back to polling
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._handler(job["payload"])
+                self.complete(job["id"])
+            except Exception as e:
+                log.exception("❌ Job failed", extra={"job_id": job["id"], "key": job["key"], "attempt": job["attempts"]})
+                self.fail(job, str(e))
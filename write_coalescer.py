@@ -0,0 +1,189 @@
+"""
+Write-behind for Pipedrive field clears and activity logging.
+
+Clears queued for the same person are merged into a single PUT, and activities
+are grouped into the same flush (optionally merged into one activity per
+person). A background thread flushes every flush_interval seconds, or as soon
+as max_batch writes are waiting. Failed writes (network errors, 429s, 5xx) are
+put back with backoff, merging with anything queued for that person since. An activity POST is only retried when it
+provably never reached Pipedrive (no connection, or a 4xx such as 429): after a
+read timeout or a 5xx the activity may exist, and a retry would log it twice.
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from resilience import track_send
+
+log = logging.getLogger("webhook.pipedrive_writes")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def merge_activities(payloads):
+    """Folds several activity payloads for one person into a single activity."""
+    if len(payloads) == 1:
+        return payloads[0]
+    names = [p["subject"].split(": ", 1)[-1] for p in payloads]
+    return {
+        **payloads[0],
+        "subject": f"WhatsApp Messages Sent: {', '.join(names)}",
+        "note": "\n\n---\n\n".join(f"{name}\n{p['note']}" for name, p in zip(names, payloads)),
+    }
+
+
+class PipedriveWriteCoalescer:
+    def __init__(self, client, flush_interval=0.5, max_batch=50, max_attempts=5, merge_person_activities=False,
+                 writers=4):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.merge_person_activities = merge_person_activities
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        # person_id -> {"fields": set, "attempts": n, "not_before": ts}
+        self._clears = {}
+        # person_id -> {"payloads": [...], "attempts": n, "not_before": ts}
+        self._activities = {}
+        self._stats = {"field_clears": 0, "puts": 0, "activities": 0, "activity_posts": 0, "retries": 0, "dropped": 0}
+        self._pool = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="pipedrive-writer")
+        self._thread = threading.Thread(target=self._run, name="pipedrive-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.drain)
+
+    def _pending(self):
+        return len(self._clears) + sum(len(a["payloads"]) for a in self._activities.values())
+
+    def clear_field(self, person_id, field_id):
+        with self._lock:
+            entry = self._clears.setdefault(str(person_id), {"fields": set(), "attempts": 0, "not_before": 0})
+            entry["fields"].add(field_id)
+            self._stats["field_clears"] += 1
+            full = self._pending() >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def add_activity(self, payload):
+        with self._lock:
+            entry = self._activities.setdefault(str(payload["person_id"]), {"payloads": [], "attempts": 0, "not_before": 0})
+            entry["payloads"].append(payload)
+            self._stats["activities"] += 1
+            full = self._pending() >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def _take_due(self, pending, force):
+        now = time.time()
+        due = {key: entry for key, entry in pending.items() if force or entry["not_before"] <= now}
+        for key in due:
+            del pending[key]
+        return due
+
+    def _requeue(self, pending, person_id, entry, merge_key, error):
+        attempts = entry["attempts"] + 1
+        if attempts >= self.max_attempts:
+            self._stats["dropped"] += 1
+            log.error("❌ Dropping Pipedrive write", extra={"person_id": person_id, "attempts": attempts, "error": error})
+            return
+        self._stats["retries"] += 1
+        delay = min(2 ** attempts, 60)
+        log.warning("⏳ Pipedrive write failed, retrying", extra={"person_id": person_id, "delay": delay, "error": error})
+        current = pending.setdefault(person_id, {merge_key: type(entry[merge_key])(), "attempts": 0, "not_before": 0})
+        if merge_key == "fields":
+            current["fields"] |= entry["fields"]
+        else:
+            current["payloads"][:0] = entry["payloads"]
+        current["attempts"] = max(current["attempts"], attempts)
+        current["not_before"] = time.time() + delay
+
+    def _write(self, method, path, call, payload, creates=False):
+        """
+        Returns (error, retryable); error is None on success. Never raises. With creates,
+        a write that may have reached Pipedrive is not retryable.
+        """
+        with track_send() as attempt:
+            try:
+                resp = self.client.request(method, path, call=call, creates=creates, json=payload)
+            except Exception as e:
+                return str(e), not attempt.may_have_sent
+        if resp.status_code < 300:
+            return None, False
+        return f"HTTP {resp.status_code}", resp.status_code in RETRYABLE_STATUS and not attempt.may_have_sent
+
+    def _flush_clear(self, person_id, entry):
+        error, retry = self._write("PUT", f"/v1/persons/{person_id}", "pipedrive_field_clear",
+                                   {field_id: "" for field_id in entry["fields"]})
+        with self._lock:
+            self._stats["puts"] += 1
+            if error and retry:
+                self._requeue(self._clears, person_id, entry, "fields", error)
+            elif error:
+                self._stats["dropped"] += 1
+                log.error("❌ Field clear rejected", extra={"person_id": person_id, "error": error})
+        if not error:
+            log.info("🧹 Cleared fields", extra={"person_id": person_id, "fields": len(entry["fields"])})
+
+    def _flush_activities(self, person_id, entry):
+        if self.merge_person_activities:
+            groups = [(merge_activities(entry["payloads"]), entry["payloads"])]
+        else:
+            groups = [(payload, [payload]) for payload in entry["payloads"]]
+
+        failed, last_error = [], None
+        for payload, originals in groups:
+            error, retry = self._write("POST", "/v1/activities", "pipedrive_activity_post", payload, creates=True)
+            with self._lock:
+                self._stats["activity_posts"] += 1
+                if error and not retry:
+                    self._stats["dropped"] += 1
+                    # Rejected, or possibly created (read timeout, 5xx): either way not retried
+                    log.error("❌ Activity write failed, not retrying", extra={"person_id": person_id, "error": error})
+            if error and retry:
+                failed.extend(originals)
+                last_error = error
+        if failed:
+            with self._lock:
+                self._requeue(self._activities, person_id, {**entry, "payloads": failed}, "payloads", last_error)
+
+    def flush(self, force=False):
+        with self._lock:
+            clears = self._take_due(self._clears, force)
+            activities = self._take_due(self._activities, force)
+        writes = [(self._flush_clear, pid, entry) for pid, entry in clears.items()]
+        writes += [(self._flush_activities, pid, entry) for pid, entry in activities.items()]
+        if force:
+            # At exit the executor no longer accepts work
+            for fn, pid, entry in writes:
+                fn(pid, entry)
+            return
+        for future in [self._pool.submit(fn, pid, entry) for fn, pid, entry in writes]:
+            future.result()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("❌ Pipedrive flush failed")
+
+    def drain(self):
+        """Final flush at exit, ignoring retry backoff."""
+        self._stop.set()
+        try:
+            self.flush(force=True)
+        except Exception:
+            log.exception("❌ Pipedrive drain failed")
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "pending_clears": sum(len(e["fields"]) for e in self._clears.values()),
+                "pending_activities": sum(len(e["payloads"]) for e in self._activities.values()),
+            }